@@ -0,0 +1,332 @@
+"""Benchmark per tahap pipeline pada raster sintetis.
+
+Contoh (dari root proyek):
+    python -m benchmarks.run_benchmarks run --sizes 1000 5000 --repeat 3
+    python -m benchmarks.run_benchmarks compare benchmarks/results/lama.json benchmarks/results/baru.json
+"""
+import os
+import gc
+import sys
+import json
+import shutil
+import argparse
+import platform
+import subprocess
+import statistics
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_VERSION = 1
+
+# Urutan tahap mengikuti pipeline Mode 1; setiap tahap memakai output tahap sebelumnya
+STAGES = [
+    "preprocess_rasters",
+    "classify_and_save",
+    "detect_change",
+    "compute_transition_matrix",
+    "train_model",
+    "predict_land_cover",
+    "generate_static_map",
+]
+
+def _paths(size_dir):
+    out = os.path.join(size_dir, "out")
+    return {
+        "raw": os.path.join(size_dir, "raw"),
+        "preprocessed": os.path.join(out, "preprocessed"),
+        "preprocess_cache": os.path.join(out, "preprocess_cache"),
+        "label_from": os.path.join(out, "classified", "label_from.tif"),
+        "label_to": os.path.join(out, "classified", "label_to.tif"),
+        "change_map": os.path.join(out, "change_map.tif"),
+        "change_stats": os.path.join(out, "change_stats.csv"),
+        "model": os.path.join(out, "model", "random_forest.pkl"),
+        "feature_store": os.path.join(out, "feature_store"),
+        "prediction": os.path.join(out, "prediction.tif"),
+        "static_png": os.path.join(out, "static", "peta_perubahan.png"),
+        "static_tif": os.path.join(out, "static", "peta_perubahan.tif"),
+        "boundary_masks": os.path.join(out, "boundary_masks"),
+    }
+
+def _reprojected(paths, name):
+    # Batas hasil reprojeksi dari preprocess_rasters (reproject_to_utm ke reprojected_temp/)
+    return os.path.join(paths["preprocessed"], "reprojected_temp", f"reprojected_{name}.shp")
+
+def _cropped(paths, name):
+    return os.path.join(paths["preprocessed"], f"{name}_clipped.tif")
+
+# --- Tahap: setup(paths, config) menyiapkan input (tidak diukur), run(paths, config, state) diukur ---
+
+def _setup_none(paths, config):
+    return None
+
+def _run_preprocess(paths, config, state):
+    # Opsi dari bagian preprocessing di config, seperti preprocess_options di main.py; cache pra-pemrosesan
+    # dikosongkan sebelum setiap pengulangan (lihat run_benchmarks) sehingga warp selalu diukur
+    from src.preprocessing import preprocess_rasters
+    preprocessing = config.get("preprocessing", {})
+    cache = preprocessing.get("cache", {})
+    preprocess_rasters({f"{name}_clipped.tif": os.path.join(paths["raw"], f"{name}.tif") for name in ("ndvi_from", "ndvi_to", "rgb")},
+                       os.path.join(paths["raw"], "boundary.shp"), paths["preprocessed"],
+                       cache_dir=paths["preprocess_cache"] if cache.get("enabled", True) else None,
+                       hash_contents=cache.get("hash_contents", False),
+                       block_size=config.get("processing", {}).get("block_size", 1024),
+                       resolution=preprocessing.get("grid", {}).get("resolution"),
+                       n_workers=preprocessing.get("n_workers", 1),
+                       executor=preprocessing.get("executor", "thread"),
+                       gdal_options=preprocessing.get("gdal", {}))
+
+def _run_classify(paths, config, state):
+    from src.ndvi_to_class import classify_and_save
+    os.makedirs(os.path.dirname(paths["label_from"]), exist_ok=True)
+    classify_and_save(_cropped(paths, "ndvi_from"), paths["label_from"])
+    classify_and_save(_cropped(paths, "ndvi_to"), paths["label_to"])
+
+def _run_detect_change(paths, config, state):
+    from src.change_detection import detect_change
+    detect_change(paths["label_from"], paths["label_to"], paths["change_map"], paths["change_stats"],
+                  block_size=config.get("processing", {}).get("block_size", 1024),
+                  boundary_path=_reprojected(paths, "boundary"))
+
+def _setup_transition_matrix(paths, config):
+    import rasterio
+    with rasterio.open(paths["label_from"]) as src_from, rasterio.open(paths["label_to"]) as src_to:
+        return src_from.read(1), src_to.read(1)
+
+def _run_transition_matrix(paths, config, state):
+    from src.analyze_change import compute_transition_matrix
+    compute_transition_matrix(*state)
+
+def _run_train(paths, config, state):
+    # Opsi training sama seperti task_train di main.py (sampling, deduplicate, feature_store, out_of_core);
+    # label tanggal akhir seperti di pipeline
+    from src.model import train_model
+    training = config.get("training", {})
+    feature_store = dict(training["feature_store"], dir=paths["feature_store"]) if training.get("feature_store") else None
+    os.makedirs(os.path.dirname(paths["model"]), exist_ok=True)
+    train_model(_cropped(paths, "rgb"), paths["label_to"], _reprojected(paths, "boundary"), os.path.dirname(paths["model"]),
+                compile_lut=training.get("compile_lut", False),
+                n_estimators=training.get("n_estimators", 100),
+                n_jobs=training.get("n_jobs"),
+                sampling=training.get("sampling"),
+                deduplicate=training.get("deduplicate", False),
+                derived_features=training.get("derived_features") or (),
+                feature_store=feature_store,
+                out_of_core=training.get("out_of_core"),
+                hash_contents=config.get("preprocessing", {}).get("cache", {}).get("hash_contents", False))
+
+def _run_predict(paths, config, state):
+    from src.predict import predict_land_cover
+    predict_land_cover(_cropped(paths, "rgb"), paths["model"], paths["prediction"],
+                       boundary_path=_reprojected(paths, "boundary"), **config.get("prediction", {}))
+
+def _run_static_map(paths, config, state):
+    from src.generate_static_map import generate_static_map
+    generate_static_map(paths["change_map"], paths["static_png"], paths["static_tif"],
+                        block_size=config.get("processing", {}).get("block_size", 1024))
+
+STAGE_FUNCTIONS = {
+    "preprocess_rasters": (_setup_none, _run_preprocess),
+    "classify_and_save": (_setup_none, _run_classify),
+    "detect_change": (_setup_none, _run_detect_change),
+    "compute_transition_matrix": (_setup_transition_matrix, _run_transition_matrix),
+    "train_model": (_setup_none, _run_train),
+    "predict_land_cover": (_setup_none, _run_predict),
+    "generate_static_map": (_setup_none, _run_static_map),
+}
+
+# --- Pengukuran ---
+
+def _measure_stage(stage, size_dir, config, use_tracemalloc):
+    """Dijalankan di proses baru (spawn) agar puncak memori satu tahap tidak tercampur tahap lain."""
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    from src.raster_io import configure as configure_raster_output
+    from src.boundary_mask import set_cache_dir
+    from src.instrumentation import measure_stage
+    configure_raster_output(config.get("raster_output"))
+
+    setup, run = STAGE_FUNCTIONS[stage]
+    paths = _paths(size_dir)
+    # Seperti di pipeline, mask batas dirasterisasi sekali lalu dipakai ulang oleh tahap berikutnya
+    set_cache_dir(paths["boundary_masks"])
+    state = setup(paths, config)
+
+    gc.collect()
+    # Pengukuran yang sama dengan laporan run pipeline (src/instrumentation.py)
+    with measure_stage(stage, tracemalloc_enabled=use_tracemalloc) as record:
+        run(paths, config, state)
+    return record
+
+def _list_files(directory):
+    return set(os.listdir(directory)) if os.path.isdir(directory) else set()
+
+def _run_in_child(stage, size_dir, config, use_tracemalloc):
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_measure_stage, stage, size_dir, config, use_tracemalloc).result()
+
+def _git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=PROJECT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=PROJECT_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+def run_benchmarks(sizes, stages=None, repeat=1, config=None, work_dir=None, seed=0, use_tracemalloc=False):
+    """Jalankan semua tahap (berurutan) untuk setiap ukuran; tahap di luar `stages` tetap dijalankan
+    tanpa diukur jika outputnya dibutuhkan tahap berikutnya. Mengembalikan dict hasil (lihat README)."""
+    from benchmarks.synthetic_data import generate_dataset
+    config = config or {}
+    stages = list(stages or STAGES)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError(f"Tahap tidak dikenal: {', '.join(unknown)}")
+    work_dir = work_dir or os.path.join(BENCHMARK_DIR, "_work")
+    commit, dirty = _git_revision()
+    results = []
+
+    for size in sizes:
+        size_dir = os.path.join(work_dir, str(size))
+        print(f"[*] Menyiapkan data sintetis {size}x{size} piksel...")
+        generate_dataset(os.path.join(size_dir, "raw"), size, seed=seed)
+        # Output lama dihapus agar cache dan output tahap sebelumnya tidak memengaruhi hasil
+        shutil.rmtree(os.path.join(size_dir, "out"), ignore_errors=True)
+        last_measured = max(STAGES.index(stage) for stage in stages)
+
+        for stage in STAGES[:last_measured + 1]:
+            if stage not in stages:
+                _run_in_child(stage, size_dir, config, False)
+                continue
+            # Mask batas, cache pra-pemrosesan dan feature store dari pengulangan sebelumnya dihapus agar setiap pengulangan setara
+            masks_dir = _paths(size_dir)["boundary_masks"]
+            masks_before = _list_files(masks_dir)
+            runs = []
+            for _ in range(repeat):
+                for name in _list_files(masks_dir) - masks_before:
+                    os.remove(os.path.join(masks_dir, name))
+                for cache_name in ("preprocess_cache", "feature_store"):
+                    shutil.rmtree(_paths(size_dir)[cache_name], ignore_errors=True)
+                runs.append(_run_in_child(stage, size_dir, config, use_tracemalloc))
+            walls = [run["wall_s"] for run in runs]
+            result = {
+                "stage": stage,
+                "size": size,
+                "pixels": size * size,
+                "wall_s": min(walls),
+                "wall_s_median": statistics.median(walls),
+                "wall_s_all": walls,
+                "cpu_s": min(run["cpu_s"] for run in runs),
+                "peak_rss_mb": max((run["peak_rss_mb"] for run in runs if run["peak_rss_mb"] is not None), default=None),
+                "rss_increase_mb": max((run["rss_increase_mb"] for run in runs if run["rss_increase_mb"] is not None), default=None),
+                "tracemalloc_peak_mb": max((run["tracemalloc_peak_mb"] for run in runs if run["tracemalloc_peak_mb"] is not None), default=None),
+                "read_bytes": runs[0].get("read_bytes"),
+                "write_bytes": runs[0].get("write_bytes"),
+            }
+            result["pixels_per_s"] = result["pixels"] / result["wall_s"] if result["wall_s"] > 0 else None
+            results.append(result)
+            print(f"[✔] {stage:<26} {size:>6}²  {result['wall_s']:8.2f} s  puncak RSS {result['peak_rss_mb'] or 0:8.1f} MB")
+
+    return {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": commit,
+            "dirty": dirty,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": repeat,
+            "seed": seed,
+            "tracemalloc": use_tracemalloc,
+        },
+        "results": results,
+    }
+
+def compare_results(baseline, candidate, threshold=0.10):
+    """Bandingkan dua file hasil per (tahap, ukuran). Mengembalikan (baris tabel, ada_regresi);
+    regresi = waktu atau puncak RSS naik lebih dari threshold (relatif)."""
+    base = {(r["stage"], r["size"]): r for r in baseline["results"]}
+    rows, regressed = [], False
+    for result in candidate["results"]:
+        key = (result["stage"], result["size"])
+        if key not in base:
+            continue
+        old = base[key]
+        wall_ratio = result["wall_s"] / old["wall_s"] if old["wall_s"] else None
+        rss_ratio = result["peak_rss_mb"] / old["peak_rss_mb"] if old.get("peak_rss_mb") and result.get("peak_rss_mb") else None
+        status = "ok"
+        if (wall_ratio and wall_ratio > 1 + threshold) or (rss_ratio and rss_ratio > 1 + threshold):
+            status, regressed = "REGRESI", True
+        elif wall_ratio and wall_ratio < 1 - threshold:
+            status = "lebih cepat"
+        rows.append((result["stage"], result["size"], old["wall_s"], result["wall_s"], wall_ratio,
+                     old.get("peak_rss_mb"), result.get("peak_rss_mb"), rss_ratio, status))
+    return rows, regressed
+
+def _format_ratio(ratio):
+    return f"{ratio:6.2f}x" if ratio is not None else "     -"
+
+def _format_mb(value):
+    return f"{value:9.1f}" if value is not None else "        -"
+
+def print_comparison(rows):
+    print(f"{'Tahap':<26} {'Ukuran':>7} {'Waktu lama':>10} {'Waktu baru':>10} {'Rasio':>7} {'RSS lama':>9} {'RSS baru':>9} {'Rasio':>7}  Status")
+    for stage, size, old_wall, new_wall, wall_ratio, old_rss, new_rss, rss_ratio, status in rows:
+        print(f"{stage:<26} {size:>6}² {old_wall:9.2f}s {new_wall:9.2f}s {_format_ratio(wall_ratio)} "
+              f"{_format_mb(old_rss)} {_format_mb(new_rss)} {_format_ratio(rss_ratio)}  {status}")
+
+def _default_output_path(meta):
+    name = f"{(meta['commit'] or 'unknown')[:10]}{'-dirty' if meta['dirty'] else ''}_{datetime.now():%Y%m%d_%H%M%S}.json"
+    return os.path.join(BENCHMARK_DIR, "results", name)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark tahap pipeline pada raster sintetis.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Jalankan benchmark dan simpan hasil JSON.")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000], help="Sisi raster sintetis (piksel), mis. 1000 5000 20000.")
+    run_parser.add_argument("--stages", nargs="+", choices=STAGES, help="Tahap yang diukur (default: semua).")
+    run_parser.add_argument("--repeat", type=int, default=1, help="Jumlah pengulangan per tahap (waktu minimum yang dilaporkan).")
+    run_parser.add_argument("--config", default=os.path.join(PROJECT_DIR, "config.yaml"), help="Opsi tahap diambil dari config ini.")
+    run_parser.add_argument("--work-dir", help="Folder data sintetis dan output (default: benchmarks/_work).")
+    run_parser.add_argument("--output", help="File hasil JSON (default: benchmarks/results/<commit>_<waktu>.json).")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--tracemalloc", action="store_true", help="Ukur juga puncak alokasi tracemalloc (memperlambat tahap).")
+
+    compare_parser = subparsers.add_parser("compare", help="Bandingkan dua file hasil.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Batas kenaikan relatif sebelum dianggap regresi.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command == "compare":
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        with open(args.candidate, encoding="utf-8") as f:
+            candidate = json.load(f)
+        rows, regressed = compare_results(baseline, candidate, args.threshold)
+        print_comparison(rows)
+        return 1 if regressed else 0
+
+    config = {}
+    if args.config and os.path.exists(args.config):
+        with open(args.config, encoding="utf-8") as f:
+            config = yaml.safe_load(f) or {}
+    report = run_benchmarks(args.sizes, stages=args.stages, repeat=args.repeat, config=config,
+                            work_dir=args.work_dir, seed=args.seed, use_tracemalloc=args.tracemalloc)
+    output_path = args.output or _default_output_path(report["meta"])
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Hasil benchmark disimpan ke: {output_path}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
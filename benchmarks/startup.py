@@ -0,0 +1,85 @@
+"""Benchmark waktu startup: waktu impor main.py dan modul tahap, plus pengecekan dependensi berat.
+
+Setiap skenario dijalankan di interpreter baru. Skenario gagal jika modul terlarang ikut dimuat
+(mis. sklearn saat hanya menjalankan prediksi) atau waktu impornya melebihi batas.
+
+Contoh (dari root proyek):
+    python -m benchmarks.startup
+    python -m benchmarks.startup --repeat 10 --output benchmarks/results/startup.json
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("sklearn", "scipy", "geopandas", "matplotlib", "seaborn", "pandas", "folium", "joblib")
+
+# nama -> (kode impor, modul yang tidak boleh ikut dimuat, batas waktu impor default dalam detik)
+SCENARIOS = {
+    # CLI: parse argumen, --help, dan worker batch sebelum tahap pertama berjalan
+    "main": ("import main", HEAVY_MODULES, 0.5),
+    # Tahap prediksi Mode 2 (dengan LUT): tidak perlu sklearn/joblib, matplotlib, atau geopandas
+    "predict": ("import src.predict", HEAVY_MODULES, 1.0),
+    # Deteksi perubahan: pandas untuk statistik, tanpa plotting maupun sklearn
+    "change_detection": ("import src.change_detection", ("sklearn", "scipy", "geopandas", "matplotlib", "seaborn", "folium", "joblib"), 1.5),
+    # Pipeline dan laporan run: dipakai main sebelum tahap mana pun dijalankan
+    "pipeline": ("import src.pipeline, src.instrumentation", HEAVY_MODULES, 0.2),
+}
+
+_CHILD = """
+import sys, time, json
+start = time.perf_counter()
+{code}
+seconds = time.perf_counter() - start
+print(json.dumps({{"seconds": seconds, "loaded": sorted(m for m in {forbidden!r} if m in sys.modules)}}))
+"""
+
+def measure_scenario(code, forbidden, repeat=5):
+    """Jalankan impor di interpreter baru sebanyak repeat kali. Mengembalikan (daftar detik, modul terlarang yang dimuat)."""
+    seconds, loaded = [], set()
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, "-c", _CHILD.format(code=code, forbidden=tuple(forbidden))],
+                                cwd=PROJECT_DIR, capture_output=True, text=True, check=True)
+        measurement = json.loads(result.stdout.strip().splitlines()[-1])
+        seconds.append(measurement["seconds"])
+        loaded.update(measurement["loaded"])
+    return seconds, sorted(loaded)
+
+def run_startup_benchmark(scenarios=None, repeat=5, budget_scale=1.0):
+    results, failed = [], False
+    for name in scenarios or SCENARIOS:
+        code, forbidden, budget = SCENARIOS[name]
+        seconds, loaded = measure_scenario(code, forbidden, repeat)
+        budget *= budget_scale
+        ok = not loaded and min(seconds) <= budget
+        failed |= not ok
+        results.append({"scenario": name, "code": code, "seconds": min(seconds), "seconds_median": statistics.median(seconds),
+                        "budget_s": budget, "forbidden_loaded": loaded, "ok": ok})
+        status = "[✔]" if ok else "[!]"
+        extra = f", modul berat dimuat: {', '.join(loaded)}" if loaded else ""
+        print(f"{status} {name:<18} {min(seconds):6.3f} s (median {statistics.median(seconds):6.3f} s, batas {budget:.2f} s){extra}")
+    return results, failed
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark waktu impor dan startup CLI.")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), help="Skenario yang dijalankan (default: semua).")
+    parser.add_argument("--repeat", type=int, default=5, help="Jumlah interpreter baru per skenario (waktu minimum dipakai).")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="Pengali batas waktu, mis. 2 untuk mesin yang lambat.")
+    parser.add_argument("--output", help="Simpan hasil sebagai JSON.")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    results, failed = run_startup_benchmark(args.scenarios, args.repeat, args.budget_scale)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
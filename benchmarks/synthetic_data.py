@@ -0,0 +1,90 @@
+import os
+import json
+import numpy as np
+import rasterio
+import geopandas as gpd
+from rasterio.crs import CRS
+from rasterio.transform import from_origin
+from shapely.geometry import Polygon
+from src.utils import iter_block_windows
+
+# Pojok kiri atas dan ukuran piksel (~10 m) raster sintetis; EPSG:4326 agar tahap reprojeksi ikut diuji
+ORIGIN_LON, ORIGIN_LAT = 110.0, -7.0
+PIXEL_DEG = 0.00009
+# Ukuran sel noise kasar (piksel) yang membentuk "petak" tutupan lahan
+PATCH_SIZE = 64
+# Naikkan jika isi data sintetis berubah agar data lama dibuat ulang
+SYNTHETIC_VERSION = 2
+
+def _patch_field(rng, n_patches_y, n_patches_x):
+    return rng.uniform(-0.2, 0.9, size=(n_patches_y, n_patches_x)).astype(np.float32)
+
+def _ndvi_block(field, window, rng):
+    """NDVI satu blok: nilai petak kasar (di-upsample nearest) ditambah noise halus."""
+    rows = (np.arange(window.row_off, window.row_off + window.height) // PATCH_SIZE)
+    cols = (np.arange(window.col_off, window.col_off + window.width) // PATCH_SIZE)
+    ndvi = field[np.ix_(rows, cols)] + rng.normal(0, 0.05, size=(int(window.height), int(window.width))).astype(np.float32)
+    return np.clip(ndvi, -1, 1)
+
+def _rgb_from_ndvi(ndvi, rng):
+    # Hijau naik dan merah turun seiring NDVI agar model punya sinyal yang bisa dipelajari
+    noise = rng.normal(0, 12, size=(3,) + ndvi.shape)
+    red = 140 - 90 * ndvi + noise[0]
+    green = 90 + 80 * ndvi + noise[1]
+    blue = 80 - 20 * ndvi + noise[2]
+    return np.clip(np.stack([red, green, blue]), 1, 255).astype(np.uint8)
+
+def _write_boundary(path, width, height):
+    """Batas berupa elips yang menutupi ~75% luas raster (blok di pojok berada di luar batas)."""
+    t = np.linspace(0, 2 * np.pi, 128, endpoint=False)
+    cx, cy = ORIGIN_LON + width * PIXEL_DEG / 2, ORIGIN_LAT - height * PIXEL_DEG / 2
+    rx, ry = 0.49 * width * PIXEL_DEG, 0.49 * height * PIXEL_DEG
+    polygon = Polygon(zip(cx + rx * np.cos(t), cy + ry * np.sin(t)))
+    gpd.GeoDataFrame({"id": [1]}, geometry=[polygon], crs="EPSG:4326").to_file(path, driver="ESRI Shapefile")
+
+def generate_dataset(output_dir, size, seed=0, block_size=1024):
+    """Buat ndvi_from.tif, ndvi_to.tif, rgb.tif (size x size piksel, EPSG:4326) dan boundary.shp.
+
+    Raster ditulis blok per blok sehingga ukuran besar (mis. 20000²) tidak perlu muat di memori.
+    Dataset yang sudah ada dengan parameter sama dipakai ulang. Mengembalikan dict path.
+    """
+    paths = {
+        "ndvi_from": os.path.join(output_dir, "ndvi_from.tif"),
+        "ndvi_to": os.path.join(output_dir, "ndvi_to.tif"),
+        "rgb": os.path.join(output_dir, "rgb.tif"),
+        "boundary": os.path.join(output_dir, "boundary.shp"),
+    }
+    params = {"version": SYNTHETIC_VERSION, "size": size, "seed": seed}
+    params_path = os.path.join(output_dir, "dataset.json")
+    if os.path.exists(params_path) and all(os.path.exists(path) for path in paths.values()):
+        with open(params_path, encoding="utf-8") as f:
+            if json.load(f) == params:
+                return paths
+
+    os.makedirs(output_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    n_patches = -(-size // PATCH_SIZE)
+    field_from = _patch_field(rng, n_patches, n_patches)
+    # Sekitar 20% petak berubah di antara kedua tanggal
+    changed = rng.random(field_from.shape) < 0.2
+    field_to = np.where(changed, _patch_field(rng, n_patches, n_patches), field_from)
+
+    profile = {
+        "driver": "GTiff", "width": size, "height": size, "crs": CRS.from_epsg(4326),
+        "transform": from_origin(ORIGIN_LON, ORIGIN_LAT, PIXEL_DEG, PIXEL_DEG),
+        "tiled": True, "blockxsize": 256, "blockysize": 256, "compress": "deflate",
+    }
+    with rasterio.open(paths["ndvi_from"], "w", count=1, dtype="float32", nodata=np.nan, **profile) as ndvi_from, \
+         rasterio.open(paths["ndvi_to"], "w", count=1, dtype="float32", nodata=np.nan, **profile) as ndvi_to, \
+         rasterio.open(paths["rgb"], "w", count=3, dtype="uint8", nodata=0, **profile) as rgb:
+        for window in iter_block_windows(size, size, block_size):
+            ndvi_from.write(_ndvi_block(field_from, window, rng), 1, window=window)
+            block_to = _ndvi_block(field_to, window, rng)
+            ndvi_to.write(block_to, 1, window=window)
+            # Citra RGB dari tanggal akhir, sama seperti label yang dipakai tahap train (label_to)
+            rgb.write(_rgb_from_ndvi(block_to, rng), window=window)
+
+    _write_boundary(paths["boundary"], size, size)
+    with open(params_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return paths
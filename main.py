@@ -1,28 +1,110 @@
 # main.py
 import yaml
-from src.preprocessing import preprocess
-from src.ndvi_to_class import classify_and_save
-from src.model import train_and_predict
-from src.evaluate import evaluate_model
-from src.change_detection import detect_change
-from src.analyze_change import compute_area_stats, save_stats_to_csv, compute_transition_matrix, plot_bar_comparison, plot_pie_chart, plot_transition_heatmap
-from src.generate_static_map import generate_static_map
-from src.predict import predict_land_cover
+# Modul tahap (dan dependensi beratnya: sklearn, geopandas, matplotlib, pandas, folium) diimpor di dalam
+# fungsi yang memakainya, sehingga startup CLI dan worker batch hanya memuat yang benar-benar dibutuhkan.
+# Jaga dengan: python -m benchmarks.startup
+from src.pipeline import Task, run_pipeline, select_tasks
+from src.instrumentation import RunReport
 import logging
-import rasterio
 import os
+import sys
+import json
+import time
+import argparse
+import traceback
 import shutil # Import shutil for directory cleanup
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
+
+def configure_runtime(config):
+    """Pengaturan per proses yang berlaku untuk semua tahap (juga dipanggil di proses worker batch)."""
+    from src.boundary_mask import set_cache_dir as set_boundary_mask_cache_dir
+    from src.raster_io import configure as configure_raster_output
+    # Mask batas yang dirasterisasi disimpan dan dipakai ulang oleh semua tahap
+    set_boundary_mask_cache_dir(os.path.join(config["outputs"]["preprocessed"], "boundary_masks"))
+    # Layout, kompresi dan overview untuk semua raster output
+    configure_raster_output(config.get("raster_output", {}))
+
+def create_run_report(config, mode):
+    """RunReport untuk satu run (lihat bagian instrumentation di config.yaml); None jika dinonaktifkan."""
+    instrumentation = config.get("instrumentation", {})
+    if not instrumentation.get("enabled", True):
+        return None
+    return RunReport(mode, tracemalloc_enabled=instrumentation.get("tracemalloc", False),
+                     profile_stages=instrumentation.get("profile_stages") or (),
+                     profile_dir=instrumentation.get("profile_dir", os.path.join("output", "profiles")))
+
+def save_run_report(config, report):
+    # Mode ditambahkan ke nama file (run_report_mode1.json, run_report_mode2.json) agar laporan mode lain tidak tertimpa
+    if report is not None:
+        root, ext = os.path.splitext(config.get("instrumentation", {}).get("report", os.path.join("output", "run_report.json")))
+        report.save(f"{root}_{report.mode}{ext}")
+
+def measured(report, name, raster_paths=()):
+    """Ukur blok kode sebagai satu tahap jika report aktif."""
+    return report.stage(name, raster_paths) if report is not None else nullcontext()
+
+def load_config(config_path="config.yaml"):
+    with open(config_path) as f:
+        return yaml.safe_load(f)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Deteksi perubahan tutupan lahan berbasis NDVI dan Random Forest.")
+    parser.add_argument("--config", default="config.yaml", help="Path config.yaml (default: config.yaml)")
+    subparsers = parser.add_subparsers(dest="command")
+
+    # Subcommand Mode 1 memakai graf tugas yang sama; tahap yang tidak berubah dilewati
+    for command, help_text in (("run", "Jalankan seluruh pipeline (Mode 1)"),
+                               ("train", "Pra-pemrosesan, klasifikasi NDVI, dan pelatihan model"),
+                               ("change", "Pra-pemrosesan, klasifikasi NDVI, dan deteksi perubahan"),
+                               ("analyze", "Analisis statistik dan peta statis dari hasil deteksi perubahan")):
+        subparser = subparsers.add_parser(command, help=help_text)
+        subparser.add_argument("--force", action="store_true", help="Jalankan ulang semua tahap meskipun tidak berubah")
+
+    predict_parser = subparsers.add_parser("predict", help="Prediksi dengan model yang sudah ada (Mode 2), satu area atau batch")
+    predict_parser.add_argument("--model", help="Path model (default: outputs.model/random_forest.pkl)")
+    predict_parser.add_argument("--manifest", help="Manifest area (YAML dengan daftar 'areas' atau CSV) untuk mode batch")
+    predict_parser.add_argument("--name", default="area", help="Nama area jika --rgb-from/--rgb-to/--boundary diberikan")
+    predict_parser.add_argument("--rgb-from", help="Citra RGB periode awal")
+    predict_parser.add_argument("--rgb-to", help="Citra RGB periode akhir")
+    predict_parser.add_argument("--boundary", help="Shapefile batas area")
+    predict_parser.add_argument("--output-dir", help="Direktori output per area (default: batch.output_dir di config)")
+    predict_parser.add_argument("--workers", type=int, help="Jumlah proses untuk mode batch (default: batch.n_workers di config)")
+
+    timeseries_parser = subparsers.add_parser("timeseries", help="Deret waktu N tanggal: tambah satu tanggal NDVI atau tulis ulang statistiknya")
+    timeseries_parser.add_argument("--date", help="Tanggal citra (urutan teks = urutan waktu, mis. 2024-06-30); tanpa --date hanya menulis ulang statistik")
+    timeseries_parser.add_argument("--ndvi", help="Citra NDVI untuk --date")
+    timeseries_parser.add_argument("--boundary", help="Shapefile batas (default: time_series.boundary atau paths.boundary di config)")
+    timeseries_parser.add_argument("--dir", help="Direktori deret waktu (default: time_series.dir di config)")
+    return parser
+
+# Tugas target graf Mode 1 untuk setiap subcommand
+COMMAND_TARGETS = {"run": None, "train": ["train"], "change": ["change"], "analyze": ["analyze", "map"]}
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
 
-def main():
     # Setup logging
     from src.utils import setup_logger
     setup_logger()
     logger = logging.getLogger(__name__)
 
     # Load configuration
-    with open("config.yaml") as f:
-        config = yaml.safe_load(f)
-
+    config = load_config(args.config)
+    configure_runtime(config)
+
+    if args.command is None:
+        # Tanpa subcommand: menu interaktif seperti sebelumnya
+        return run_interactive(config, logger)
+    if args.command in COMMAND_TARGETS:
+        run_full_pipeline(config, logger, targets=COMMAND_TARGETS[args.command], incremental=False if args.force else None)
+        return 0
+    if args.command == "timeseries":
+        return run_time_series_command(config, logger, args)
+    return run_predict_command(config, logger, args)
+
+def run_interactive(config, logger):
     # --- Pilihan Mode ---
     print("Pilih mode operasi:")
     print("1. Jalankan Seluruh Pipeline (Termasuk Pelatihan Model Baru)")
@@ -34,9 +116,11 @@ def main():
         run_full_pipeline(config, logger)
     elif choice == '2':
         logger.info("[*] Mode 2: Melakukan Prediksi Menggunakan Model yang Sudah Ada (untuk area lain).")
-        run_prediction_with_existing_model(config, logger)
+        return 0 if run_prediction_with_existing_model(config, logger) else 1
     else:
         logger.error("Pilihan tidak valid. Harap masukkan '1' atau '2'.")
+        return 1
+    return 0
 
 def create_output_directories(config, logger, mode_2_specific=False):
     """Collects and creates all necessary output directories based on the config."""
@@ -62,190 +146,518 @@ def create_output_directories(config, logger, mode_2_specific=False):
             os.makedirs(directory, exist_ok=True)
             logger.info(f"Direktori dibuat atau sudah ada: {directory}")
 
-def run_full_pipeline(config, logger):
-    create_output_directories(config, logger, mode_2_specific=False) # Create all general directories
+def preprocess_options(config):
+    """Opsi pra-pemrosesan dari config.yaml (bagian preprocessing dan processing.block_size)."""
+    preprocessing_config = config.get("preprocessing", {})
+    cache_config = preprocessing_config.get("cache", {})
+    options = {
+        "block_size": config.get("processing", {}).get("block_size", 1024),
+        "resolution": preprocessing_config.get("grid", {}).get("resolution"),
+        "n_workers": preprocessing_config.get("n_workers", 1),
+        "executor": preprocessing_config.get("executor", "thread"),
+        "gdal_options": preprocessing_config.get("gdal", {}),
+    }
+    if not cache_config.get("enabled", True):
+        options["cache_dir"] = None
+        return options
+    options["cache_dir"] = cache_config.get("dir", os.path.join(config["outputs"]["preprocessed"], "cache"))
+    options["hash_contents"] = cache_config.get("hash_contents", False)
+    return options
+
+# --- Mode 1 sebagai graf tugas (lihat src/pipeline.py) ---
+# Setiap tugas menerima (config, products) dan mengembalikan produk baru untuk tugas berikutnya.
+
+def _label_paths(config):
+    return (os.path.join(config["outputs"]["classified"], "ndvi_class_from.tif"),
+            os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif"))
+
+def _analysis_csv_paths(config):
+    analysis_dir = config["outputs"]["analysis"]
+    return (os.path.join(analysis_dir, "statistik_klasifikasi_from.csv"),
+            os.path.join(analysis_dir, "statistik_klasifikasi_to.csv"),
+            os.path.join(analysis_dir, "matrix_perubahan.csv"))
+
+def task_preprocess(config, products):
+    from src.preprocessing import preprocess
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Pra-pemrosesan...")
     ndvi_from_clipped, ndvi_to_clipped, rgb_clipped, boundary_reprojected = preprocess(
         ndvi_from_path=config["paths"]["ndvi_from"],
         ndvi_to_path=config["paths"]["ndvi_to"],
         rgb_path=config["paths"]["rgb"],
         boundary_path=config["paths"]["boundary"],
-        output_dir=config["outputs"]["preprocessed"]
+        output_dir=config["outputs"]["preprocessed"],
+        **preprocess_options(config)
     )
     logger.info("[✔] Tahap Pra-pemrosesan selesai.")
+    return {"ndvi_from_clipped": ndvi_from_clipped, "ndvi_to_clipped": ndvi_to_clipped,
+            "rgb_clipped": rgb_clipped, "boundary_reprojected": boundary_reprojected}
 
+def task_classify(config, products):
+    from src.ndvi_to_class import classify_and_save
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Klasifikasi NDVI...")
-    classify_and_save(
-        ndvi_path=ndvi_from_clipped,
-        output_path=os.path.join(config["outputs"]["classified"], "ndvi_class_from.tif")
-    )
-    classify_and_save(
-        ndvi_path=ndvi_to_clipped,
-        output_path=os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif")
-    )
+    label_from, label_to = _label_paths(config)
+    classify_and_save(ndvi_path=products["ndvi_from_clipped"], output_path=label_from)
+    classify_and_save(ndvi_path=products["ndvi_to_clipped"], output_path=label_to)
     logger.info("[✔] Tahap Klasifikasi NDVI selesai.")
+    return {"label_from": label_from, "label_to": label_to}
 
+def task_change(config, products):
+    from src.change_detection import detect_change
+    from src.analyze_change import save_stats_to_csv
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Deteksi Perubahan...")
-    detect_change(
-        label_from_path=os.path.join(config["outputs"]["classified"], "ndvi_class_from.tif"),
-        label_to_path=os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif"),
+    # Satu lintasan: peta perubahan (+ salinan TIF peta statis), statistik luas dan matriks transisi
+    stats_from, stats_to, transition_matrix = detect_change(
+        label_from_path=products["label_from"],
+        label_to_path=products["label_to"],
         output_raster_path=config["paths"]["change_map"],
-        stats_csv_path=os.path.join(config["outputs"]["analysis"], "luas_perubahan.csv")
+        stats_csv_path=os.path.join(config["outputs"]["analysis"], "luas_perubahan.csv"),
+        block_size=config.get("processing", {}).get("block_size", 1024),
+        extra_raster_paths=[os.path.join(config["outputs"]["analysis"], "peta_perubahan_statis.tif")],
+        boundary_path=products["boundary_reprojected"]
     )
+    # Statistik disimpan di sini agar tahap analisis dapat berjalan tanpa membaca ulang raster
+    stats_from_csv, stats_to_csv, matrix_csv = _analysis_csv_paths(config)
+    save_stats_to_csv(stats_from, stats_from_csv)
+    save_stats_to_csv(stats_to, stats_to_csv)
+    transition_matrix.to_csv(matrix_csv)
     logger.info("[✔] Tahap Deteksi Perubahan selesai.")
+    return {"change_map": config["paths"]["change_map"]}
 
-    logger.info("[*] Memulai tahap Pelatihan dan Prediksi Model...")
-    train_and_predict(
-        rgb_path=rgb_clipped,
-        label_path=os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif"),
-        boundary_path=boundary_reprojected,
+def task_train(config, products):
+    from src.model import train_model
+    logger = logging.getLogger(__name__)
+    logger.info("[*] Memulai tahap Pelatihan Model...")
+    training = config.get("training", {})
+    model_path = train_model(
+        rgb_path=products["rgb_clipped"],
+        label_path=products["label_to"],
+        boundary_path=products["boundary_reprojected"],
         model_output=config["outputs"]["model"],
-        prediction_output=config["outputs"]["prediction"]
+        compile_lut=training.get("compile_lut", False),
+        n_estimators=training.get("n_estimators", 100),
+        n_jobs=training.get("n_jobs"),
+        sampling=training.get("sampling"),
+        deduplicate=training.get("deduplicate", False),
+        derived_features=training.get("derived_features") or (),
+        feature_store=training.get("feature_store"),
+        out_of_core=training.get("out_of_core"),
+        hash_contents=config.get("preprocessing", {}).get("cache", {}).get("hash_contents", False)
     )
-    logger.info("[✔] Tahap Pelatihan dan Prediksi Model selesai.")
+    logger.info("[✔] Tahap Pelatihan Model selesai.")
+    return {"model_path": model_path}
 
+def task_predict(config, products):
+    from src.predict import predict_land_cover
+    logger = logging.getLogger(__name__)
+    logger.info("[*] Memulai tahap Prediksi...")
+    predict_land_cover(
+        rgb_path=products["rgb_clipped"],
+        model_path=products["model_path"],
+        output_path=config["outputs"]["prediction"],
+        boundary_path=products["boundary_reprojected"],
+        **config.get("prediction", {})
+    )
+    logger.info("[✔] Tahap Prediksi selesai.")
+    return {"prediction": config["outputs"]["prediction"]}
+
+def task_evaluate(config, products):
+    from src.evaluate import evaluate_model
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Evaluasi...")
     evaluate_model(
-        ground_truth_ndvi_path=os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif"),
-        predicted_path=config["outputs"]["prediction"],
-        output_dir=config["outputs"]["evaluation"]
+        ground_truth_ndvi_path=products["label_to"],
+        predicted_path=products["prediction"],
+        output_dir=config["outputs"]["evaluation"],
+        **config.get("evaluation", {})
     )
     logger.info("[✔] Tahap Evaluasi selesai.")
 
+def task_analyze(config, products):
+    import pandas as pd
+    from src.analyze_change import plot_bar_comparison, plot_pie_chart, plot_transition_heatmap
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Analisis...")
-    with rasterio.open(os.path.join(config["outputs"]["classified"], "ndvi_class_from.tif")) as src_read:
-        label_from = src_read.read(1)
-        pixel_area = abs(src_read.transform[0] * src_read.transform[4])
-
-    with rasterio.open(os.path.join(config["outputs"]["classified"], "ndvi_class_to.tif")) as src_read:
-        label_to = src_read.read(1)
-
-    stats_from, counts_from = compute_area_stats(label_from, pixel_area)
-    stats_to, counts_to = compute_area_stats(label_to, pixel_area)
-
-    save_stats_to_csv(stats_from, os.path.join(config["outputs"]["analysis"], "statistik_klasifikasi_from.csv"))
-    save_stats_to_csv(stats_to, os.path.join(config["outputs"]["analysis"], "statistik_klasifikasi_to.csv"))
-
-    transition_matrix = compute_transition_matrix(label_from, label_to)
-    transition_matrix.to_csv(os.path.join(config["outputs"]["analysis"], "matrix_perubahan.csv"))
+    stats_from_csv, stats_to_csv, matrix_csv = _analysis_csv_paths(config)
+    stats_from = pd.read_csv(stats_from_csv).to_dict("records")
+    stats_to = pd.read_csv(stats_to_csv).to_dict("records")
 
     plot_bar_comparison(stats_from, stats_to, config["outputs"]["visualization"])
     plot_pie_chart(stats_from, tahun="awal", output_dir=config["outputs"]["visualization"])
     plot_pie_chart(stats_to, tahun="akhir", output_dir=config["outputs"]["visualization"])
-    plot_transition_heatmap(os.path.join(config["outputs"]["analysis"], "matrix_perubahan.csv"), config["outputs"]["visualization"])
+    plot_transition_heatmap(matrix_csv, config["outputs"]["visualization"])
     logger.info("[✔] Tahap Analisis selesai.")
 
+def task_map(config, products):
+    from src.generate_static_map import generate_static_map
+    logger = logging.getLogger(__name__)
     logger.info("[*] Memulai tahap Pembuatan Peta Statis...")
     generate_static_map(
-        change_map_path=config["paths"]["change_map"],
+        change_map_path=products["change_map"],
         output_png_path=os.path.join(config["outputs"]["analysis"], "peta_perubahan_statis.png"),
-        output_tif_path=os.path.join(config["outputs"]["analysis"], "peta_perubahan_statis.tif")
+        output_tif_path=None # Sudah ditulis oleh detect_change
     )
     logger.info("[✔] Tahap Pembuatan Peta Statis selesai.")
 
+def task_interactive_map(config, products):
+    from src.visualize_map import visualize_raster_interactive
+    logger = logging.getLogger(__name__)
+    logger.info("[*] Memulai tahap Peta Interaktif...")
+    map_config = config.get("interactive_map", {})
+    visualize_raster_interactive(
+        raster_path=products["change_map"],
+        output_html=map_config.get("output_html", os.path.join("output", "peta_perubahan_interaktif.html")),
+        kind="change",
+        min_zoom=map_config.get("min_zoom"),
+        max_zoom=map_config.get("max_zoom"),
+        n_workers=map_config.get("n_workers", 1),
+        executor=map_config.get("executor", "thread")
+    )
+    logger.info("[✔] Tahap Peta Interaktif selesai.")
+
+def full_pipeline_tasks(config=None):
+    """Graf tugas Mode 1: preprocess → classify → change → train → predict → evaluate/analyze/map.
+    Peta interaktif (tile XYZ) ditambahkan jika interactive_map.enabled aktif di config."""
+    tasks = [
+        Task("preprocess", task_preprocess,
+             inputs=lambda c, p: [c["paths"]["ndvi_from"], c["paths"]["ndvi_to"], c["paths"]["rgb"], c["paths"]["boundary"]],
+             outputs=lambda c, p: [path for path in (p.get("ndvi_from_clipped"), p.get("ndvi_to_clipped"), p.get("rgb_clipped"), p.get("boundary_reprojected")) if path],
+             # Hanya opsi yang memengaruhi hasil; n_workers, executor, gdal dan cache hanya soal eksekusi
+             config_keys=["paths.ndvi_from", "paths.ndvi_to", "paths.rgb", "paths.boundary", "outputs.preprocessed",
+                          "preprocessing.grid", "processing.block_size", "raster_output"]),
+        Task("classify", task_classify, deps=["preprocess"],
+             inputs=lambda c, p: [p["ndvi_from_clipped"], p["ndvi_to_clipped"]],
+             outputs=lambda c, p: list(_label_paths(c)),
+             config_keys=["outputs.classified", "raster_output"]),
+        Task("change", task_change, deps=["preprocess", "classify"],
+             inputs=lambda c, p: [p["label_from"], p["label_to"], p["boundary_reprojected"]],
+             outputs=lambda c, p: [c["paths"]["change_map"], os.path.join(c["outputs"]["analysis"], "luas_perubahan.csv"),
+                                   os.path.join(c["outputs"]["analysis"], "peta_perubahan_statis.tif"), *_analysis_csv_paths(c)],
+             config_keys=["paths.change_map", "outputs.analysis", "processing.block_size", "raster_output"]),
+        Task("train", task_train, deps=["preprocess", "classify"],
+             inputs=lambda c, p: [p["rgb_clipped"], p["label_to"], p["boundary_reprojected"]],
+             outputs=lambda c, p: [os.path.join(c["outputs"]["model"], "random_forest.pkl")],
+             config_keys=["outputs.model", "training"]),
+        Task("predict", task_predict, deps=["preprocess", "train"],
+             inputs=lambda c, p: [p["rgb_clipped"], p["model_path"], p["boundary_reprojected"]],
+             outputs=lambda c, p: [c["outputs"]["prediction"]],
+             config_keys=["outputs.prediction", "prediction", "raster_output"]),
+        Task("evaluate", task_evaluate, deps=["classify", "predict"],
+             inputs=lambda c, p: [p["label_to"], p["prediction"]],
+             outputs=lambda c, p: [os.path.join(c["outputs"]["evaluation"], name) for name in ("classification_report.txt", "confusion_matrix.png")],
+             config_keys=["outputs.evaluation", "evaluation"]),
+        Task("analyze", task_analyze, deps=["change"],
+             inputs=lambda c, p: list(_analysis_csv_paths(c)),
+             outputs=lambda c, p: [os.path.join(c["outputs"]["visualization"], name) for name in
+                                   ("grafik_perbandingan_luas.png", "pie_tutupan_lahan_awal.png", "pie_tutupan_lahan_akhir.png", "heatmap_perubahan_kelas.png")],
+             config_keys=["outputs.visualization"]),
+        Task("map", task_map, deps=["change"],
+             inputs=lambda c, p: [p["change_map"]],
+             outputs=lambda c, p: [os.path.join(c["outputs"]["analysis"], "peta_perubahan_statis.png")],
+             config_keys=["outputs.analysis"]),
+    ]
+    if (config or {}).get("interactive_map", {}).get("enabled", False):
+        tasks.append(Task("interactive_map", task_interactive_map, deps=["change"],
+                          inputs=lambda c, p: [p["change_map"]],
+                          outputs=lambda c, p: [c["interactive_map"].get("output_html", os.path.join("output", "peta_perubahan_interaktif.html"))],
+                          config_keys=["interactive_map"]))
+    return tasks
+
+def run_full_pipeline(config, logger, targets=None, incremental=None):
+    """Jalankan graf tugas Mode 1; targets membatasi ke tugas tertentu beserta dependensinya."""
+    create_output_directories(config, logger, mode_2_specific=False) # Create all general directories
+    pipeline_config = config.get("pipeline", {})
+    report = create_run_report(config, "mode1")
+    try:
+        # Tahap yang input dan potongan config-nya tidak berubah sejak run terakhir dilewati
+        run_pipeline(
+            select_tasks(full_pipeline_tasks(config), targets), config,
+            state_path=pipeline_config.get("state_file", os.path.join("output", "pipeline_state.json")),
+            n_workers=pipeline_config.get("n_workers", 1),
+            incremental=pipeline_config.get("incremental", True) if incremental is None else incremental,
+            hash_contents=pipeline_config.get("hash_contents", False),
+            report=report
+        )
+    except BaseException:
+        if report is not None:
+            report.status = "gagal"
+        raise
+    finally:
+        save_run_report(config, report)
     logger.info("Pipeline selesai dijalankan.")
 
-def run_prediction_with_existing_model(config, logger):
-    create_output_directories(config, logger, mode_2_specific=True) # Create specific new area directories
-
-    rgb_from_new_path = config["paths"]["rgb_from_new_area"]
-    rgb_to_new_path = config["paths"]["rgb_to_new_area"]
-    boundary_new_path = config["paths"]["boundary_new_area"]
-    model_path = os.path.join(config["outputs"]["model"], "random_forest.pkl")
-
-    # Check if model exists
-    if not os.path.exists(model_path):
-        logger.error(f"Model tidak ditemukan di: {model_path}. Harap jalankan 'Mode 1' terlebih dahulu atau pastikan model sudah ada.")
-        return
+def config_area_outputs(config):
+    """Lokasi output Mode 2 untuk satu area seperti yang diatur di bagian outputs config.yaml."""
+    return {
+        "preprocessed_dir": os.path.join(config["outputs"]["preprocessed"], "temp_new_area"),
+        "prediction_from": config["outputs"]["prediction_new_area_from"],
+        "prediction_to": config["outputs"]["prediction_new_area_to"],
+        "change_map": config["outputs"]["change_map_new_area"],
+        "analysis_dir": config["outputs"]["analysis_new_area"],
+        "visualization_dir": config["outputs"]["visualization_new_area"],
+        "suffix": "_new_area",
+    }
+
+def batch_area_outputs(output_root, name):
+    """Lokasi output per area untuk mode batch: semua hasil satu area berada di output_root/<name>/."""
+    area_dir = os.path.join(output_root, name)
+    return {
+        "preprocessed_dir": os.path.join(area_dir, "preprocessed"),
+        "prediction_from": os.path.join(area_dir, "prediction", "prediction_from.tif"),
+        "prediction_to": os.path.join(area_dir, "prediction", "prediction_to.tif"),
+        "change_map": os.path.join(area_dir, "change_map.tif"),
+        "analysis_dir": os.path.join(area_dir, "analysis"),
+        "visualization_dir": os.path.join(area_dir, "visualization"),
+        "suffix": "",
+    }
+
+def predict_area(config, rgb_from_path, rgb_to_path, boundary_path, model_path, outputs, prediction_options=None, preprocessing_overrides=None,
+                 report=None):
+    """Mode 2 untuk satu area: pra-pemrosesan, prediksi kedua periode, deteksi perubahan, analisis, dan peta statis.
+    Jika report (RunReport) diberikan, setiap tahap diukur."""
+    from src.preprocessing import preprocess_rasters
+    from src.predict import predict_land_cover_many
+    from src.change_detection import detect_change
+    from src.analyze_change import save_stats_to_csv, plot_bar_comparison, plot_pie_chart, plot_transition_heatmap
+    from src.generate_static_map import generate_static_map
+    logger = logging.getLogger(__name__)
+    suffix = outputs["suffix"]
+    for directory in (outputs["preprocessed_dir"], os.path.dirname(outputs["prediction_from"]), os.path.dirname(outputs["prediction_to"]),
+                      os.path.dirname(outputs["change_map"]), outputs["analysis_dir"], outputs["visualization_dir"]):
+        os.makedirs(directory or ".", exist_ok=True)
 
     logger.info("[*] Memulai Pra-pemrosesan citra RGB untuk area baru...")
-    # Preprocess new RGB images and boundary
-    temp_preprocessed_dir = os.path.join(config["outputs"]["preprocessed"], "temp_new_area")
-    os.makedirs(temp_preprocessed_dir, exist_ok=True)
-
-    # Preprocess rgb_from_new_area
-    logger.info(f"Memproses {rgb_from_new_path}...")
-    _, _, rgb_from_new_clipped, boundary_reprojected_new = preprocess(
-        ndvi_from_path=rgb_from_new_path, # Dummy, will be ignored by model but needed for preprocess signature
-        ndvi_to_path=rgb_from_new_path,   # Dummy
-        rgb_path=rgb_from_new_path,       # Actual RGB for prediction
-        boundary_path=boundary_new_path,
-        output_dir=os.path.join(temp_preprocessed_dir, "from")
-    )
-    
-    # Preprocess rgb_to_new_area
-    logger.info(f"Memproses {rgb_to_new_path}...")
-    _, _, rgb_to_new_clipped, _ = preprocess( # _ means we don't care about boundary_reprojected_new from second call
-        ndvi_from_path=rgb_to_new_path, # Dummy
-        ndvi_to_path=rgb_to_new_path,   # Dummy
-        rgb_path=rgb_to_new_path,       # Actual RGB for prediction
-        boundary_path=boundary_new_path,
-        output_dir=os.path.join(temp_preprocessed_dir, "to")
-    )
+    with measured(report, "preprocess", [rgb_from_path, rgb_to_path]):
+        # Kedua periode diproses bersama agar di-warp ke grid target yang sama
+        logger.info(f"Memproses {rgb_from_path} dan {rgb_to_path}...")
+        clipped_new, boundary_reprojected_new = preprocess_rasters(
+            {"rgb_from_clipped.tif": rgb_from_path,
+             "rgb_to_clipped.tif": rgb_to_path},
+            boundary_path=boundary_path,
+            output_dir=outputs["preprocessed_dir"],
+            **dict(preprocess_options(config), **(preprocessing_overrides or {}))
+        )
+        rgb_from_new_clipped = clipped_new["rgb_from_clipped.tif"]
+        rgb_to_new_clipped = clipped_new["rgb_to_clipped.tif"]
     logger.info("[✔] Pra-pemrosesan citra RGB area baru selesai.")
 
-
     logger.info("[*] Memulai Prediksi Tutupan Lahan untuk Area Baru...")
-    predict_land_cover(
-        rgb_path=rgb_from_new_clipped,
-        model_path=model_path,
-        output_path=config["outputs"]["prediction_new_area_from"]
-    )
-    predict_land_cover(
-        rgb_path=rgb_to_new_clipped,
-        model_path=model_path,
-        output_path=config["outputs"]["prediction_new_area_to"]
-    )
+    with measured(report, "predict", [rgb_from_new_clipped, rgb_to_new_clipped]):
+        # Kedua periode diprediksi dengan satu model yang dimuat sekali
+        predict_land_cover_many(
+            rgb_paths=[rgb_from_new_clipped, rgb_to_new_clipped],
+            model_path=model_path,
+            output_paths=[outputs["prediction_from"], outputs["prediction_to"]],
+            boundary_path=boundary_reprojected_new,
+            **(config.get("prediction", {}) if prediction_options is None else prediction_options)
+        )
     logger.info("[✔] Prediksi Tutupan Lahan Area Baru selesai.")
 
     logger.info("[*] Memulai Deteksi Perubahan untuk Area Baru...")
-    detect_change(
-        label_from_path=config["outputs"]["prediction_new_area_from"],
-        label_to_path=config["outputs"]["prediction_new_area_to"],
-        output_raster_path=config["outputs"]["change_map_new_area"],
-        stats_csv_path=os.path.join(config["outputs"]["analysis_new_area"], "luas_perubahan_new_area.csv")
-    )
+    with measured(report, "change", [outputs["prediction_from"], outputs["prediction_to"]]):
+        stats_from, stats_to, transition_matrix = detect_change(
+            label_from_path=outputs["prediction_from"],
+            label_to_path=outputs["prediction_to"],
+            output_raster_path=outputs["change_map"],
+            stats_csv_path=os.path.join(outputs["analysis_dir"], f"luas_perubahan{suffix}.csv"),
+            block_size=config.get("processing", {}).get("block_size", 1024),
+            extra_raster_paths=[os.path.join(outputs["analysis_dir"], f"peta_perubahan_statis{suffix}.tif")],
+            boundary_path=boundary_reprojected_new
+        )
     logger.info("[✔] Deteksi Perubahan Area Baru selesai.")
 
     logger.info("[*] Memulai Analisis Perubahan untuk Area Baru...")
-    # Re-read the predicted labels for analysis
-    with rasterio.open(config["outputs"]["prediction_new_area_from"]) as src_read:
-        label_from = src_read.read(1)
-        pixel_area = abs(src_read.transform[0] * src_read.transform[4]) # Get pixel area from clipped raster
-
-    with rasterio.open(config["outputs"]["prediction_new_area_to"]) as src_read:
-        label_to = src_read.read(1)
-    
-    # Compute and save area stats
-    stats_from, counts_from = compute_area_stats(label_from, pixel_area)
-    stats_to, counts_to = compute_area_stats(label_to, pixel_area)
-    save_stats_to_csv(stats_from, os.path.join(config["outputs"]["analysis_new_area"], "statistik_klasifikasi_from_new_area.csv"))
-    save_stats_to_csv(stats_to, os.path.join(config["outputs"]["analysis_new_area"], "statistik_klasifikasi_to_new_area.csv"))
-
-    # Compute and save transition matrix
-    transition_matrix = compute_transition_matrix(label_from, label_to)
-    transition_matrix.to_csv(os.path.join(config["outputs"]["analysis_new_area"], "matrix_perubahan_new_area.csv"))
-
-    # Plot visualizations
-    plot_bar_comparison(stats_from, stats_to, config["outputs"]["visualization_new_area"])
-    plot_pie_chart(stats_from, tahun="awal_new_area", output_dir=config["outputs"]["visualization_new_area"])
-    plot_pie_chart(stats_to, tahun="akhir_new_area", output_dir=config["outputs"]["visualization_new_area"])
-    plot_transition_heatmap(os.path.join(config["outputs"]["analysis_new_area"], "matrix_perubahan_new_area.csv"), config["outputs"]["visualization_new_area"])
+    with measured(report, "analyze"):
+        # Area stats and transition matrix were computed by detect_change in the same pass
+        # Save area stats and transition matrix
+        save_stats_to_csv(stats_from, os.path.join(outputs["analysis_dir"], f"statistik_klasifikasi_from{suffix}.csv"))
+        save_stats_to_csv(stats_to, os.path.join(outputs["analysis_dir"], f"statistik_klasifikasi_to{suffix}.csv"))
+        transition_matrix.to_csv(os.path.join(outputs["analysis_dir"], f"matrix_perubahan{suffix}.csv"))
+
+        # Plot visualizations
+        plot_bar_comparison(stats_from, stats_to, outputs["visualization_dir"])
+        plot_pie_chart(stats_from, tahun=f"awal{suffix}", output_dir=outputs["visualization_dir"])
+        plot_pie_chart(stats_to, tahun=f"akhir{suffix}", output_dir=outputs["visualization_dir"])
+        plot_transition_heatmap(os.path.join(outputs["analysis_dir"], f"matrix_perubahan{suffix}.csv"), outputs["visualization_dir"])
     logger.info("[✔] Analisis Perubahan Area Baru selesai.")
 
     logger.info("[*] Memulai Pembuatan Peta Statis untuk Area Baru...")
-    generate_static_map(
-        change_map_path=config["outputs"]["change_map_new_area"],
-        output_png_path=os.path.join(config["outputs"]["analysis_new_area"], "peta_perubahan_statis_new_area.png"),
-        output_tif_path=os.path.join(config["outputs"]["analysis_new_area"], "peta_perubahan_statis_new_area.tif")
-    )
+    with measured(report, "map", [outputs["change_map"]]):
+        generate_static_map(
+            change_map_path=outputs["change_map"],
+            output_png_path=os.path.join(outputs["analysis_dir"], f"peta_perubahan_statis{suffix}.png"),
+            output_tif_path=None # Already written by detect_change
+        )
     logger.info("[✔] Pembuatan Peta Statis Area Baru selesai.")
-    
+
+def default_model_path(config):
+    return os.path.join(config["outputs"]["model"], "random_forest.pkl")
+
+def run_prediction_with_existing_model(config, logger, model_path=None):
+    create_output_directories(config, logger, mode_2_specific=True) # Create specific new area directories
+    model_path = model_path or default_model_path(config)
+
+    # Check if model exists
+    if not os.path.exists(model_path):
+        logger.error(f"Model tidak ditemukan di: {model_path}. Harap jalankan 'Mode 1' terlebih dahulu atau pastikan model sudah ada.")
+        return False
+
+    report = create_run_report(config, "mode2")
+    try:
+        predict_area(
+            config,
+            rgb_from_path=config["paths"]["rgb_from_new_area"],
+            rgb_to_path=config["paths"]["rgb_to_new_area"],
+            boundary_path=config["paths"]["boundary_new_area"],
+            model_path=model_path,
+            outputs=config_area_outputs(config),
+            report=report
+        )
+    finally:
+        save_run_report(config, report)
+
     # Optional: Clean up temporary preprocessed directory
     # shutil.rmtree(temp_preprocessed_dir)
     # logger.info(f"Direktori temporer dihapus: {temp_preprocessed_dir}")
 
     logger.info("Pipeline Prediksi dengan Model yang Sudah Ada selesai dijalankan.")
+    return True
+
+# --- Mode batch: banyak area dari satu manifest ---
+
+MANIFEST_FIELDS = ("name", "rgb_from", "rgb_to", "boundary")
+
+def load_manifest(manifest_path):
+    """Baca manifest area: YAML ({areas: [{name, rgb_from, rgb_to, boundary}, ...]}) atau CSV dengan kolom yang sama.
+    Path relatif dianggap relatif terhadap lokasi manifest."""
+    import pandas as pd
+    if manifest_path.lower().endswith(".csv"):
+        areas = pd.read_csv(manifest_path, dtype=str).to_dict("records")
+    else:
+        with open(manifest_path) as f:
+            areas = (yaml.safe_load(f) or {}).get("areas", [])
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    names = set()
+    for area in areas:
+        missing = [field for field in MANIFEST_FIELDS if not area.get(field)]
+        if missing:
+            raise ValueError(f"Entri manifest tidak lengkap ({', '.join(missing)}): {area}")
+        if area["name"] in names:
+            raise ValueError(f"Nama area duplikat di manifest: {area['name']}")
+        names.add(area["name"])
+        for field in ("rgb_from", "rgb_to", "boundary"):
+            area[field] = os.path.join(base_dir, area[field])
+    return areas
+
+def _init_batch_worker(config, model_path, use_lut):
+    from src.model_cache import load_classifier
+    configure_runtime(config)
+    # Worker hasil fork sudah mewarisi model dari cache proses utama; selain fork, model dimuat sekali per worker
+    load_classifier(model_path, use_lut)
+
+def _run_batch_area(config, area, model_path, output_root):
+    logger = logging.getLogger(__name__)
+    outputs = batch_area_outputs(output_root, area["name"])
+    # Di dalam worker batch, prediksi dan pra-pemrosesan memakai thread agar tidak membuat pool proses bersarang
+    prediction_options = dict(config.get("prediction", {}), executor="thread")
+    started = time.perf_counter()
+    try:
+        logger.info(f"[*] Area '{area['name']}' dimulai...")
+        predict_area(config, area["rgb_from"], area["rgb_to"], area["boundary"], model_path, outputs,
+                     prediction_options=prediction_options, preprocessing_overrides={"executor": "thread"})
+        result = {"status": "sukses", "error": None}
+        logger.info(f"[✔] Area '{area['name']}' selesai.")
+    except Exception as e:
+        result = {"status": "gagal", "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc()}
+        logger.error(f"[!] Area '{area['name']}' gagal: {e}")
+    result.update(name=area["name"], seconds=round(time.perf_counter() - started, 3),
+                  output_dir=os.path.join(output_root, area["name"]))
+    return result
+
+def run_batch(config, logger, areas, model_path, output_root, n_workers=1):
+    """Mode 2 untuk banyak area sekaligus di process pool. Satu area yang gagal tidak menghentikan area lain.
+    Laporan sukses/gagal per area ditulis ke output_root/batch_report.json."""
+    from src.model_cache import load_classifier, process_pool_context
+    os.makedirs(output_root, exist_ok=True)
+    use_lut = config.get("prediction", {}).get("use_lut", True)
+    # Dimuat di proses utama sebelum pool dibuat sehingga worker hasil fork berbagi model yang sama
+    load_classifier(model_path, use_lut)
+
+    logger.info(f"[*] Batch: {len(areas)} area, worker={n_workers}, output={output_root}")
+    if n_workers > 1 and len(areas) > 1:
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=process_pool_context(), initializer=_init_batch_worker,
+                                 initargs=(config, model_path, use_lut)) as pool:
+            results = list(pool.map(_run_batch_area, [config] * len(areas), areas, [model_path] * len(areas), [output_root] * len(areas)))
+    else:
+        results = [_run_batch_area(config, area, model_path, output_root) for area in areas]
+
+    report_path = os.path.join(output_root, "batch_report.json")
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    failed = [result["name"] for result in results if result["status"] != "sukses"]
+    logger.info(f"[✔] Batch selesai: {len(results) - len(failed)} sukses, {len(failed)} gagal. Laporan: {report_path}")
+    if failed:
+        logger.error(f"[!] Area gagal: {', '.join(failed)}")
+    return results
+
+def run_predict_command(config, logger, args):
+    model_path = args.model or default_model_path(config)
+    if not os.path.exists(model_path):
+        logger.error(f"Model tidak ditemukan di: {model_path}. Harap jalankan 'Mode 1' terlebih dahulu atau pastikan model sudah ada.")
+        return 1
+
+    batch_config = config.get("batch", {})
+    output_root = args.output_dir or batch_config.get("output_dir", os.path.join("output", "areas"))
+    n_workers = args.workers or batch_config.get("n_workers", 1)
+    area_args = (args.rgb_from, args.rgb_to, args.boundary)
+
+    if args.manifest:
+        areas = load_manifest(args.manifest)
+    elif any(area_args):
+        if not all(area_args):
+            logger.error("--rgb-from, --rgb-to dan --boundary harus diberikan bersama.")
+            return 2
+        areas = [{"name": args.name, "rgb_from": args.rgb_from, "rgb_to": args.rgb_to, "boundary": args.boundary}]
+    else:
+        # Tanpa manifest maupun path area: Mode 2 dengan path dari config.yaml
+        logger.info("[*] Mode 2: Melakukan Prediksi Menggunakan Model yang Sudah Ada (untuk area lain).")
+        return 0 if run_prediction_with_existing_model(config, logger, model_path) else 1
+
+    results = run_batch(config, logger, areas, model_path, output_root, n_workers)
+    return 0 if all(result["status"] == "sukses" for result in results) else 1
+
+def run_time_series_command(config, logger, args):
+    from src.time_series import add_date, load_series, write_time_series_reports
+    series_config = config.get("time_series", {})
+    series_dir = args.dir or series_config.get("dir", os.path.join("output", "time_series"))
+    top_trajectories = series_config.get("top_trajectories", 50)
+
+    if args.date is None:
+        manifest = load_series(series_dir)
+        if manifest is None:
+            logger.error(f"Deret waktu belum ada di: {series_dir}. Tambahkan tanggal dengan --date dan --ndvi.")
+            return 1
+        write_time_series_reports(series_dir, manifest, top_trajectories=top_trajectories)
+        return 0
+    if not args.ndvi:
+        logger.error("--ndvi harus diberikan bersama --date.")
+        return 2
+
+    boundary_path = args.boundary or series_config.get("boundary") or config["paths"]["boundary"]
+    # Resolusi grid hanya dipakai untuk tanggal pertama; tanggal berikutnya memakai grid yang tersimpan
+    options = preprocess_options(config)
+    options["block_size"] = series_config.get("block_size", options["block_size"])
+    try:
+        add_date(series_dir, args.date, args.ndvi, boundary_path, block_size=options["block_size"],
+                 preprocess_kwargs=options, top_trajectories=top_trajectories)
+    except ValueError as e:
+        logger.error(f"[!] {e}")
+        return 1
+    return 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
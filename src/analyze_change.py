@@ -1,41 +1,58 @@
 import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 import rasterio
 from collections import Counter
 from src.config import CLASS_NAMES, CLASS_MAPPING, CLASS_COLORS
 from src.ndvi_to_class import ndvi_to_class
 
-def compute_area_stats(label_array, pixel_area):
-    counts = Counter(label_array[label_array != 255].flatten())
+NODATA_LABEL = 255
+# Jumlah kemungkinan nilai label uint8, dipakai sebagai panjang histogram
+_N_LABEL_VALUES = 256
+
+def count_labels(label_array, nodata_value=NODATA_LABEL):
+    """Histogram nilai label (panjang 256) tanpa piksel NoData, dihitung secara vektor."""
+    label_array = np.asarray(label_array)
+    valid = label_array[label_array != nodata_value]
+    return np.bincount(valid.ravel().astype(np.intp), minlength=_N_LABEL_VALUES)[:_N_LABEL_VALUES]
+
+
+def count_transitions(from_array, to_array, nodata_value=NODATA_LABEL):
+    """Matriks hitungan transisi 256x256 (dari, ke) untuk piksel yang valid di kedua label."""
+    mask = (from_array != nodata_value) & (to_array != nodata_value)
+    codes = from_array[mask].astype(np.intp) * _N_LABEL_VALUES + to_array[mask].astype(np.intp)
+    counts = np.bincount(codes.ravel(), minlength=_N_LABEL_VALUES * _N_LABEL_VALUES)
+    return counts[:_N_LABEL_VALUES * _N_LABEL_VALUES].reshape(_N_LABEL_VALUES, _N_LABEL_VALUES)
+
+
+def area_stats_from_counts(label_counts, pixel_area):
     stats = []
     # Pastikan urutan kelas konsisten dengan CLASS_NAMES/CLASS_COLORS
     # Kita akan mengurutkan hasil berdasarkan ID kelas untuk konsistensi
     sorted_class_ids = sorted(CLASS_NAMES.keys())
-    
+
     for class_id in sorted_class_ids:
         class_name = CLASS_NAMES.get(class_id, f"Kelas {class_id}")
-        count = counts.get(class_id, 0) # Ambil count, jika tidak ada, default ke 0
+        count = int(label_counts[class_id]) # Kelas yang tidak muncul bernilai 0
         luas_m2 = count * pixel_area
         luas_ha = luas_m2 / 10000
         stats.append({"Kelas": class_name, "Piksel": count, "Luas (m2)": luas_m2, "Luas (ha)": luas_ha})
+    counts = Counter({int(class_id): int(count) for class_id, count in enumerate(label_counts) if count})
     return stats, counts
 
 
-def compute_transition_matrix(from_array, to_array):
-    mask = (from_array != 255) & (to_array != 255)
-    flat_from = from_array[mask].flatten()
-    flat_to = to_array[mask].flatten()
-
+def transition_matrix_from_counts(transition_counts):
     labels = sorted(CLASS_NAMES.keys())
-    matrix = pd.DataFrame(0, index=[CLASS_NAMES[i] for i in labels], columns=[CLASS_NAMES[i] for i in labels])
+    names = [CLASS_NAMES[i] for i in labels]
+    return pd.DataFrame(transition_counts[np.ix_(labels, labels)].astype(np.int64), index=names, columns=names)
+
+
+def compute_area_stats(label_array, pixel_area):
+    return area_stats_from_counts(count_labels(label_array), pixel_area)
 
-    for f, t in zip(flat_from, flat_to):
-        matrix.at[CLASS_NAMES[f], CLASS_NAMES[t]] += 1
 
-    return matrix
+def compute_transition_matrix(from_array, to_array):
+    return transition_matrix_from_counts(count_transitions(from_array, to_array))
 
 
 def save_stats_to_csv(stats, filename):
@@ -43,7 +60,10 @@ def save_stats_to_csv(stats, filename):
     df.to_csv(filename, index=False)
 
 
+# matplotlib/seaborn hanya dimuat oleh fungsi plot, sehingga detect_change (yang memakai fungsi hitung
+# di modul ini) tidak ikut memuatnya
 def plot_bar_comparison(stats_from, stats_to, output_dir):
+    import matplotlib.pyplot as plt
     labels = [s["Kelas"] for s in stats_from] # Asumsi kelas sama
     luas_from = [s["Luas (ha)"] for s in stats_from]
     luas_to = [s["Luas (ha)"] for s in stats_to]
@@ -71,6 +91,7 @@ def plot_bar_comparison(stats_from, stats_to, output_dir):
 
 
 def plot_pie_chart(stats, tahun, output_dir):
+    import matplotlib.pyplot as plt
     # Urutan kelas yang diinginkan untuk plotting (sesuai dengan gambar contoh)
     desired_plot_order = ["Vegetasi Tinggi", "Non-Vegetasi", "Vegetasi Sedang"]
 
@@ -100,6 +121,8 @@ def plot_pie_chart(stats, tahun, output_dir):
 
 
 def plot_transition_heatmap(csv_path, output_dir):
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     df = pd.read_csv(csv_path, index_col=0)
 
     plt.figure(figsize=(8, 6))
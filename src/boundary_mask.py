@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+import fiona
+from rasterio.crs import CRS
+from rasterio.features import geometry_mask
+from rasterio.warp import transform_geom
+from rasterio.windows import Window, transform as window_transform
+from src.utils import iter_block_windows
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Status blok terhadap batas area
+OUTSIDE, INSIDE, PARTIAL = 0, 1, 2
+
+# Direktori cache default; dapat diganti lewat set_cache_dir (mis. dari config.yaml)
+_cache_dir = os.path.join("output", "preprocessed", "boundary_masks")
+# Cache dalam proses agar mask yang sama tidak dibaca ulang dari disk
+_loaded = {}
+# Hash geometri per (file batas, mtime, CRS grid) agar shapefile tidak dibuka ulang hanya untuk kunci cache
+_geometry_digests = {}
+_lock = threading.Lock()
+
+def set_cache_dir(cache_dir):
+    global _cache_dir
+    _cache_dir = cache_dir
+
+class BoundaryMask:
+    """Mask batas area yang dirasterisasi ke satu grid dan disimpan bit-packed (1 bit per piksel).
+
+    True = piksel di dalam batas. Mask dibongkar hanya per jendela sehingga memori tetap kecil.
+    """
+
+    def __init__(self, packed, shape):
+        self.packed = packed
+        self.shape = tuple(shape)
+
+    @property
+    def height(self):
+        return self.shape[0]
+
+    @property
+    def width(self):
+        return self.shape[1]
+
+    def read(self, window=None):
+        """Mask boolean untuk satu jendela (atau seluruh grid jika window None)."""
+        if window is None:
+            window = Window(0, 0, self.width, self.height)
+        row_off, col_off = int(window.row_off), int(window.col_off)
+        height, width = int(window.height), int(window.width)
+        byte_start, byte_stop = col_off // 8, -(-(col_off + width) // 8)
+        bits = np.unpackbits(self.packed[row_off:row_off + height, byte_start:byte_stop], axis=1)
+        start = col_off - byte_start * 8
+        return bits[:, start:start + width].astype(bool)
+
+    def block_status(self, window):
+        """OUTSIDE jika jendela sepenuhnya di luar batas, INSIDE jika sepenuhnya di dalam, selain itu PARTIAL."""
+        inside = self.read(window)
+        if not inside.any():
+            return OUTSIDE
+        if inside.all():
+            return INSIDE
+        return PARTIAL
+
+    def iter_blocks(self, block_size=None):
+        """Iterasi (window, status) dengan urutan yang sama seperti utils.iter_block_windows."""
+        for window in iter_block_windows(self.width, self.height, block_size):
+            yield window, self.block_status(window)
+
+    def count(self, chunk_rows=1024):
+        """Jumlah piksel di dalam batas (dibongkar per potongan baris)."""
+        return int(sum(np.unpackbits(self.packed[i:i + chunk_rows]).sum() for i in range(0, self.height, chunk_rows)))
+
+def _load_geometries(boundary_path, crs):
+    with fiona.open(boundary_path, "r") as shapefile:
+        geoms = [feature["geometry"] for feature in shapefile]
+        boundary_crs = CRS.from_user_input(shapefile.crs_wkt) if shapefile.crs_wkt else None
+    # Samakan CRS batas dengan grid jika berbeda
+    if boundary_crs is not None and crs is not None and boundary_crs != CRS.from_user_input(crs):
+        geoms = [transform_geom(boundary_crs, crs, geom) for geom in geoms]
+    return [geom.__geo_interface__ if hasattr(geom, "__geo_interface__") else geom for geom in geoms]
+
+def _boundary_stamp(boundary_path):
+    """(path, [(file, mtime_ns, ukuran), ...]) untuk shapefile beserta file pendampingnya."""
+    path = os.path.abspath(boundary_path)
+    stem = os.path.splitext(path)[0]
+    directory, prefix = os.path.dirname(path), os.path.basename(stem) + "."
+    files = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+    return path, tuple((name, os.stat(os.path.join(directory, name)).st_mtime_ns, os.stat(os.path.join(directory, name)).st_size)
+                       for name in files)
+
+def _geometry_digest(boundary_path, crs):
+    crs_wkt = CRS.from_user_input(crs).to_wkt() if crs is not None else None
+    stamp = (_boundary_stamp(boundary_path), crs_wkt)
+    with _lock:
+        if stamp in _geometry_digests:
+            return _geometry_digests[stamp]
+    geoms = _load_geometries(boundary_path, crs)
+    digest = hashlib.sha1(json.dumps(geoms, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    with _lock:
+        _geometry_digests[stamp] = digest
+    return digest
+
+def _mask_key(geometry_digest, crs, transform, shape, all_touched):
+    payload = json.dumps({
+        "geoms": geometry_digest,
+        "crs": CRS.from_user_input(crs).to_wkt() if crs is not None else None,
+        "transform": [round(v, 9) for v in tuple(transform)[:6]],
+        "shape": list(shape),
+        "all_touched": all_touched,
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _rasterize_packed(geoms, transform, shape, all_touched, strip_rows):
+    """Rasterisasi per pita baris lalu langsung di-pack, sehingga mask boolean penuh H x W tidak pernah dibuat."""
+    height, width = shape
+    packed = np.zeros((height, -(-width // 8)), dtype=np.uint8)
+    for row_off in range(0, height, strip_rows):
+        window = Window(0, row_off, width, min(strip_rows, height - row_off))
+        inside = geometry_mask(geoms, out_shape=(int(window.height), width), transform=window_transform(window, transform),
+                               invert=True, all_touched=all_touched)
+        packed[row_off:row_off + int(window.height)] = np.packbits(inside, axis=1)
+    return packed
+
+def get_boundary_mask(boundary_path, crs, transform, shape, all_touched=False, cache_dir=None, strip_rows=1024):
+    """Rasterisasi batas ke grid (crs, transform, shape) sekali lalu gunakan ulang.
+
+    Mask disimpan bit-packed di cache_dir dengan nama hash dari geometri dan grid,
+    sehingga setiap tahap (crop, ekstraksi fitur, prediksi, deteksi perubahan) memakai mask yang sama.
+    Rasterisasi dilakukan per strip_rows baris; memori sementara sebanding dengan satu pita.
+    """
+    cache_dir = cache_dir or _cache_dir
+    shape = tuple(int(v) for v in shape)
+    key = _mask_key(_geometry_digest(boundary_path, crs), crs, transform, shape, all_touched)
+
+    with _lock:
+        if key in _loaded:
+            return _loaded[key]
+
+    cache_path = os.path.join(cache_dir, f"{key}.npy")
+    if os.path.exists(cache_path):
+        packed = np.load(cache_path)
+    else:
+        packed = _rasterize_packed(_load_geometries(boundary_path, crs), transform, shape, all_touched, strip_rows)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp.npy"
+        np.save(tmp_path, packed)
+        os.replace(tmp_path, cache_path)
+        logger.info(f"[*] Mask batas disimpan ke cache: {cache_path}")
+
+    boundary_mask = BoundaryMask(packed, shape)
+    with _lock:
+        _loaded[key] = boundary_mask
+    return boundary_mask
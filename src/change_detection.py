@@ -2,49 +2,84 @@ import rasterio
 import numpy as np
 import pandas as pd
 import os
+from contextlib import ExitStack
 from src.config import CLASS_NAMES
+from src.analyze_change import count_labels, count_transitions, area_stats_from_counts, transition_matrix_from_counts
+from src.utils import iter_block_windows
+from src.boundary_mask import get_boundary_mask, OUTSIDE, INSIDE, PARTIAL
+from src.raster_io import open_raster_for_write
 
-def detect_change(label_from_path, label_to_path, output_raster_path, stats_csv_path):
+# Kode perubahan = dari * 10 + ke, sehingga kode terbesar untuk label uint8 adalah 255 * 10 + 255
+_N_CHANGE_CODES = 255 * 10 + 255 + 1
+
+def detect_change(label_from_path, label_to_path, output_raster_path, stats_csv_path, block_size=1024, extra_raster_paths=(), boundary_path=None):
+    """Deteksi perubahan dalam satu lintasan berjendela.
+
+    Setiap raster label dibaca satu kali, jendela per jendela. Dari lintasan yang sama dihasilkan
+    peta perubahan (juga ditulis ke extra_raster_paths, mis. salinan GeoTIFF peta statis),
+    statistik per transisi (stats_csv_path), statistik luas kelas awal/akhir, dan matriks transisi.
+    Jika boundary_path diberikan, blok yang sepenuhnya di luar batas tidak dibaca.
+    Mengembalikan (stats_from, stats_to, transition_matrix).
+    """
     with rasterio.open(label_from_path) as src_from, rasterio.open(label_to_path) as src_to:
-        label_from = src_from.read(1)
-        label_to = src_to.read(1)
+        if src_from.shape != src_to.shape:
+            raise ValueError("Ukuran label_from dan label_to tidak sama")
+
         profile = src_from.profile
         nodata_value = src_from.nodata if src_from.nodata is not None else 255 # Assume 255 if not explicitly set
 
-    if label_from.shape != label_to.shape:
-        raise ValueError("Ukuran label_from dan label_to tidak sama")
+        # Update profil raster output
+        profile.update(dtype=rasterio.int16, count=1, nodata=nodata_value)
 
-    # Inisialisasi peta perubahan dengan nilai nodata
-    change_map = np.full(label_from.shape, nodata_value, dtype=np.int16)
+        code_counts = np.zeros(_N_CHANGE_CODES, dtype=np.int64)
+        counts_from = np.zeros(256, dtype=np.int64)
+        counts_to = np.zeros(256, dtype=np.int64)
+        transitions = np.zeros((256, 256), dtype=np.int64)
 
-    # Buat mask untuk piksel yang valid (bukan nodata di kedua label)
-    valid_mask = (label_from != nodata_value) & (label_to != nodata_value)
+        with ExitStack() as stack:
+            destinations = []
+            for path in (output_raster_path, *extra_raster_paths):
+                destinations.append(stack.enter_context(open_raster_for_write(path, profile)))
 
-    # Hitung perubahan hanya untuk piksel yang valid
-    change_map[valid_mask] = (label_from[valid_mask].astype(np.int16) * 10) + label_to[valid_mask].astype(np.int16)
+            boundary = get_boundary_mask(boundary_path, src_from.crs, src_from.transform, src_from.shape) if boundary_path else None
+            for window in iter_block_windows(src_from.width, src_from.height, block_size):
+                status = boundary.block_status(window) if boundary is not None else INSIDE
+                # Inisialisasi peta perubahan dengan nilai nodata
+                change_map = np.full((int(window.height), int(window.width)), nodata_value, dtype=np.int16)
+                if status == OUTSIDE:
+                    for dst in destinations:
+                        dst.write(change_map, 1, window=window)
+                    continue
 
-    # Update profil raster output
-    profile.update(dtype=rasterio.int16, count=1, nodata=nodata_value)
+                label_from = src_from.read(1, window=window)
+                label_to = src_to.read(1, window=window)
+                if status == PARTIAL:
+                    outside = ~boundary.read(window)
+                    label_from[outside] = nodata_value
+                    label_to[outside] = nodata_value
 
-    os.makedirs(os.path.dirname(output_raster_path), exist_ok=True)
-    with rasterio.open(output_raster_path, "w", **profile) as dst:
-        dst.write(change_map, 1)
+                # Buat mask untuk piksel yang valid (bukan nodata di kedua label)
+                valid_mask = (label_from != nodata_value) & (label_to != nodata_value)
 
-    # Hitung statistik perubahan
-    # Filter nodata dari perhitungan statistik
-    unique, counts = np.unique(change_map[change_map != nodata_value], return_counts=True)
-    stats = []
+                # Hitung perubahan hanya untuk piksel yang valid
+                change_map[valid_mask] = (label_from[valid_mask].astype(np.int16) * 10) + label_to[valid_mask].astype(np.int16)
 
-    # Gunakan CLASS_NAMES dari config
-    # label_dict = {
-    #     0: "Non-Vegetasi",
-    #     1: "Vegetasi Sedang",
-    #     2: "Vegetasi Tinggi"
-    # }
+                for dst in destinations:
+                    dst.write(change_map, 1, window=window)
 
+                # Akumulasi statistik dari blok yang sama
+                # Filter nodata dari perhitungan statistik
+                code_counts += np.bincount(change_map[change_map != nodata_value].astype(np.intp), minlength=_N_CHANGE_CODES)[:_N_CHANGE_CODES]
+                counts_from += count_labels(label_from, nodata_value)
+                counts_to += count_labels(label_to, nodata_value)
+                transitions += count_transitions(label_from, label_to, nodata_value)
+
+    # Hitung statistik perubahan
+    stats = []
     pixel_area = abs(profile["transform"][0] * profile["transform"][4])
 
-    for code, count in zip(unique, counts):
+    for code in np.flatnonzero(code_counts):
+        count = code_counts[code]
         dari = code // 10
         ke = code % 10
         stats.append({
@@ -59,3 +94,7 @@ def detect_change(label_from_path, label_to_path, output_raster_path, stats_csv_
     df = pd.DataFrame(stats)
     df.to_csv(stats_csv_path, index=False)
     print(f"✅ Deteksi perubahan selesai. Hasil disimpan ke: {output_raster_path} dan {stats_csv_path}")
+
+    stats_from, _ = area_stats_from_counts(counts_from, pixel_area)
+    stats_to, _ = area_stats_from_counts(counts_to, pixel_area)
+    return stats_from, stats_to, transition_matrix_from_counts(transitions)
@@ -2,36 +2,165 @@
 
 import numpy as np
 import rasterio
-from sklearn.metrics import classification_report, confusion_matrix, accuracy_score
-import matplotlib.pyplot as plt
-import seaborn as sns
 import os
 # from .ndvi_to_class import ndvi_to_class # Hapus impor ini karena tidak lagi mengklasifikasikan ulang
 from .config import CLASS_NAMES # Pastikan ini diimpor
+from .utils import iter_block_windows
+import logging
 
-def evaluate_model(predicted_path, ground_truth_ndvi_path, output_dir="output"):
-    os.makedirs(output_dir, exist_ok=True)
+logger = logging.getLogger(__name__)
 
-    # Baca hasil prediksi
-    with rasterio.open(predicted_path) as pred_src:
-        pred = pred_src.read(1)
-        pred_nodata = pred_src.nodata if pred_src.nodata is not None else 255
+# Label uint8 memiliki 256 kemungkinan nilai; matriks penuh 256 x 256 cukup kecil untuk diakumulasi per blok
+_N_LABEL_VALUES = 256
 
-    # Baca ground truth labels (ini sudah diklasifikasikan dari step sebelumnya)
-    with rasterio.open(ground_truth_ndvi_path) as gt_src:
-        gt_labels = gt_src.read(1) # Langsung baca sebagai label
+def accumulate_confusion(predicted_path, ground_truth_path, block_size=1024):
+    """Matriks kebingungan penuh (256 x 256, baris = ground truth, kolom = prediksi) dihitung blok per blok
+    dengan bincount. Piksel NoData pada salah satu raster diabaikan."""
+    counts = np.zeros(_N_LABEL_VALUES * _N_LABEL_VALUES, dtype=np.int64)
+    with rasterio.open(predicted_path) as pred_src, rasterio.open(ground_truth_path) as gt_src:
+        if pred_src.shape != gt_src.shape:
+            raise ValueError("Ukuran raster prediksi dan ground truth tidak sama")
+        pred_nodata = pred_src.nodata if pred_src.nodata is not None else 255
         gt_nodata = gt_src.nodata if gt_src.nodata is not None else 255
 
-    # Filter NoData
-    mask = (gt_labels != gt_nodata) & (pred != pred_nodata)
-    y_true = gt_labels[mask].flatten()
-    y_pred = pred[mask].flatten()
+        for window in iter_block_windows(pred_src.width, pred_src.height, block_size):
+            pred = pred_src.read(1, window=window)
+            gt_labels = gt_src.read(1, window=window) # Langsung baca sebagai label
+
+            # Filter NoData
+            mask = (gt_labels != gt_nodata) & (pred != pred_nodata)
+            codes = gt_labels[mask].astype(np.int64) * _N_LABEL_VALUES + pred[mask].astype(np.int64)
+            counts += np.bincount(codes, minlength=counts.size)
+    return counts.reshape(_N_LABEL_VALUES, _N_LABEL_VALUES)
+
+def _divide(numerator, denominator):
+    # Sama dengan zero_division="warn" di sklearn: pembagian dengan nol menghasilkan 0.0
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+def metrics_from_confusion(full_matrix, labels):
+    """Precision, recall, F1 dan support per label serta akurasi dari matriks kebingungan penuh,
+    dengan definisi yang sama seperti sklearn.metrics (labels diberikan eksplisit)."""
+    labels = list(labels)
+    tp = full_matrix[labels, labels]
+    pred_sum = full_matrix[:, labels].sum(axis=0)
+    true_sum = full_matrix[labels, :].sum(axis=1)
+    total = full_matrix.sum()
+    return {
+        "precision": _divide(tp, pred_sum),
+        "recall": _divide(tp, true_sum),
+        "f1": _divide(2 * tp, true_sum + pred_sum),
+        "support": true_sum,
+        "tp": tp,
+        "pred_sum": pred_sum,
+        "accuracy": float(np.trace(full_matrix) / total) if total else 0.0,
+    }
+
+def format_classification_report(full_matrix, labels, target_names, digits=4):
+    """Laporan teks dengan format yang sama persis seperti sklearn.metrics.classification_report."""
+    metrics = metrics_from_confusion(full_matrix, labels)
+    precision, recall, f1, support = metrics["precision"], metrics["recall"], metrics["f1"], metrics["support"]
+
+    headers = ["precision", "recall", "f1-score", "support"]
+    longest_last_line_heading = "weighted avg"
+    name_width = max(len(cn) for cn in target_names)
+    width = max(name_width, len(longest_last_line_heading), digits)
+    head_fmt = "{:>{width}s} " + " {:>9}" * len(headers)
+    report = head_fmt.format("", *headers, width=width)
+    report += "\n\n"
+    row_fmt = "{:>{width}s} " + " {:>9.{digits}f}" * 3 + " {:>9}\n"
+    for row in zip(target_names, precision, recall, f1, support):
+        report += row_fmt.format(*row, width=width, digits=digits)
+    report += "\n"
+
+    # Baris "accuracy" hanya dipakai jika semua label yang muncul termasuk dalam labels, selain itu "micro avg"
+    present = set(np.flatnonzero(full_matrix.sum(axis=1) + full_matrix.sum(axis=0)))
+    micro_is_accuracy = set(labels) >= present
+    tp_total, pred_total, true_total = metrics["tp"].sum(), metrics["pred_sum"].sum(), support.sum()
+    averages = {
+        "micro": (_divide(tp_total, pred_total), _divide(tp_total, true_total), _divide(2 * tp_total, true_total + pred_total)),
+        "macro": (np.mean(precision), np.mean(recall), np.mean(f1)),
+        "weighted": tuple(np.average(values, weights=support) if support.sum() else 0.0 for values in (precision, recall, f1)),
+    }
+    for average, (avg_p, avg_r, avg_f1) in averages.items():
+        avg = [avg_p, avg_r, avg_f1, np.sum(support)]
+        if average == "micro" and micro_is_accuracy:
+            row_fmt_accuracy = "{:>{width}s} " + " {:>9.{digits}}" * 2 + " {:>9.{digits}f}" + " {:>9}\n"
+            report += row_fmt_accuracy.format("accuracy", "", "", *avg[2:], width=width, digits=digits)
+        else:
+            report += row_fmt.format(f"{average} avg", *avg, width=width, digits=digits)
+    return report
+
+def stratified_sample_confusion(full_matrix, labels, sample_size, rng):
+    """Sampel berstrata (per kelas ground truth) berukuran tetap, diambil tanpa pengembalian langsung dari
+    matriks kebingungan: setiap piksel adalah satu pasangan (ground truth, prediksi), jadi raster tidak perlu dibaca ulang.
+    Alokasi proporsional terhadap jumlah piksel per kelas (minimal 1). Mengembalikan (sampel per strata, bobot strata)."""
+    rows = full_matrix[list(labels), :]
+    stratum_sizes = rows.sum(axis=1)
+    total = stratum_sizes.sum()
+    allocation = np.minimum(stratum_sizes, np.maximum(1, np.round(sample_size * stratum_sizes / max(total, 1)).astype(np.int64)))
+    allocation[stratum_sizes == 0] = 0
+    samples = np.zeros_like(rows)
+    for i, n in enumerate(allocation):
+        if n:
+            samples[i] = rng.multivariate_hypergeometric(rows[i], n)
+    return samples, stratum_sizes
+
+def bootstrap_confidence_intervals(full_matrix, labels, target_names, sample_size=100_000, n_boot=1000, confidence=0.95, random_state=42):
+    """Interval kepercayaan bootstrap untuk akurasi dan precision/recall/F1 per kelas.
+
+    Bootstrap dilakukan pada sampel berstrata berukuran tetap (lihat stratified_sample_confusion), bukan pada
+    seluruh piksel: setiap ulangan me-resample setiap strata dengan pengembalian (multinomial) lalu
+    menskalakan kembali ke ukuran strata populasi. Mengembalikan DataFrame (Metrik, Kelas, Estimasi, Bawah, Atas).
+    """
+    import pandas as pd
+    rng = np.random.default_rng(random_state)
+    labels = list(labels)
+    samples, stratum_sizes = stratified_sample_confusion(full_matrix, labels, sample_size, rng)
+    sample_sizes = samples.sum(axis=1)
+
+    def estimated_matrix(stratum_counts):
+        # Skala setiap strata ke ukuran populasinya sehingga estimasi tetap tak bias untuk alokasi apa pun
+        scale = _divide(stratum_sizes, sample_sizes)[:, None]
+        matrix = np.zeros(full_matrix.shape, dtype=np.float64)
+        matrix[labels, :] = stratum_counts * scale
+        return matrix
+
+    def statistics(matrix):
+        metrics = metrics_from_confusion(matrix, labels)
+        return np.concatenate([[metrics["accuracy"]], metrics["precision"], metrics["recall"], metrics["f1"]])
+
+    replicates = np.empty((n_boot, 1 + 3 * len(labels)))
+    for b in range(n_boot):
+        resampled = np.zeros_like(samples)
+        for i, n in enumerate(sample_sizes):
+            if n:
+                resampled[i] = rng.multinomial(n, samples[i] / n)
+        replicates[b] = statistics(estimated_matrix(resampled))
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(replicates, [alpha, 1 - alpha], axis=0)
+    estimate = statistics(full_matrix)
+    names = [("Akurasi", "Semua")] + [(metric, name) for metric in ("Precision", "Recall", "F1") for name in target_names]
+    return pd.DataFrame([
+        {"Metrik": metric, "Kelas": name, "Estimasi": est, "Bawah": lo, "Atas": hi}
+        for (metric, name), est, lo, hi in zip(names, estimate, lower, upper)
+    ])
+
+def evaluate_model(predicted_path, ground_truth_ndvi_path, output_dir="output", block_size=1024, bootstrap=None):
+    """Evaluasi berjendela: matriks kebingungan diakumulasi blok per blok, lalu semua metrik dihitung dari matriks itu.
+    bootstrap (opsional, lihat config.yaml evaluation.bootstrap) menambahkan interval kepercayaan dari sampel berstrata."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    full_matrix = accumulate_confusion(predicted_path, ground_truth_ndvi_path, block_size=block_size)
 
     # Evaluasi
-    class_labels = [CLASS_NAMES[i] for i in sorted(CLASS_NAMES.keys())]
-    report = classification_report(y_true, y_pred, target_names=class_labels, labels=[0, 1, 2], digits=4)
-    acc = accuracy_score(y_true, y_pred)
-    cm = confusion_matrix(y_true, y_pred, labels=[0, 1, 2])
+    labels = sorted(CLASS_NAMES.keys())
+    class_labels = [CLASS_NAMES[i] for i in labels]
+    report = format_classification_report(full_matrix, labels, class_labels, digits=4)
+    acc = metrics_from_confusion(full_matrix, labels)["accuracy"]
+    cm = full_matrix[np.ix_(labels, labels)]
 
     print("=== Classification Report ===")
     print(report)
@@ -42,7 +171,20 @@ def evaluate_model(predicted_path, ground_truth_ndvi_path, output_dir="output"):
         f.write(report)
         f.write(f"\nAkurasi: {acc:.4f}")
 
+    if bootstrap and bootstrap.get("enabled", False):
+        intervals = bootstrap_confidence_intervals(
+            full_matrix, labels, class_labels,
+            sample_size=bootstrap.get("sample_size", 100_000),
+            n_boot=bootstrap.get("n_boot", 1000),
+            confidence=bootstrap.get("confidence", 0.95),
+            random_state=bootstrap.get("random_state", 42)
+        )
+        intervals.to_csv(os.path.join(output_dir, "confidence_intervals.csv"), index=False)
+        logger.info(f"[✔] Interval kepercayaan bootstrap disimpan ke: {os.path.join(output_dir, 'confidence_intervals.csv')}")
+
     # Simpan confusion matrix
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     plt.figure(figsize=(6, 5))
     sns.heatmap(cm, annot=True, fmt="d", cmap="Blues", xticklabels=class_labels, yticklabels=class_labels)
     plt.xlabel("Prediksi")
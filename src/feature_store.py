@@ -0,0 +1,174 @@
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from src.features import check_derived_features, compute_derived_features, DERIVED_FEATURES
+from src.model import iter_training_blocks
+from src.preprocessing import file_signature
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Naikkan versi ini jika isi atau format feature store berubah agar store lama tidak dipakai lagi
+FEATURE_STORE_VERSION = 1
+META_NAME = "meta.json"
+# Ukuran buffer saat menyalin data mentah ke file .npy
+_COPY_BUFFER = 16 * 1024 * 1024
+
+def feature_store_key(rgb_path, label_path, boundary_path, block_size=1024, hash_contents=False):
+    # block_size ikut dalam kunci karena menentukan batas blok yang disimpan (meta["blocks"])
+    payload = json.dumps({
+        "version": FEATURE_STORE_VERSION,
+        "block_size": block_size,
+        "rgb": file_signature(rgb_path, hash_contents),
+        "label": file_signature(label_path, hash_contents),
+        "boundary": file_signature(boundary_path, hash_contents) if boundary_path else None,
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _feature_file(name):
+    return f"feature_{name}.npy"
+
+def _raw_to_npy(raw_path, npy_path, dtype, shape):
+    """Ubah file biner mentah (ditulis blok demi blok) menjadi .npy dengan header yang benar."""
+    with open(raw_path, "rb") as src, open(npy_path, "wb") as dst:
+        np.lib.format.write_array_header_1_0(dst, {"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                                                   "fortran_order": False, "shape": shape})
+        shutil.copyfileobj(src, dst, _COPY_BUFFER)
+    os.remove(raw_path)
+
+def _read_meta(store_path):
+    with open(os.path.join(store_path, META_NAME), encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_meta(store_path, meta):
+    path = os.path.join(store_path, META_NAME)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, path)
+
+def _build(rgb_path, label_path, boundary_path, store_path, derived_features, block_size):
+    """Satu kali baca RGB + label per jendela; band, label dan fitur turunan ditulis berurutan ke disk."""
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    names = ["bands", "labels"] + [_feature_file(name) for name in derived_features]
+    raw_paths = {name: os.path.join(tmp_path, f"{name}.raw") for name in names}
+    files = {name: open(path, "wb") for name, path in raw_paths.items()}
+    blocks, band_dtype, n_bands = [], None, None
+    try:
+        for X_block, y_block in iter_training_blocks(rgb_path, label_path, block_size, boundary_path=boundary_path):
+            band_dtype, n_bands = X_block.dtype, X_block.shape[1]
+            files["bands"].write(np.ascontiguousarray(X_block).tobytes())
+            files["labels"].write(y_block.astype(np.uint8).tobytes())
+            for name, column in zip(derived_features, compute_derived_features(X_block, derived_features).T):
+                files[_feature_file(name)].write(np.ascontiguousarray(column).tobytes())
+            blocks.append(len(y_block))
+    finally:
+        for f in files.values():
+            f.close()
+
+    if band_dtype is None:
+        shutil.rmtree(tmp_path)
+        raise ValueError("Tidak ada piksel valid untuk feature store (periksa RGB, label dan batas).")
+    n_rows = sum(blocks)
+    _raw_to_npy(raw_paths["bands"], os.path.join(tmp_path, "bands.npy"), band_dtype, (n_rows, n_bands))
+    _raw_to_npy(raw_paths["labels"], os.path.join(tmp_path, "labels.npy"), np.uint8, (n_rows,))
+    for name in derived_features:
+        _raw_to_npy(raw_paths[_feature_file(name)], os.path.join(tmp_path, _feature_file(name)), np.float32, (n_rows,))
+    _write_meta(tmp_path, {
+        "version": FEATURE_STORE_VERSION,
+        "inputs": {"rgb": os.path.abspath(rgb_path), "label": os.path.abspath(label_path),
+                   "boundary": os.path.abspath(boundary_path) if boundary_path else None},
+        "n_rows": n_rows,
+        "n_bands": n_bands,
+        "block_size": block_size,
+        "blocks": blocks,
+        "features": list(derived_features),
+    })
+    try:
+        os.replace(tmp_path, store_path)
+    except OSError:
+        # Proses lain sudah menyelesaikan store yang sama lebih dulu
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def _add_features(store_path, meta, names, chunk_rows=1 << 20):
+    """Hitung fitur turunan baru dari band yang tersimpan (memmap), tanpa membaca citra."""
+    bands = np.load(os.path.join(store_path, "bands.npy"), mmap_mode="r")
+    for name in names:
+        path = os.path.join(store_path, _feature_file(name))
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        column = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float32, shape=(meta["n_rows"],))
+        for start in range(0, meta["n_rows"], chunk_rows):
+            column[start:start + chunk_rows] = DERIVED_FEATURES[name](bands[start:start + chunk_rows])
+        column.flush()
+        del column
+        os.replace(tmp_path, path)
+        meta["features"].append(name)
+        logger.info(f"[✔] Fitur turunan '{name}' ditambahkan ke feature store dari band tersimpan.")
+    _write_meta(store_path, meta)
+
+def _remove_stale_stores(store_dir, store_path):
+    """Hapus store lama dari path input yang sama (isi input sudah berubah sehingga kuncinya berbeda)."""
+    inputs = _read_meta(store_path)["inputs"]
+    for name in os.listdir(store_dir):
+        other_path = os.path.join(store_dir, name)
+        if other_path == store_path or not os.path.exists(os.path.join(other_path, META_NAME)):
+            continue
+        if _read_meta(other_path).get("inputs") == inputs:
+            shutil.rmtree(other_path, ignore_errors=True)
+            logger.info(f"[*] Feature store lama dihapus: {other_path}")
+
+def build_feature_store(rgb_path, label_path, boundary_path, store_dir, derived_features=(), block_size=1024, hash_contents=False):
+    """Feature store untuk (RGB, label, batas): band dan label piksel valid sebagai .npy, plus satu
+    .npy float32 per fitur turunan. Dibangun sekali dengan satu kali baca per jendela dan dipakai ulang
+    selama input tidak berubah; fitur turunan yang belum ada dihitung dari band yang tersimpan.
+    Mengembalikan path store.
+    """
+    derived_features = check_derived_features(derived_features)
+    store_path = os.path.join(store_dir, feature_store_key(rgb_path, label_path, boundary_path, block_size, hash_contents))
+    if os.path.exists(os.path.join(store_path, META_NAME)):
+        meta = _read_meta(store_path)
+        missing = [name for name in derived_features if name not in meta["features"]]
+        if missing:
+            _add_features(store_path, meta, missing)
+        logger.info(f"[✔] Feature store dipakai ulang: {store_path} ({meta['n_rows']} piksel)")
+        return store_path
+
+    logger.info(f"[*] Membangun feature store: {store_path}")
+    os.makedirs(store_dir, exist_ok=True)
+    _build(rgb_path, label_path, boundary_path, store_path, derived_features, block_size)
+    _remove_stale_stores(store_dir, store_path)
+    logger.info(f"[✔] Feature store disimpan: {store_path} ({_read_meta(store_path)['n_rows']} piksel)")
+    return store_path
+
+def load_feature_store(store_path, derived_features=()):
+    """(X, y) dari feature store. Tanpa fitur turunan, X dan y adalah memmap read-only (tanpa biaya muat);
+    dengan fitur turunan, X berisi band lalu kolom fitur (float32) sesuai urutan derived_features."""
+    bands = np.load(os.path.join(store_path, "bands.npy"), mmap_mode="r")
+    labels = np.load(os.path.join(store_path, "labels.npy"), mmap_mode="r")
+    if not derived_features:
+        return bands, labels
+    columns = [np.load(os.path.join(store_path, _feature_file(name)), mmap_mode="r") for name in derived_features]
+    return np.column_stack([bands.astype(np.float32), *columns]), labels
+
+def iter_store_blocks(store_path, derived_features=()):
+    """Iterasi (X, y) per blok seperti iter_training_blocks, tetapi dari feature store.
+
+    Blok sama dengan jendela saat store dibangun, sehingga sampling dengan block_size yang sama
+    menghasilkan sampel yang identik dengan membaca citra langsung.
+    """
+    meta = _read_meta(store_path)
+    bands = np.load(os.path.join(store_path, "bands.npy"), mmap_mode="r")
+    labels = np.load(os.path.join(store_path, "labels.npy"), mmap_mode="r")
+    columns = [np.load(os.path.join(store_path, _feature_file(name)), mmap_mode="r") for name in derived_features]
+    start = 0
+    for n_rows in meta["blocks"]:
+        stop = start + n_rows
+        X_block = np.asarray(bands[start:stop])
+        if columns:
+            X_block = np.column_stack([X_block.astype(np.float32), *(np.asarray(column[start:stop]) for column in columns)])
+        yield X_block, np.asarray(labels[start:stop])
+        start = stop
@@ -0,0 +1,69 @@
+import numpy as np
+
+# Fitur turunan per piksel dari band R, G, B (urutan band citra RGB). Semua hanya bergantung pada
+# nilai RGB piksel itu sendiri, sehingga dapat dihitung dari fitur yang tersimpan tanpa membaca citra.
+
+def _safe_ratio(numerator, denominator):
+    # Penyebut nol (mis. piksel hitam) menghasilkan 0, bukan inf/NaN
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+def _rgb(bands):
+    bands = np.asarray(bands, dtype=np.float32)
+    return bands[:, 0], bands[:, 1], bands[:, 2]
+
+def excess_green(bands):
+    """ExG = 2G - R - B"""
+    r, g, b = _rgb(bands)
+    return 2 * g - r - b
+
+def ngrdi(bands):
+    """Normalized Green-Red Difference Index = (G - R) / (G + R)"""
+    r, g, _ = _rgb(bands)
+    return _safe_ratio(g - r, g + r)
+
+def vari(bands):
+    """Visible Atmospherically Resistant Index = (G - R) / (G + R - B)"""
+    r, g, b = _rgb(bands)
+    return _safe_ratio(g - r, g + r - b)
+
+DERIVED_FEATURES = {
+    "exg": excess_green,
+    "ngrdi": ngrdi,
+    "vari": vari,
+}
+
+def check_derived_features(names):
+    unknown = [name for name in names if name not in DERIVED_FEATURES]
+    if unknown:
+        raise ValueError(f"Fitur turunan tidak dikenal: {', '.join(unknown)} (pilihan: {', '.join(DERIVED_FEATURES)})")
+    return list(names)
+
+def compute_derived_features(bands, names):
+    """Array float32 (n, len(names)) berisi fitur turunan untuk baris band (n, C)."""
+    return np.column_stack([DERIVED_FEATURES[name](bands) for name in names]).astype(np.float32) if names \
+        else np.empty((len(bands), 0), dtype=np.float32)
+
+def with_derived_features(bands, names):
+    """Band RGB ditambah kolom fitur turunan; tanpa fitur turunan band dikembalikan apa adanya."""
+    if not names:
+        return bands
+    return np.column_stack([np.asarray(bands, dtype=np.float32), compute_derived_features(bands, names)])
+
+class DerivedFeatureClassifier:
+    """Model yang dilatih dengan fitur turunan, dibungkus agar tetap menerima input (R, G, B).
+
+    Disimpan sebagai random_forest.pkl sehingga predict_land_cover dan kompilasi LUT tidak perlu
+    tahu fitur apa yang dipakai model.
+    """
+
+    def __init__(self, clf, derived_features):
+        self.clf = clf
+        self.derived_features = list(derived_features)
+        self.classes_ = clf.classes_
+        self.n_features_in_ = clf.n_features_in_ - len(self.derived_features)
+
+    def predict(self, X):
+        return self.clf.predict(with_derived_features(X, self.derived_features))
+
+    def predict_proba(self, X):
+        return self.clf.predict_proba(with_derived_features(X, self.derived_features))
@@ -1,53 +1,91 @@
 import os
 import numpy as np
 import rasterio
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap, BoundaryNorm
+from rasterio.enums import Resampling
+from src.raster_io import open_raster_for_write
+from src.utils import iter_block_windows
 import logging
 
 logger = logging.getLogger(__name__)
 
-def generate_static_map(change_map_path, output_png_path, output_tif_path):
-    # Buka raster perubahan lahan
+# Mapping warna RGB berdasarkan klasifikasi (dari modul interaktif sebelumnya)
+CHANGE_COLORS_RGB = {
+    0: [0, 0, 0],         # 0->0 Non-Vegetasi -> Non-Vegetasi (Hitam)
+    1: [255, 127, 14],    # 0->1 Non-Vegetasi -> Vegetasi Sedang (Jingga)
+    2: [174, 199, 232],   # 0->2 Non-Vegetasi -> Vegetasi Tinggi (Biru Muda)
+    10: [31, 119, 180],    # 1→0 Vegetasi Sedang → Non-Vegetasi (Biru Tua)
+    11: [44, 160, 44],     # 1→1 Vegetasi Sedang → Vegetasi Sedang (Hijau)
+    12: [148, 103, 189],   # 1→2 Vegetasi Sedang → Vegetasi Tinggi (Ungu)
+    20: [227, 119, 194],   # 2→0 Vegetasi Tinggi → Non-Vegetasi (Pink)
+    21: [188, 189, 34],    # 2→1 Vegetasi Tinggi → Vegetasi Sedang (Kuning kehijauan)
+    22: [158, 218, 229]    # 2→2 Vegetasi Tinggi → Vegetasi Tinggi (Cyan)
+}
+
+CHANGE_LEGEND_LABELS = {
+    0: "Non-Vegetasi → Non-Vegetasi",
+    1: "Non-Vegetasi → Vegetasi Sedang",
+    2: "Non-Vegetasi → Vegetasi Tinggi",
+    10: "Vegetasi Sedang → Non-Vegetasi",
+    11: "Vegetasi Sedang → Vegetasi Sedang",
+    12: "Vegetasi Sedang → Vegetasi Tinggi",
+    20: "Vegetasi Tinggi → Non-Vegetasi",
+    21: "Vegetasi Tinggi → Vegetasi Sedang",
+    22: "Vegetasi Tinggi → Vegetasi Tinggi"
+}
+
+# Ukuran figur PNG; citra dibaca pada resolusi yang cukup untuk ukuran ini saja
+FIGSIZE = (10, 10)
+DPI = 300
+
+def change_palette(colors=CHANGE_COLORS_RGB, nodata_alpha=255):
+    """Palet RGBA (N + 1, 4) uint8 yang diindeks langsung dengan kode perubahan. Baris terakhir (hitam,
+    alpha nodata_alpha) dipakai untuk NoData dan kode yang tidak ada di palet. RGBA juga membuat
+    imshow tidak perlu menambahkan kanal alpha sendiri (lebih hemat memori)."""
+    palette = np.zeros((max(colors) + 2, 4), dtype=np.uint8)
+    palette[:, 3] = 255
+    for code, color in colors.items():
+        palette[code, :3] = color
+    palette[-1, 3] = nodata_alpha
+    return palette
+
+def colorize(change_data, palette, valid=None):
+    """Warnai kode perubahan dengan satu lookup palet (tanpa mask per kelas).
+    Piksel di luar valid (opsional) diperlakukan seperti NoData."""
+    other = len(palette) - 1
+    in_palette = (change_data >= 0) & (change_data < other)
+    if valid is not None:
+        in_palette &= valid
+    return palette[np.where(in_palette, change_data, other)]
+
+def _read_for_figure(src, max_pixels):
+    """Baca band 1 dengan ukuran yang cukup untuk max_pixels piksel pada sisi terpanjang.
+    Pembacaan terdecimasi memakai overview internal jika ada (lihat raster_io)."""
+    scale = min(1.0, max_pixels / max(src.width, src.height))
+    if scale >= 1.0:
+        return src.read(1)
+    out_shape = (max(1, int(round(src.height * scale))), max(1, int(round(src.width * scale))))
+    return src.read(1, out_shape=out_shape, resampling=Resampling.nearest)
+
+def copy_raster(source_path, output_path, block_size=1024):
+    """Salin raster blok per blok lewat writer bersama, tanpa memuat seluruh raster ke memori."""
+    with rasterio.open(source_path) as src, open_raster_for_write(output_path, src.profile) as dst:
+        for window in iter_block_windows(src.width, src.height, block_size):
+            dst.write(src.read(window=window), window=window)
+
+def generate_static_map(change_map_path, output_png_path, output_tif_path=None, block_size=1024):
+    # pyplot diimpor di sini agar modul ini (colorize, change_palette) ringan untuk tiles.py
+    import matplotlib.pyplot as plt
+    # output_tif_path=None melewati penyalinan TIF, mis. jika salinannya sudah ditulis oleh detect_change
+    # Buka raster perubahan lahan; hanya versi terdecimasi seukuran figur yang dibaca
     with rasterio.open(change_map_path) as src:
-        perubahan_data = src.read(1)
-        meta = src.meta.copy()
+        perubahan_data = _read_for_figure(src, max(FIGSIZE) * DPI)
         bounds = src.bounds
-        # Ambil nilai NoData dari sumber
-        nodata_value = src.nodata if src.nodata is not None else 255
-
-    # Mapping warna RGB berdasarkan klasifikasi (dari modul interaktif sebelumnya)
-    class_colors_rgb = {
-        0: [0, 0, 0],         # 0->0 Non-Vegetasi -> Non-Vegetasi (Hitam)
-        1: [255, 127, 14],    # 0->1 Non-Vegetasi -> Vegetasi Sedang (Jingga)
-        2: [174, 199, 232],   # 0->2 Non-Vegetasi -> Vegetasi Tinggi (Biru Muda)
-        10: [31, 119, 180],    # 1→0 Vegetasi Sedang → Non-Vegetasi (Biru Tua)
-        11: [44, 160, 44],     # 1→1 Vegetasi Sedang → Vegetasi Sedang (Hijau)
-        12: [148, 103, 189],   # 1→2 Vegetasi Sedang → Vegetasi Tinggi (Ungu)
-        20: [227, 119, 194],   # 2→0 Vegetasi Tinggi → Non-Vegetasi (Pink)
-        21: [188, 189, 34],    # 2→1 Vegetasi Tinggi → Vegetasi Sedang (Kuning kehijauan)
-        22: [158, 218, 229]    # 2→2 Vegetasi Tinggi → Vegetasi Tinggi (Cyan)
-    }
-
-    # Buat citra RGB dari data klasifikasi (tanpa downsample di sini, hanya untuk plotting)
-    rgb_image = np.zeros((perubahan_data.shape[0], perubahan_data.shape[1], 3), dtype=np.uint8)
-    # Pastikan piksel NoData tidak diwarnai atau diwarnai secara transparan jika diinginkan
-    # Di sini, kita akan membiarkan piksel NoData tetap 0,0,0 (hitam) seperti default np.zeros
-    # Atau, jika nodata_value bukan 0, kita bisa menanganinya secara eksplisit.
-    # Untuk saat ini, asumsikan 0,0,0 adalah non-veg non-veg dan nodata diabaikan jika tidak ada di class_colors.
-    
-    for class_value, color_rgb in class_colors_rgb.items():
-        mask = perubahan_data == class_value
-        for i in range(3):
-            rgb_image[:, :, i][mask] = color_rgb[i]
-    
-    # Tangani NoData secara eksplisit jika nodata_value tidak sama dengan 0 dan belum ditangani
-    if nodata_value is not None and nodata_value != 0 and nodata_value in np.unique(perubahan_data):
-        nodata_mask = perubahan_data == nodata_value
-        rgb_image[nodata_mask] = [0, 0, 0] # Atur NoData menjadi hitam, atau [255,255,255] putih, atau lainnya
+
+    # NoData dan kode tanpa warna menjadi hitam (baris terakhir palet)
+    rgb_image = colorize(perubahan_data, change_palette())
 
     # --- Buat dan Simpan PNG dengan Legenda --- 
-    fig, ax = plt.subplots(figsize=(10, 10))
+    fig, ax = plt.subplots(figsize=FIGSIZE)
     
     # Tampilkan gambar
     ax.imshow(rgb_image, extent=[bounds.left, bounds.right, bounds.bottom, bounds.top])
@@ -59,23 +97,11 @@ def generate_static_map(change_map_path, output_png_path, output_tif_path):
     # Buat legenda manual
     legend_elements = []
     # Urutkan berdasarkan kunci untuk konsistensi legenda
-    sorted_class_values = sorted(class_colors_rgb.keys())
-
-    legend_labels = {
-        0: "Non-Vegetasi → Non-Vegetasi",
-        1: "Non-Vegetasi → Vegetasi Sedang",
-        2: "Non-Vegetasi → Vegetasi Tinggi",
-        10: "Vegetasi Sedang → Non-Vegetasi",
-        11: "Vegetasi Sedang → Vegetasi Sedang",
-        12: "Vegetasi Sedang → Vegetasi Tinggi",
-        20: "Vegetasi Tinggi → Non-Vegetasi",
-        21: "Vegetasi Tinggi → Vegetasi Sedang",
-        22: "Vegetasi Tinggi → Vegetasi Tinggi"
-    }
+    sorted_class_values = sorted(CHANGE_COLORS_RGB.keys())
 
     for val in sorted_class_values:
-        color = np.array(class_colors_rgb[val]) / 255.0 # Normalisasi ke 0-1
-        label = legend_labels.get(val, f"Kode {val}")
+        color = np.array(CHANGE_COLORS_RGB[val]) / 255.0 # Normalisasi ke 0-1
+        label = CHANGE_LEGEND_LABELS.get(val, f"Kode {val}")
         legend_elements.append(plt.Line2D([0], [0], marker='s', color=color, label=label, markersize=10, linestyle='None'))
 
     ax.legend(handles=legend_elements, loc='upper left', bbox_to_anchor=(1, 1), title="Kategori Perubahan")
@@ -83,24 +109,18 @@ def generate_static_map(change_map_path, output_png_path, output_tif_path):
 
     os.makedirs(os.path.dirname(output_png_path), exist_ok=True)
     try:
-        plt.savefig(output_png_path, dpi=300)
+        plt.savefig(output_png_path, dpi=DPI)
         logger.info(f"✅ Peta statis PNG berhasil dibuat: {output_png_path}")
     except OSError as e:
         logger.error(f"[!] Gagal menyimpan peta statis PNG ke {output_png_path}: {e}")
     plt.close(fig)
 
-    # --- Simpan TIF dengan Koordinat yang Sama dengan Sumber --- 
-    meta.update({
-        'dtype': perubahan_data.dtype,  # Pastikan dtype sesuai dengan data asli
-        'count': 1,  # TIF hanya memiliki 1 band (data perubahan)
-        'nodata': nodata_value, # Pertahankan nilai nodata dari sumber
-        # transform, crs, width, height sudah ada di meta dari src.meta.copy()
-    })
+    if output_tif_path is None:
+        return
 
-    os.makedirs(os.path.dirname(output_tif_path), exist_ok=True)
+    # --- Simpan TIF dengan Koordinat yang Sama dengan Sumber (disalin per blok) --- 
     try:
-        with rasterio.open(output_tif_path, 'w', **meta) as dst:
-            dst.write(perubahan_data, 1)
+        copy_raster(change_map_path, output_tif_path, block_size=block_size)
         logger.info(f"✅ Peta perubahan TIF berhasil dibuat: {output_tif_path}")
     except OSError as e:
         logger.error(f"[!] Gagal menyimpan peta perubahan TIF ke {output_tif_path}: {e}")
@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Naikkan versi ini jika format laporan berubah
+RUN_REPORT_VERSION = 1
+RASTER_EXTENSIONS = (".tif", ".tiff", ".vrt", ".img")
+
+def _proc_status_kb(field):
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    """Reset puncak RSS proses (VmHWM) ke RSS saat ini; hanya Linux >= 4.0. Mengembalikan True jika berhasil."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def current_rss_kb():
+    return _proc_status_kb("VmRSS")
+
+def peak_rss_kb():
+    peak = _proc_status_kb("VmHWM")
+    if peak is None:
+        import resource
+        # ru_maxrss dalam KB di Linux, byte di macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            peak //= 1024
+    return peak
+
+def cpu_seconds():
+    """Waktu CPU proses ini (semua thread) ditambah proses anak yang sudah selesai."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+def io_counters():
+    """Byte dibaca/ditulis proses ini dari /proc/self/io: rchar/wchar (semua I/O, termasuk page cache)
+    dan read_bytes/write_bytes (yang benar-benar ke disk). None jika tidak tersedia."""
+    try:
+        with open("/proc/self/io", encoding="utf-8") as f:
+            return {key: int(value) for key, value in (line.split(": ") for line in f)}
+    except OSError:
+        return None
+
+def raster_pixels(paths):
+    """Jumlah piksel (lebar x tinggi) dari path raster dalam daftar; path lain diabaikan."""
+    import rasterio
+    total = 0
+    for path in paths:
+        if path and str(path).lower().endswith(RASTER_EXTENSIONS) and os.path.exists(path):
+            with rasterio.open(path) as src:
+                total += src.width * src.height
+    return total
+
+@contextmanager
+def measure_stage(name, raster_paths=(), tracemalloc_enabled=False, profile_path=None):
+    """Ukur satu tahap: waktu wall dan CPU, puncak RSS, puncak tracemalloc (opsional), byte I/O,
+    serta piksel per detik berdasarkan raster_paths. Record (dict) diisi saat blok selesai,
+    termasuk jika tahap gagal (status "gagal"). profile_path menyimpan dump cProfile tahap ini.
+
+    Puncak RSS hanya mencakup proses ini; worker proses milik tahap tidak ikut dihitung.
+    """
+    record = {"name": name, "status": "selesai", "pid": os.getpid()}
+    pixels = raster_pixels(raster_paths)
+    peak_reset = reset_peak_rss()
+    rss_before = current_rss_kb()
+    io_before = io_counters()
+    started_tracemalloc = tracemalloc_enabled and not tracemalloc.is_tracing()
+    if started_tracemalloc:
+        tracemalloc.start()
+    elif tracemalloc_enabled:
+        tracemalloc.reset_peak()
+    profiler = cProfile.Profile() if profile_path else None
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield record
+    except BaseException as e:
+        record.update(status="gagal", error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        wall, cpu = time.perf_counter() - wall_start, cpu_seconds() - cpu_start
+        traced_peak = tracemalloc.get_traced_memory()[1] if tracemalloc_enabled else None
+        if started_tracemalloc:
+            tracemalloc.stop()
+        peak = peak_rss_kb()
+        io_after = io_counters()
+        record.update(
+            wall_s=round(wall, 4),
+            cpu_s=round(cpu, 4),
+            peak_rss_mb=round(peak / 1024, 1) if peak is not None else None,
+            # Tanpa reset VmHWM, puncak mencakup seluruh umur proses sehingga kenaikannya tidak dilaporkan
+            rss_increase_mb=round((peak - rss_before) / 1024, 1) if peak_reset and rss_before is not None else None,
+            tracemalloc_peak_mb=round(traced_peak / 2 ** 20, 1) if traced_peak is not None else None,
+            pixels=pixels,
+            pixels_per_s=round(pixels / wall) if pixels and wall > 0 else None,
+        )
+        if io_before and io_after:
+            record.update(
+                read_bytes=io_after["rchar"] - io_before["rchar"],
+                write_bytes=io_after["wchar"] - io_before["wchar"],
+                disk_read_bytes=io_after["read_bytes"] - io_before["read_bytes"],
+                disk_write_bytes=io_after["write_bytes"] - io_before["write_bytes"],
+            )
+        if profiler is not None:
+            os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+            profiler.dump_stats(profile_path)
+            record["profile"] = profile_path
+
+class RunReport:
+    """Kumpulan pengukuran per tahap untuk satu run, disimpan sebagai JSON (lihat config.yaml instrumentation).
+
+    stage(name, raster_paths) mengukur blok kode di proses ini; tahap yang diukur di proses lain
+    (mis. worker graf tugas) ditambahkan lewat add(record).
+    """
+
+    def __init__(self, mode, tracemalloc_enabled=False, profile_stages=(), profile_dir=os.path.join("output", "profiles")):
+        self.mode = mode
+        self.tracemalloc_enabled = tracemalloc_enabled
+        self.profile_stages = set(profile_stages or ())
+        self.profile_dir = profile_dir
+        self.started = datetime.now(timezone.utc)
+        self._wall_start = time.perf_counter()
+        self.stages = []
+        self.status = "selesai"
+
+    def stage_options(self, name):
+        """Argumen measure_stage untuk tahap name (tracemalloc dan path cProfile jika tahap ini diprofil)."""
+        profile_path = os.path.join(self.profile_dir, f"{self.mode}_{name}.prof") if name in self.profile_stages else None
+        return {"tracemalloc_enabled": self.tracemalloc_enabled, "profile_path": profile_path}
+
+    @contextmanager
+    def stage(self, name, raster_paths=()):
+        # record baru ada setelah persiapan measure_stage selesai; jika persiapan gagal, error aslinya diteruskan
+        record = None
+        try:
+            with measure_stage(name, raster_paths, **self.stage_options(name)) as record:
+                yield record
+        finally:
+            if record is not None:
+                self.add(record)
+
+    def add(self, record):
+        self.stages.append(record)
+        if record.get("status") == "gagal":
+            self.status = "gagal"
+        if record.get("status") in ("selesai", "gagal"):
+            throughput = f", {record['pixels_per_s']:,} piksel/s" if record.get("pixels_per_s") else ""
+            logger.info(f"[*] Tahap '{record['name']}': {record['wall_s']:.2f} s wall, {record['cpu_s']:.2f} s CPU, "
+                        f"puncak RSS {record['peak_rss_mb']} MB{throughput}")
+
+    def skipped(self, name):
+        self.stages.append({"name": name, "status": "dilewati"})
+
+    def to_dict(self):
+        return {
+            "version": RUN_REPORT_VERSION,
+            "mode": self.mode,
+            "status": self.status,
+            "started": self.started.isoformat(timespec="seconds"),
+            "finished": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "total_wall_s": round(time.perf_counter() - self._wall_start, 4),
+            "pid": os.getpid(),
+            "python": sys.version.split()[0],
+            "stages": self.stages,
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        logger.info(f"[✔] Laporan run disimpan ke: {path}")
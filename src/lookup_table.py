@@ -0,0 +1,75 @@
+import os
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Semua kemungkinan input RGB 8-bit: 256 x 256 x 256
+N_RGB_VALUES = 256 ** 3
+
+def lookup_table_path(model_path):
+    """Lokasi LUT yang disimpan di samping model, mis. random_forest.pkl -> random_forest_lut.npy"""
+    return f"{os.path.splitext(model_path)[0]}_lut.npy"
+
+def _rgb_codes(X):
+    X = np.asarray(X)
+    return (X[:, 0].astype(np.intp) << 16) | (X[:, 1].astype(np.intp) << 8) | X[:, 2].astype(np.intp)
+
+def _codes_to_rgb(codes):
+    return np.column_stack(((codes >> 16) & 255, (codes >> 8) & 255, codes & 255)).astype(np.uint8)
+
+class LookupTableClassifier:
+    """Pengganti classifier untuk citra RGB uint8: prediksi cukup dengan satu indeks array."""
+
+    def __init__(self, lut):
+        self.lut = lut
+
+    def predict(self, X):
+        return self.lut[_rgb_codes(X)]
+
+def compile_lookup_table(clf, lut_path, batch_size=1 << 20, n_check=200_000, X_check=None, random_state=42):
+    """Kompilasi classifier RGB terlatih menjadi LUT kelas uint8 berukuran 256³ (~16 MB).
+
+    Hasil diverifikasi terhadap clf.predict pada sampel acak (dan X_check jika diberikan);
+    ValueError dilempar jika ada satu pun prediksi yang berbeda.
+    """
+    if getattr(clf, "n_features_in_", None) != 3:
+        raise ValueError("LUT hanya didukung untuk model dengan 3 fitur (R, G, B).")
+    classes = np.asarray(clf.classes_)
+    if not np.issubdtype(classes.dtype, np.integer) or classes.min() < 0 or classes.max() > 254:
+        raise ValueError("LUT uint8 membutuhkan kelas bilangan bulat 0-254.")
+
+    logger.info(f"[*] Mengompilasi model menjadi LUT RGB ({N_RGB_VALUES} entri)...")
+    lut = np.empty(N_RGB_VALUES, dtype=np.uint8)
+    for start in range(0, N_RGB_VALUES, batch_size):
+        stop = min(start + batch_size, N_RGB_VALUES)
+        lut[start:stop] = clf.predict(_codes_to_rgb(np.arange(start, stop, dtype=np.intp)))
+
+    # Verifikasi: LUT harus identik dengan clf.predict
+    rng = np.random.default_rng(random_state)
+    samples = [rng.integers(0, 256, size=(n_check, 3), dtype=np.uint8)]
+    if X_check is not None and len(X_check):
+        samples.append(np.asarray(X_check, dtype=np.uint8))
+    lut_clf = LookupTableClassifier(lut)
+    for X in samples:
+        mismatches = np.count_nonzero(lut_clf.predict(X) != clf.predict(X))
+        if mismatches:
+            raise ValueError(f"LUT tidak cocok dengan clf.predict pada {mismatches} dari {len(X)} sampel.")
+
+    np.save(lut_path, lut)
+    logger.info(f"📦 LUT disimpan ke: {lut_path} (terverifikasi pada {sum(len(X) for X in samples)} sampel)")
+    return lut_path
+
+def load_lookup_table(model_path):
+    """Muat LUT milik model jika ada dan tidak lebih lama dari modelnya, selain itu None.
+
+    LUT dipetakan read-only (memmap), sehingga semua proses worker berbagi halaman page cache yang sama.
+    """
+    lut_path = lookup_table_path(model_path)
+    if not os.path.exists(lut_path) or os.path.getmtime(lut_path) < os.path.getmtime(model_path):
+        return None
+    lut = np.load(lut_path, mmap_mode="r")
+    if lut.shape != (N_RGB_VALUES,) or lut.dtype != np.uint8:
+        logger.warning(f"[!] LUT tidak valid diabaikan: {lut_path}")
+        return None
+    return LookupTableClassifier(lut)
@@ -4,49 +4,130 @@ import joblib
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
+from src.config import CLASS_NAMES
 from src.ndvi_to_class import ndvi_to_class
-from src.utils import mask_by_boundary
+from src.boundary_mask import get_boundary_mask, OUTSIDE, INSIDE
+from src.lookup_table import compile_lookup_table, lookup_table_path
+from src.features import DerivedFeatureClassifier, check_derived_features, with_derived_features
+from src.utils import iter_block_windows
 import logging
 
 logger = logging.getLogger(__name__)
 
-def extract_features(rgb_path, ndvi_path, boundary_path):
-    # Baca data RGB dan NDVI
+def extract_features(rgb_path, ndvi_path, boundary_path, block_size=1024):
+    """Ekstraksi fitur RGB dan label dalam satu kali baca.
+
+    Batas area dirasterisasi sekali ke grid bersama, lalu RGB dan label dibaca bersamaan
+    jendela per jendela; array sementara tidak pernah lebih besar dari satu jendela.
+    Kapasitas X dan y adalah jumlah piksel di dalam batas (dari mask bit-packed), lalu
+    diperkecil di tempat ke jumlah piksel valid sehingga hasilnya tidak menahan memori berlebih.
+    """
     with rasterio.open(rgb_path) as rgb_src:
-        rgb = rgb_src.read().transpose((1, 2, 0))  # shape: (H, W, C)
-        rgb_masked, _, rgb_nodata = mask_by_boundary(rgb_src, boundary_path)
-
-    with rasterio.open(ndvi_path) as ndvi_src:
-        ndvi = ndvi_src.read(1)
-        ndvi_masked, _, ndvi_nodata = mask_by_boundary(ndvi_src, boundary_path)
-        # Tambahkan squeeze untuk memastikan ndvi_masked selalu 2D (H, W)
-        if ndvi_masked.ndim == 3 and ndvi_masked.shape[2] == 1:
-            ndvi_masked = ndvi_masked.squeeze(axis=2)
-
-    # Mask NoData
-    # Gunakan nilai nodata yang sebenarnya
-    if rgb.ndim == 3:
-        rgb_no_data_mask = ~np.all(rgb_masked == rgb_nodata, axis=-1) # Gunakan np.all jika ingin semua band nodata
-    else:
-        rgb_no_data_mask = ~(rgb_masked == rgb_nodata)
+        n_bands, rgb_dtype = rgb_src.count, rgb_src.dtypes[0]
+        if boundary_path:
+            capacity = get_boundary_mask(boundary_path, rgb_src.crs, rgb_src.transform, rgb_src.shape).count()
+        else:
+            capacity = rgb_src.width * rgb_src.height
+
+    X = np.empty((capacity, n_bands), dtype=rgb_dtype)
+    y = np.empty(capacity, dtype=np.uint8)
+    n_valid = 0
+    for X_block, y_block in iter_training_blocks(rgb_path, ndvi_path, block_size, boundary_path=boundary_path):
+        X[n_valid:n_valid + len(y_block)] = X_block
+        y[n_valid:n_valid + len(y_block)] = y_block
+        n_valid += len(y_block)
+
+    # Piksel NoData di dalam batas membuat n_valid < kapasitas; resize membebaskan sisanya tanpa salinan kedua
+    X.resize((n_valid, n_bands), refcheck=False)
+    y.resize(n_valid, refcheck=False)
+    # Label kelas dari raster terklasifikasi langsung dipakai sebagai target y
+    return X, y
+
+def iter_training_blocks(rgb_path, label_path, block_size=1024, boundary_path=None):
+    """Iterasi (X, y) piksel valid per jendela dari RGB dan raster label yang sudah terpotong.
+
+    Jika boundary_path diberikan, mask batas (ter-cache, lihat src.boundary_mask) dipakai untuk
+    melewati blok yang sepenuhnya di luar batas dan membuang piksel di luar batas.
+    """
+    with rasterio.open(rgb_path) as rgb_src, rasterio.open(label_path) as label_src:
+        if rgb_src.shape != label_src.shape:
+            raise ValueError("Ukuran raster RGB dan label tidak sama")
+        rgb_nodata = rgb_src.nodata
+        label_nodata = label_src.nodata if label_src.nodata is not None else 255
+        boundary = get_boundary_mask(boundary_path, rgb_src.crs, rgb_src.transform, rgb_src.shape) if boundary_path else None
+
+        for window in iter_block_windows(rgb_src.width, rgb_src.height, block_size):
+            status = boundary.block_status(window) if boundary is not None else INSIDE
+            if status == OUTSIDE:
+                continue
+            rgb = rgb_src.read(window=window).transpose((1, 2, 0))  # shape: (h, w, C)
+            labels = label_src.read(1, window=window)
+            valid_mask = ~np.all(rgb == rgb_nodata, axis=-1) & (labels != label_nodata)
+            if status != INSIDE:
+                valid_mask &= boundary.read(window)
+            if valid_mask.any():
+                yield rgb[valid_mask], labels[valid_mask]
+
+def sample_features(rgb_path, label_path, per_class_budget, block_size=1024, random_state=42, boundary_path=None):
+    """Sampling reservoir terstratifikasi secara streaming: paling banyak per_class_budget piksel per kelas.
 
-    # Untuk NDVI, pastikan nodata juga ditangani
-    ndvi_no_data_mask = ~(ndvi_masked == ndvi_nodata)
+    Setiap piksel valid mendapat kunci acak dan per kelas disimpan per_class_budget kunci terkecil,
+    sehingga hasilnya sampel acak seragam per kelas dengan memori O(jumlah kelas x budget),
+    berapa pun ukuran citranya.
+    """
+    blocks = iter_training_blocks(rgb_path, label_path, block_size, boundary_path=boundary_path)
+    return reservoir_sample(blocks, per_class_budget, random_state)
 
-    valid_mask = rgb_no_data_mask & ndvi_no_data_mask
+def reservoir_sample(blocks, per_class_budget, random_state=42):
+    """Inti sample_features untuk sumber blok (X, y) apa pun, mis. iter_store_blocks dari feature store."""
+    rng = np.random.default_rng(random_state)
+    reservoirs = {}  # kelas -> (kunci acak, fitur)
+    seen = {}
 
-    # Ambil fitur dan target
-    X = rgb_masked[valid_mask]
-    # Hapus baris berikut karena ndvi_masked sudah berisi label kelas yang benar
-    # ndvi_class = ndvi_to_class(ndvi_masked, nodata_value=ndvi_nodata)
-    # y = ndvi_class[valid_mask]
-    
-    # Gunakan ndvi_masked langsung sebagai target y setelah mask NoData
-    y = ndvi_masked[valid_mask]
+    for X_block, y_block in blocks:
+        keys_block = rng.random(len(y_block))
+        for class_id in np.unique(y_block):
+            in_class = y_block == class_id
+            keys, X_class = keys_block[in_class], X_block[in_class]
+            seen[class_id] = seen.get(class_id, 0) + len(keys)
+            if class_id in reservoirs:
+                keys = np.concatenate([reservoirs[class_id][0], keys])
+                X_class = np.concatenate([reservoirs[class_id][1], X_class])
+            if len(keys) > per_class_budget:
+                keep = np.argpartition(keys, per_class_budget)[:per_class_budget]
+                keys, X_class = keys[keep], X_class[keep]
+            reservoirs[class_id] = (keys, X_class)
 
+    class_ids = sorted(reservoirs)
+    logger.info(f"Sampling terstratifikasi: {dict((int(c), f'{len(reservoirs[c][0])}/{seen[c]}') for c in class_ids)} piksel (sampel/total)")
+    X = np.concatenate([reservoirs[c][1] for c in class_ids])
+    y = np.concatenate([np.full(len(reservoirs[c][0]), c, dtype=np.uint8) for c in class_ids])
     return X, y
 
-def train_and_save_model(X, y, model_path="models/random_forest.pkl"):
+def deduplicate_samples(X, y):
+    """Ringkas (X, y) menjadi baris unik beserta jumlah kemunculannya (untuk sample_weight).
+
+    Untuk fitur dan label uint8 (mis. RGB 8-bit) setiap baris dikemas menjadi satu kunci
+    integer sehingga np.unique bekerja pada array 1D, bukan perbandingan baris per baris.
+    """
+    X = np.asarray(X)
+    y = np.asarray(y)
+    rows = np.column_stack([X, y])
+    if rows.dtype == np.uint8 and rows.shape[1] <= 8:
+        keys = np.zeros(len(rows), dtype=np.uint64)
+        for i in range(rows.shape[1]):
+            keys |= rows[:, i].astype(np.uint64) << np.uint64(8 * i)
+        _, first_index, counts = np.unique(keys, return_index=True, return_counts=True)
+        unique_rows = rows[first_index]
+    else:
+        unique_rows, counts = np.unique(rows, axis=0, return_counts=True)
+    return unique_rows[:, :-1].astype(X.dtype), unique_rows[:, -1].astype(y.dtype), counts
+
+def train_and_save_model(X, y, model_path="models/random_forest.pkl", compile_lut=False, n_estimators=100, n_jobs=None, deduplicate=False,
+                         derived_features=()):
+    """Latih dan simpan Random Forest. Jika derived_features diberikan, kolom terakhir X adalah fitur
+    turunan tersebut (lihat src.features) dan model disimpan sebagai DerivedFeatureClassifier yang
+    tetap menerima input (R, G, B)."""
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
     # Log class distribution in training and test sets
@@ -55,30 +136,207 @@ def train_and_save_model(X, y, model_path="models/random_forest.pkl"):
     unique_test, counts_test = np.unique(y_test, return_counts=True)
     logger.info(f"Distribusi kelas dalam set pengujian: {dict(zip(unique_test, counts_test))}")
 
-    clf = RandomForestClassifier(n_estimators=100, random_state=42)
-    clf.fit(X_train, y_train)
+    clf = RandomForestClassifier(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs)
+    if deduplicate:
+        # Fit pada baris unik dengan bobot = jumlah duplikat; set pengujian tetap memakai distribusi asli
+        # Fitur turunan hanya bergantung pada band, jadi deduplikasi cukup pada band lalu fitur dihitung ulang
+        n_bands = X_train.shape[1] - len(derived_features)
+        X_fit, y_fit, sample_weight = deduplicate_samples(X_train[:, :n_bands], y_train)
+        X_fit = with_derived_features(X_fit, derived_features)
+        logger.info(f"Deduplikasi set pelatihan: {len(y_train)} -> {len(y_fit)} baris unik berbobot")
+        clf.fit(X_fit, y_fit, sample_weight=sample_weight)
+    else:
+        clf.fit(X_train, y_train)
 
     # Evaluasi
     logger.info("\n🧪 Evaluasi Model:")
     logger.info(classification_report(y_test, clf.predict(X_test), target_names=["Non-Vegetasi", "Vegetasi Sedang", "Vegetasi Tinggi"], labels=[0, 1, 2]))
 
     # Simpan model
+    if derived_features:
+        clf = DerivedFeatureClassifier(clf, derived_features)
+        X_test = X_test[:, :clf.n_features_in_]
     joblib.dump(clf, model_path)
     logger.info(f"📦 Model disimpan ke: {model_path}")
 
-def train_and_predict(rgb_path, label_path, boundary_path, model_output, prediction_output):
+    # Opsional: kompilasi LUT RGB 8-bit di samping model untuk prediksi cepat
+    if compile_lut:
+        compile_lookup_table(clf, lookup_table_path(model_path), X_check=X_test)
+
+def iter_training_chunks(blocks, chunk_rows):
+    """Susun ulang blok (X, y) menjadi potongan berisi tepat chunk_rows baris (potongan terakhir bisa lebih kecil).
+
+    Blok yang lebih besar dari chunk_rows dipotong dan sisanya dibawa ke potongan berikutnya, sehingga
+    memori puncak ditentukan oleh chunk_rows, bukan oleh ukuran blok.
+    """
+    X_parts, y_parts, n_rows = [], [], 0
+    for X_block, y_block in blocks:
+        start = 0
+        while start < len(y_block):
+            stop = min(len(y_block), start + chunk_rows - n_rows)
+            X_parts.append(X_block[start:stop])
+            y_parts.append(y_block[start:stop])
+            n_rows += stop - start
+            start = stop
+            if n_rows == chunk_rows:
+                yield np.concatenate(X_parts), np.concatenate(y_parts)
+                X_parts, y_parts, n_rows = [], [], 0
+    if n_rows:
+        yield np.concatenate(X_parts), np.concatenate(y_parts)
+
+def _split_chunks(chunks, test_size, random_state):
+    """Bagi setiap potongan menjadi (latih, uji) dengan mask acak; urutan potongan yang sama selalu
+    menghasilkan pembagian yang sama, sehingga evaluasi dapat mengulang iterasi tanpa menyimpan set uji."""
+    rng = np.random.default_rng(random_state)
+    for X_chunk, y_chunk in chunks:
+        is_test = rng.random(len(y_chunk)) < test_size
+        yield (X_chunk[~is_test], y_chunk[~is_test]), (X_chunk[is_test], y_chunk[is_test])
+
+def _with_missing_classes(X, y, sample_weight, classes):
+    """Tambahkan satu baris berbobot nol untuk setiap kelas yang tidak ada di potongan ini.
+
+    Dengan warm_start, setiap pohon harus mengenal semua kelas agar predict_proba semua pohon
+    memiliki kolom yang sama; baris berbobot nol tidak memengaruhi impurity maupun nilai daun.
+    """
+    missing = np.setdiff1d(classes, y)
+    if not len(missing):
+        return X, y, sample_weight
+    X_dummy = np.zeros((len(missing), X.shape[1]), dtype=X.dtype)
+    return (np.concatenate([X, X_dummy]), np.concatenate([y, missing.astype(y.dtype)]),
+            np.concatenate([sample_weight, np.zeros(len(missing), dtype=sample_weight.dtype)]))
+
+def train_incremental_forest(make_chunks, model_path, trees_per_chunk=10, n_jobs=None, deduplicate=False, derived_features=(),
+                             compile_lut=False, classes=None, test_size=0.2, random_state=42):
+    """Latih Random Forest out-of-core: pohon baru (warm_start) dilatih per potongan data sehingga
+    hanya satu potongan yang berada di memori.
+
+    make_chunks() mengembalikan iterator baru atas potongan (X, y), dengan X berisi band lalu kolom
+    derived_features (seperti train_and_save_model); dipanggil dua kali, untuk
+    pelatihan dan untuk evaluasi streaming pada bagian uji (test_size) dari setiap potongan.
+    Model disimpan ke model_path dalam format yang sama dengan train_and_save_model.
+    """
+    from src.evaluate import format_classification_report
+    classes = np.asarray(sorted(CLASS_NAMES) if classes is None else classes)
+    clf = RandomForestClassifier(n_estimators=0, warm_start=True, random_state=random_state, n_jobs=n_jobs)
+    n_bands = None
+    class_counts = np.zeros(256, dtype=np.int64)
+
+    for i, ((X_train, y_train), _) in enumerate(_split_chunks(make_chunks(), test_size, random_state)):
+        n_bands = X_train.shape[1] - len(derived_features)
+        if deduplicate:
+            X_fit, y_fit, sample_weight = deduplicate_samples(X_train[:, :n_bands], y_train)
+            X_fit = with_derived_features(X_fit, derived_features)
+        else:
+            X_fit, y_fit, sample_weight = X_train, y_train, np.ones(len(y_train))
+        X_fit, y_fit, sample_weight = _with_missing_classes(X_fit, y_fit, sample_weight.astype(np.float64), classes)
+        clf.n_estimators += trees_per_chunk
+        clf.fit(X_fit, y_fit, sample_weight=sample_weight)
+        class_counts += np.bincount(y_train, minlength=256)
+        logger.info(f"[*] Potongan {i + 1}: {len(y_train)} piksel latih ({len(y_fit)} baris fit), total {clf.n_estimators} pohon")
+    if n_bands is None:
+        raise ValueError("Tidak ada data pelatihan untuk model out-of-core.")
+    logger.info(f"Distribusi kelas dalam set pelatihan: {dict((int(c), int(class_counts[c])) for c in np.flatnonzero(class_counts))}")
+
+    # Evaluasi streaming: matriks kebingungan diakumulasi per potongan uji
+    confusion = np.zeros(256 * 256, dtype=np.int64)
+    X_check = None
+    for _, (X_test, y_test) in _split_chunks(make_chunks(), test_size, random_state):
+        if len(y_test):
+            codes = y_test.astype(np.int64) * 256 + clf.predict(X_test).astype(np.int64)
+            confusion += np.bincount(codes, minlength=confusion.size)
+            X_check = X_test[:, :n_bands]
+    logger.info("\n🧪 Evaluasi Model:")
+    logger.info(format_classification_report(confusion.reshape(256, 256), [0, 1, 2],
+                                             ["Non-Vegetasi", "Vegetasi Sedang", "Vegetasi Tinggi"], digits=2))
+
+    clf.warm_start = False
+    n_trees = len(clf.estimators_)
+    if derived_features:
+        clf = DerivedFeatureClassifier(clf, derived_features)
+    joblib.dump(clf, model_path)
+    logger.info(f"📦 Model disimpan ke: {model_path} ({n_trees} pohon)")
+
+    if compile_lut:
+        compile_lookup_table(clf, lookup_table_path(model_path), X_check=X_check)
+
+def train_model(rgb_path, label_path, boundary_path, model_output, compile_lut=False, n_estimators=100, n_jobs=None,
+                sampling=None, deduplicate=False, derived_features=(), feature_store=None, hash_contents=False, out_of_core=None):
+    """Ekstraksi fitur lalu latih dan simpan model ke model_output/random_forest.pkl. Mengembalikan path model.
+
+    feature_store (lihat config.yaml training.feature_store) membaca fitur dari store .npy yang
+    dibangun sekali per kombinasi input + batas, bukan dari citra. Jika out_of_core aktif, sampling
+    diabaikan dan semua piksel dipakai lewat train_incremental_forest.
+    """
+    derived_features = check_derived_features(derived_features or ())
+    sampling_enabled = bool(sampling and sampling.get("enabled", False))
+    block_size = sampling.get("block_size", 1024) if sampling_enabled else 1024
+    model_path = f"{model_output}/random_forest.pkl"
+    store_path = None
+
     # Extract features and labels
-    X, y = extract_features(rgb_path, label_path, boundary_path)
+    if feature_store and feature_store.get("enabled", False):
+        from src.feature_store import build_feature_store, iter_store_blocks, load_feature_store
+        store_path = build_feature_store(rgb_path, label_path, boundary_path, feature_store.get("dir", "output/feature_store"),
+                                         derived_features=derived_features, block_size=feature_store.get("block_size", 1024),
+                                         hash_contents=hash_contents)
+
+    # out_of_core (lihat config.yaml training.out_of_core) melatih per potongan tanpa memuat seluruh data
+    if out_of_core and out_of_core.get("enabled", False):
+        def make_chunks():
+            if store_path is not None:
+                blocks = iter_store_blocks(store_path, derived_features)
+            else:
+                blocks = ((with_derived_features(X_block, derived_features), y_block) for X_block, y_block
+                          in iter_training_blocks(rgb_path, label_path, block_size, boundary_path=boundary_path))
+            return iter_training_chunks(blocks, out_of_core.get("chunk_rows", 1_000_000))
+
+        logger.info(f"[*] Mode out-of-core: training.n_estimators ({n_estimators}) tidak dipakai; jumlah pohon = "
+                    f"jumlah potongan x trees_per_chunk ({out_of_core.get('trees_per_chunk', 10)})")
+        train_incremental_forest(make_chunks, model_path, trees_per_chunk=out_of_core.get("trees_per_chunk", 10), n_jobs=n_jobs,
+                                 deduplicate=deduplicate, derived_features=derived_features, compile_lut=compile_lut)
+        return model_path
+
+    if store_path is not None:
+        if sampling_enabled:
+            X, y = reservoir_sample(iter_store_blocks(store_path, derived_features),
+                                    sampling["per_class_budget"], sampling.get("random_state", 42))
+        else:
+            X, y = load_feature_store(store_path, derived_features)
+    # sampling (lihat config.yaml training.sampling) membatasi jumlah piksel per kelas
+    elif sampling_enabled:
+        X, y = sample_features(
+            rgb_path, label_path,
+            per_class_budget=sampling["per_class_budget"],
+            block_size=block_size,
+            random_state=sampling.get("random_state", 42),
+            boundary_path=boundary_path
+        )
+        X = with_derived_features(X, derived_features)
+    else:
+        X, y = extract_features(rgb_path, label_path, boundary_path)
+        X = with_derived_features(X, derived_features)
 
     # Train and save the model
-    train_and_save_model(X, y, model_path=f"{model_output}/random_forest.pkl")
+    train_and_save_model(X, y, model_path=model_path, compile_lut=compile_lut,
+                         n_estimators=n_estimators, n_jobs=n_jobs, deduplicate=deduplicate, derived_features=derived_features)
+    return model_path
+
+def train_and_predict(rgb_path, label_path, boundary_path, model_output, prediction_output, prediction_options=None,
+                      compile_lut=False, n_estimators=100, n_jobs=None, sampling=None, deduplicate=False,
+                      derived_features=(), feature_store=None, hash_contents=False, out_of_core=None):
+    model_path = train_model(rgb_path, label_path, boundary_path, model_output, compile_lut=compile_lut,
+                             n_estimators=n_estimators, n_jobs=n_jobs, sampling=sampling, deduplicate=deduplicate,
+                             derived_features=derived_features, feature_store=feature_store, hash_contents=hash_contents,
+                             out_of_core=out_of_core)
 
     # Perform prediction using the trained model
     from src.predict import predict_land_cover
     predict_land_cover(
         rgb_path=rgb_path,
-        model_path=f"{model_output}/random_forest.pkl",
-        output_path=prediction_output # Gunakan jalur file lengkap yang diterima
+        model_path=model_path,
+        output_path=prediction_output, # Gunakan jalur file lengkap yang diterima
+        boundary_path=boundary_path,
+        **(prediction_options or {})
     )
 
 if __name__ == "__main__":
@@ -0,0 +1,71 @@
+import os
+import threading
+from collections import OrderedDict
+from src.lookup_table import load_lookup_table, lookup_table_path
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Jumlah model yang disimpan per proses; entri yang paling lama tidak dipakai dikeluarkan lebih dulu
+MAX_CACHED_MODELS = 4
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+def _cached(key, loader, max_entries):
+    with _lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    value = loader()
+
+    with _lock:
+        # Buang entri lama dari file yang sama (mtime berbeda) lalu batasi ukuran cache
+        for old_key in [k for k in _cache if k[:2] == key[:2] and k != key]:
+            del _cache[old_key]
+        _cache[key] = value
+        _cache.move_to_end(key)
+        while len(_cache) > max_entries:
+            evicted, _ = _cache.popitem(last=False)
+            logger.info(f"[*] Model dikeluarkan dari cache: {evicted[1]}")
+    return value
+
+def load_model(model_path, max_entries=MAX_CACHED_MODELS):
+    """Muat model joblib sekali per proses, dengan kunci (path, mtime).
+
+    Array pohon sklearn selalu disalin ke memori proses saat unpickle, sehingga model tidak dapat
+    dibagi lewat memory-map. Untuk berbagi model antar worker proses, muat model di proses utama
+    sebelum pool dibuat dan buat pool dengan process_pool_context() (fork, copy-on-write).
+    """
+    path = os.path.abspath(model_path)
+    key = ("model", path, os.stat(path).st_mtime_ns)
+
+    def loader():
+        # joblib (dan sklearn saat unpickle) hanya dimuat jika model benar-benar dibaca, bukan saat memakai LUT
+        import joblib
+        logger.info(f"[*] Memuat model: {model_path}")
+        return joblib.load(path)
+
+    return _cached(key, loader, max_entries)
+
+def load_classifier(model_path, use_lut=False, max_entries=MAX_CACHED_MODELS):
+    """Muat LUT RGB milik model jika diminta dan tersedia, selain itu model joblib (keduanya di-cache)."""
+    if use_lut:
+        lut_path = os.path.abspath(lookup_table_path(model_path))
+        if os.path.exists(lut_path):
+            key = ("lut", lut_path, os.stat(lut_path).st_mtime_ns, os.stat(model_path).st_mtime_ns)
+            lut_clf = _cached(key, lambda: load_lookup_table(model_path), max_entries)
+            if lut_clf is not None:
+                return lut_clf
+    return load_model(model_path, max_entries=max_entries)
+
+def process_pool_context():
+    """Konteks multiprocessing untuk pool worker prediksi: fork jika tersedia, sehingga model yang sudah
+    dimuat di proses utama diwarisi worker tanpa dimuat ulang (None = default platform)."""
+    import multiprocessing
+    return multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+
+def clear_model_cache():
+    with _lock:
+        _cache.clear()
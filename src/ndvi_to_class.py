@@ -2,6 +2,7 @@ import os
 import yaml
 import numpy as np
 import rasterio
+from src.raster_io import open_raster_for_write
 
 def load_config(config_path="config.yaml"):
     with open(config_path) as f:
@@ -24,7 +25,7 @@ def classify_and_save(ndvi_path, output_path):
     label_array = ndvi_to_class(ndvi, nodata_value=ndvi_nodata)
     meta.update(dtype=rasterio.uint8, count=1, nodata=255)
 
-    with rasterio.open(output_path, "w", **meta) as dest:
+    with open_raster_for_write(output_path, meta) as dest:
         dest.write(label_array, 1)
 
     print(f"[✔] Labeled raster saved: {output_path}")
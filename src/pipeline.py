@@ -0,0 +1,201 @@
+import os
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.instrumentation import measure_stage
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Naikkan versi ini jika format state berubah agar semua tugas dijalankan ulang
+PIPELINE_STATE_VERSION = 1
+
+class Task:
+    """Satu tahap pipeline.
+
+    func(config, products) menjalankan tahap dan mengembalikan dict produk (mis. path output)
+    yang diteruskan ke tugas berikutnya. inputs(config, products) dan outputs(config, products)
+    mengembalikan daftar path file; config_keys adalah kunci bertitik (mis. "prediction" atau
+    "processing.block_size") yang memengaruhi hasil tahap ini.
+    """
+
+    def __init__(self, name, func, deps=(), inputs=None, outputs=None, config_keys=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.inputs = inputs or (lambda config, products: [])
+        self.outputs = outputs or (lambda config, products: [])
+        self.config_keys = tuple(config_keys)
+
+def _config_slice(config, keys):
+    config_slice = {}
+    for key in keys:
+        value = config
+        for part in key.split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        config_slice[key] = value
+    return config_slice
+
+def _files_signature(paths, hash_contents):
+    # Diimpor di sini: src.preprocessing memuat geopandas, yang tidak dibutuhkan untuk membangun graf
+    from src.preprocessing import file_signature
+    signature = {}
+    for path in paths:
+        try:
+            signature[os.path.abspath(path)] = file_signature(path, hash_contents)
+        except FileNotFoundError:
+            signature[os.path.abspath(path)] = None
+    return signature
+
+def _task_signature(task, config, products, hash_contents):
+    payload = json.dumps({
+        "version": PIPELINE_STATE_VERSION,
+        "task": task.name,
+        "config": _config_slice(config, task.config_keys),
+        "inputs": _files_signature(task.inputs(config, products), hash_contents),
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _ordered(tasks):
+    """Urutan topologis; error jika ada dependensi yang tidak dikenal atau siklus."""
+    by_name = {task.name: task for task in tasks}
+    ordered, visiting, done = [], set(), set()
+
+    def visit(task):
+        if task.name in done:
+            return
+        if task.name in visiting:
+            raise ValueError(f"Siklus dependensi pada tugas '{task.name}'.")
+        visiting.add(task.name)
+        for dep in task.deps:
+            if dep not in by_name:
+                raise ValueError(f"Tugas '{task.name}' bergantung pada tugas yang tidak dikenal: '{dep}'.")
+            visit(by_name[dep])
+        visiting.discard(task.name)
+        done.add(task.name)
+        ordered.append(task)
+
+    for task in tasks:
+        visit(task)
+    return ordered
+
+def select_tasks(tasks, targets=None):
+    """Tugas target beserta semua dependensinya (targets None = semua tugas)."""
+    if targets is None:
+        return list(tasks)
+    by_name = {task.name: task for task in tasks}
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise ValueError(f"Tugas tidak dikenal: {', '.join(unknown)}")
+    selected, stack = set(), list(targets)
+    while stack:
+        name = stack.pop()
+        if name not in selected:
+            selected.add(name)
+            stack.extend(by_name[name].deps)
+    return [task for task in tasks if task.name in selected]
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return {}
+    with open(state_path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _save_state(state, state_path):
+    os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+    tmp_path = f"{state_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, state_path)
+
+def _run_task(task_func, config, products, name=None, raster_paths=(), measure_options=None):
+    # Dijalankan di proses worker (pyplot tidak thread-safe, jadi cabang paralel memakai proses);
+    # pengukuran juga dilakukan di sana agar waktu CPU, RSS, dan I/O milik proses yang menjalankan tahap
+    if measure_options is None:
+        return task_func(config, products) or {}, None
+    with measure_stage(name, raster_paths, **measure_options) as record:
+        task_products = task_func(config, products) or {}
+    return task_products, record
+
+def run_pipeline(tasks, config, state_path, n_workers=1, incremental=True, hash_contents=False, report=None):
+    """Jalankan graf tugas secara inkremental.
+
+    Tugas dilewati jika tanda tangan input (ukuran + mtime, atau hash isi jika hash_contents)
+    dan potongan config-nya sama dengan run terakhir yang tercatat di state_path, dan semua
+    output-nya masih ada dan tidak berubah. Tugas yang dependensinya sudah selesai dan saling
+    independen dijalankan paralel di process pool jika n_workers > 1.
+    Dengan incremental=False, tugas yang dipilih selalu dijalankan ulang.
+    Jika report (RunReport) diberikan, setiap tugas diukur dan tugas yang dilewati dicatat.
+    Mengembalikan dict produk gabungan dari semua tugas.
+    """
+    tasks = _ordered(tasks)
+    state = load_state(state_path)
+    if not incremental:
+        # Hanya entri tugas yang dijalankan yang dibuang; tanda tangan tugas lain tetap tersimpan
+        for task in tasks:
+            state.pop(task.name, None)
+    products = {}
+    finished = set()
+    running = {}
+    pool = None
+    if n_workers > 1:
+        # Diimpor di sini agar impor src.pipeline tetap ringan (lihat benchmarks/startup.py)
+        from src.model_cache import process_pool_context
+        # fork agar tugas di worker mewarisi pengaturan per proses (configure_runtime: raster_output, cache mask batas)
+        pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=process_pool_context())
+
+    def submit_args(task):
+        measure_options = report.stage_options(task.name) if report is not None else None
+        raster_paths = task.inputs(config, products) if report is not None else ()
+        return task.func, config, dict(products), task.name, raster_paths, measure_options
+
+    def record(task, signature, result):
+        task_products, measurement = result
+        if report is not None and measurement is not None:
+            report.add(measurement)
+        products.update(task_products)
+        state[task.name] = {
+            "signature": signature,
+            "products": task_products,
+            "outputs": _files_signature(task.outputs(config, products), hash_contents),
+        }
+        _save_state(state, state_path)
+        finished.add(task.name)
+
+    def is_up_to_date(task, signature):
+        entry = state.get(task.name)
+        if not entry or entry.get("signature") != signature:
+            return False
+        task_products = dict(products, **entry.get("products", {}))
+        outputs = task.outputs(config, task_products)
+        return all(os.path.exists(path) for path in outputs) and \
+            _files_signature(outputs, hash_contents) == entry.get("outputs")
+
+    try:
+        pending = list(tasks)
+        while pending or running:
+            for task in [t for t in pending if all(dep in finished for dep in t.deps)]:
+                pending.remove(task)
+                signature = _task_signature(task, config, products, hash_contents)
+                if is_up_to_date(task, signature):
+                    logger.info(f"[✔] Tahap '{task.name}' tidak berubah, dilewati.")
+                    products.update(state[task.name].get("products", {}))
+                    finished.add(task.name)
+                    if report is not None:
+                        report.skipped(task.name)
+                elif pool is None:
+                    record(task, signature, _run_task(*submit_args(task)))
+                else:
+                    running[pool.submit(_run_task, *submit_args(task))] = (task, signature)
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task, signature = running.pop(future)
+                    record(task, signature, future.result())
+            elif pending and not any(all(dep in finished for dep in t.deps) for t in pending):
+                raise RuntimeError("Tidak ada tugas yang dapat dijalankan; periksa dependensi.")
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    return products
@@ -1,42 +1,116 @@
 import numpy as np
 import rasterio
-import joblib
-# from rasterio.transform import from_origin # Remove unused import
-# from src.utils import mask_by_boundary # Remove if rgb_path is already clipped
-# from src.ndvi_to_class import ndvi_to_class # Remove unused import
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from src.utils import iter_block_windows
+from src.model_cache import load_classifier, process_pool_context
+from src.boundary_mask import get_boundary_mask, OUTSIDE, INSIDE, PARTIAL
+from src.raster_io import open_raster_for_write
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Remove boundary_path parameter as rgb_path is assumed to be clipped
-def predict_land_cover(rgb_path, model_path, output_path):
-    # Baca data RGB yang sudah terpotong
-    with rasterio.open(rgb_path) as src:
-        rgb_data = src.read().transpose((1, 2, 0))  # shape: (H, W, C)
-        meta = src.meta.copy()
-        rgb_nodata = src.nodata # Get nodata from the source
+def _predict_block(clf, rgb_block, rgb_nodata, inside=None):
+    """Prediksi satu blok RGB berbentuk (C, H, W). Mengembalikan label uint8 (H, W), 255 untuk NoData.
+    inside (opsional) adalah mask batas untuk blok yang hanya sebagian berada di dalam batas."""
+    rgb_block = rgb_block.transpose((1, 2, 0))  # shape: (H, W, C)
 
-    # Masking valid pixel
-    # Assuming rgb_data is (H, W, C), check all bands for nodata
-    if rgb_data.ndim == 3:
-        valid_mask = ~np.all(rgb_data == rgb_nodata, axis=-1)
-    else: # Should not happen for RGB, but for robustness (if it's a single band image, but still check nodata)
-        valid_mask = ~(rgb_data == rgb_nodata)
+    # Masking valid pixel, check all bands for nodata
+    valid_mask = ~np.all(rgb_block == rgb_nodata, axis=-1)
+    if inside is not None:
+        valid_mask &= inside
 
-    X = rgb_data[valid_mask]
+    y_pred_block = np.full(valid_mask.shape, 255, dtype=np.uint8) # 255 for NoData
+    if valid_mask.any():
+        y_pred_block[valid_mask] = clf.predict(rgb_block[valid_mask])
+    return y_pred_block
 
-    # Load model
-    clf = joblib.load(model_path)
+def _predict_block_in_worker(model_path, use_lut, rgb_block, rgb_nodata, inside=None):
+    # Model diambil dari cache milik proses worker, jadi hanya dimuat sekali per worker
+    return _predict_block(load_classifier(model_path, use_lut), rgb_block, rgb_nodata, inside)
 
-    # Prediksi
-    logger.info("🚀 Melakukan prediksi tutupan lahan...")
-    y_pred_flat = clf.predict(X) # Predicted values for valid pixels
+def _warm_worker(model_path, lut_options):
+    for use_lut in lut_options:
+        load_classifier(model_path, use_lut)
 
-    # Rekonstruksi array prediksi penuh
-    y_pred_full = np.full(valid_mask.shape, 255, dtype=np.uint8) # 255 for NoData
-    y_pred_full[valid_mask] = y_pred_flat
+def _raster_use_lut(src, use_lut):
+    # LUT hanya berlaku untuk input 3 band uint8
+    return use_lut and src.count == 3 and all(dtype == "uint8" for dtype in src.dtypes)
 
+# rgb_path is assumed to be clipped; boundary_path is only used to skip blocks outside the boundary
+def predict_land_cover(rgb_path, model_path, output_path, block_size=1024, n_workers=1, executor="thread", use_lut=True, boundary_path=None):
+    """Prediksi tutupan lahan secara berjendela (blok per blok).
+
+    Setiap blok dibaca dari rgb_path, diprediksi di thread/process pool, lalu langsung
+    ditulis ke GeoTIFF output sehingga memori puncak bergantung pada block_size,
+    bukan ukuran citra. block_size=None memproses seluruh citra sebagai satu blok.
+    Jika use_lut aktif dan citra berupa RGB uint8, LUT hasil compile_lookup_table
+    (disimpan di samping model) dipakai sebagai pengganti model.
+    Jika boundary_path diberikan, blok yang sepenuhnya di luar batas langsung ditulis sebagai NoData.
+    """
+    predict_land_cover_many([rgb_path], model_path, [output_path], block_size=block_size, n_workers=n_workers,
+                            executor=executor, use_lut=use_lut, boundary_path=boundary_path)
+
+def predict_land_cover_many(rgb_paths, model_path, output_paths, block_size=1024, n_workers=1, executor="thread", use_lut=True, boundary_path=None):
+    """Seperti predict_land_cover, tetapi untuk beberapa citra sekaligus.
+
+    Model dimuat satu kali (lewat cache model per proses) dan pool worker yang sama
+    dipakai untuk semua citra. Dengan executor="process", model dimuat di proses utama sebelum
+    pool dibuat sehingga worker hasil fork mewarisinya (copy-on-write) tanpa memuat ulang.
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError("executor harus 'thread' atau 'process'.")
+    if len(rgb_paths) != len(output_paths):
+        raise ValueError("Jumlah rgb_paths dan output_paths harus sama.")
+
+    if executor == "process" and n_workers > 1:
+        # Varian (LUT atau model) yang benar-benar dipakai tiap citra dimuat sebelum pool dibuat
+        lut_options = set()
+        for rgb_path in rgb_paths:
+            with rasterio.open(rgb_path) as src:
+                lut_options.add(_raster_use_lut(src, use_lut))
+        _warm_worker(model_path, lut_options)
+        pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=process_pool_context(),
+                                   initializer=_warm_worker, initargs=(model_path, lut_options))
+    else:
+        pool = ThreadPoolExecutor(max_workers=max(1, n_workers))
+
+    with pool:
+        for rgb_path, output_path in zip(rgb_paths, output_paths):
+            with rasterio.open(rgb_path) as src, \
+                 _open_prediction_output(src, output_path) as dst:
+                rgb_nodata = src.nodata # Get nodata from the source
+                raster_use_lut = _raster_use_lut(src, use_lut)
+
+                # Load model
+                if isinstance(pool, ProcessPoolExecutor):
+                    submit_block = lambda block, inside: pool.submit(_predict_block_in_worker, model_path, raster_use_lut, block, rgb_nodata, inside)
+                else:
+                    clf = load_classifier(model_path, raster_use_lut)
+                    submit_block = lambda block, inside: pool.submit(_predict_block, clf, block, rgb_nodata, inside)
+                boundary = get_boundary_mask(boundary_path, src.crs, src.transform, src.shape) if boundary_path else None
+
+                # Prediksi
+                logger.info(f"🚀 Melakukan prediksi tutupan lahan untuk {rgb_path} (blok={block_size}, worker={n_workers}, executor={executor})...")
+                # Batasi jumlah blok yang sedang diproses agar memori tetap terkendali
+                max_in_flight = 2 * max(1, n_workers)
+                pending = {}
+                for window in iter_block_windows(src.width, src.height, block_size):
+                    status = boundary.block_status(window) if boundary is not None else INSIDE
+                    if status == OUTSIDE:
+                        # Blok di luar batas tidak perlu dibaca maupun diprediksi
+                        dst.write(np.full((int(window.height), int(window.width)), 255, dtype=np.uint8), 1, window=window)
+                        continue
+                    if len(pending) >= max_in_flight:
+                        _write_completed(pending, dst, return_when=FIRST_COMPLETED)
+                    inside = boundary.read(window) if status == PARTIAL else None
+                    pending[submit_block(src.read(window=window), inside)] = window
+                _write_completed(pending, dst)
+
+            logger.info(f"✅ Hasil prediksi disimpan ke: {output_path}")
+
+def _open_prediction_output(src, output_path):
     # Simpan ke raster
+    meta = src.meta.copy()
     meta.update({
         "count": 1,
         "dtype": "uint8",
@@ -44,10 +118,12 @@ def predict_land_cover(rgb_path, model_path, output_path):
         # Keep original transform, height, width, crs from the clipped RGB.
         # These are already correct from src.meta.
     })
-    with rasterio.open(output_path, "w", **meta) as dst:
-        dst.write(y_pred_full, 1)
+    return open_raster_for_write(output_path, meta)
 
-    logger.info(f"✅ Hasil prediksi disimpan ke: {output_path}")
+def _write_completed(pending, dst, return_when="ALL_COMPLETED"):
+    done, _ = wait(pending, return_when=return_when)
+    for future in done:
+        dst.write(future.result(), 1, window=pending.pop(future))
 
 if __name__ == "__main__":
     predict_land_cover(
@@ -1,13 +1,27 @@
 import os
+import json
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import yaml
 import rasterio
-from rasterio.mask import mask
+import math
+from contextlib import ExitStack
+from rasterio.features import geometry_window, bounds as feature_bounds
+from rasterio.errors import WindowError
+from rasterio.vrt import WarpedVRT
+from rasterio.windows import Window
+from affine import Affine
 import geopandas as gpd
 from shapely.geometry import mapping
 from rasterio.warp import calculate_default_transform, reproject, Resampling
 from pyproj import CRS, Transformer
 import logging
 import numpy as np
+from src.boundary_mask import get_boundary_mask, OUTSIDE, PARTIAL
+from src.raster_io import open_raster_for_write, get_options as get_raster_output_options
+from src.model_cache import process_pool_context
 
 logger = logging.getLogger(__name__)
 
@@ -74,7 +88,7 @@ def reproject_to_utm(input_path, output_dir, file_type):
                 resampling=Resampling.nearest
             )
 
-            with rasterio.open(output_path, 'w', **kwargs) as dst:
+            with open_raster_for_write(output_path, kwargs) as dst:
                 dst.write(destination_data)
 
         logger.info(f"[✔] Raster reprojected and saved: {output_path}")
@@ -121,7 +135,18 @@ def crop_raster_to_shapefile(raster_path, shapefile_path, output_path):
         if np.issubdtype(src.meta['dtype'], np.floating):
             nodata_value = np.nan # Gunakan NaN untuk tipe data float
 
-        out_image, out_transform = mask(src, geometries, crop=True, filled=True, nodata=nodata_value)
+        # Setara dengan rasterio.mask.mask(crop=True, filled=True), tetapi mask batas diambil
+        # dari cache bersama (src.boundary_mask) sehingga tidak dirasterisasi ulang per raster
+        try:
+            window = geometry_window(src, geometries)
+        except WindowError:
+            raise ValueError("Input shapes do not overlap raster.")
+        out_transform = src.window_transform(window)
+        boundary = get_boundary_mask(shapefile_path, src.crs, out_transform, (window.height, window.width))
+
+        out_image = src.read(window=window, masked=True)
+        out_image.mask = out_image.mask | ~boundary.read()
+        out_image = out_image.filled(nodata_value)
         out_meta = src.meta.copy()
 
     out_meta.update({
@@ -132,7 +157,7 @@ def crop_raster_to_shapefile(raster_path, shapefile_path, output_path):
         "nodata": nodata_value # Pastikan nodata value juga diperbarui di metadata
     })
 
-    with rasterio.open(output_path, "w", **out_meta) as dest:
+    with open_raster_for_write(output_path, out_meta) as dest:
         # Pastikan out_image memiliki dimensi yang benar untuk dest.write
         # Jika out_image.ndim == 2 (untuk band tunggal), perlu diubah menjadi (1, H, W)
         if out_image.ndim == 2:
@@ -142,44 +167,299 @@ def crop_raster_to_shapefile(raster_path, shapefile_path, output_path):
 
     logger.info(f"[✔] Cropped saved: {output_path}")
 
-def preprocess(ndvi_from_path, ndvi_to_path, rgb_path, boundary_path, output_dir):
+def _geometry_window_on_grid(geometries, transform, width, height):
+    """Jendela piksel terluar yang memuat geometri pada grid (transform, width, height);
+    sama dengan rasterio.features.geometry_window tetapi tanpa dataset."""
+    all_bounds = [feature_bounds(geom, transform=~transform) for geom in geometries]
+    cols = [x for (left, _, right, _) in all_bounds for x in (left, right)]
+    rows = [y for (_, bottom, _, top) in all_bounds for y in (top, bottom)]
+    row_start, row_stop = int(math.floor(min(rows))), int(math.ceil(max(rows)))
+    col_start, col_stop = int(math.floor(min(cols))), int(math.ceil(max(cols)))
+    window = Window(col_start, row_start, max(col_stop - col_start, 0), max(row_stop - row_start, 0))
+    try:
+        return window.intersection(Window(0, 0, width, height))
+    except WindowError:
+        raise ValueError("Input shapes do not overlap raster.")
+
+def _native_resolution(raster_path, target_crs):
+    """Ukuran piksel (m) raster setelah direproyeksi ke target_crs, seperti pada reproject_to_utm."""
+    with rasterio.open(raster_path) as src:
+        if src.crs == target_crs:
+            transform = src.transform
+        else:
+            transform, _, _ = calculate_default_transform(src.crs, target_crs, src.width, src.height, *src.bounds)
+    return min(abs(transform.a), abs(transform.e))
+
+def compute_target_grid(boundary_path, raster_paths, resolution=None):
+    """Grid target bersama untuk satu run: CRS batas (UTM), ukuran piksel, dan origin yang di-snap.
+
+    resolution None berarti ukuran piksel terhalus di antara raster_paths setelah reprojeksi.
+    Tepi grid dibulatkan ke kelipatan ukuran piksel di sekitar bounds batas, sehingga batas dan
+    resolusi yang sama selalu menghasilkan grid yang sama persis, apa pun raster sumbernya.
+    Mengembalikan dict berisi crs, transform, width dan height.
+    """
+    gdf = gpd.read_file(boundary_path)
+    target_crs = rasterio.crs.CRS.from_user_input(gdf.crs.to_wkt())
+    if resolution is None:
+        if not raster_paths:
+            raise ValueError("resolution harus diberikan jika tidak ada raster input.")
+        resolution = min(_native_resolution(path, target_crs) for path in raster_paths)
+    resolution = float(resolution)
+
+    minx, miny, maxx, maxy = gdf.total_bounds
+    left = math.floor(minx / resolution) * resolution
+    bottom = math.floor(miny / resolution) * resolution
+    right = math.ceil(maxx / resolution) * resolution
+    top = math.ceil(maxy / resolution) * resolution
+    width = max(int(round((right - left) / resolution)), 1)
+    height = max(int(round((top - bottom) / resolution)), 1)
+
+    grid = {
+        "crs": target_crs,
+        "transform": Affine(resolution, 0.0, left, 0.0, -resolution, top),
+        "width": width,
+        "height": height,
+    }
+    logger.info(f"[*] Grid target: {target_crs.to_string()}, piksel {resolution} m, {width}x{height}, origin ({left}, {top})")
+    return grid
+
+def _grid_signature(grid):
+    if grid is None:
+        return None
+    return {
+        "crs": grid["crs"].to_wkt(),
+        "transform": [round(v, 9) for v in tuple(grid["transform"])[:6]],
+        "width": grid["width"],
+        "height": grid["height"],
+    }
+
+def warp_and_crop(raster_path, shapefile_path, output_path, block_size=1024, grid=None):
+    """Reprojeksi dan pemotongan dalam satu lintasan berjendela.
+
+    Jika grid (lihat compute_target_grid) diberikan, raster di-warp tepat ke grid tersebut sehingga
+    semua raster dalam satu run sejajar piksel demi piksel. Tanpa grid, footprint batas
+    (shapefile_path, sudah dalam UTM) dihitung pada grid UTM yang sama dengan reproject_to_utm.
+    Hanya jendela tersebut yang di-warp blok per blok lewat WarpedVRT dan langsung dipotong/di-mask.
+    Memori bergantung pada block_size dan ukuran AOI, bukan ukuran scene.
+    """
+    gdf = gpd.read_file(shapefile_path)
+    geometries = [mapping(geom) for geom in gdf.geometry]
+    target_crs = grid["crs"] if grid is not None else rasterio.crs.CRS.from_user_input(gdf.crs.to_wkt())
+
+    with ExitStack() as stack:
+        src = stack.enter_context(rasterio.open(raster_path))
+        nodata_value = src.nodata if src.nodata is not None else 0 # Default ke 0 jika src.nodata tidak ada
+        if np.issubdtype(src.meta['dtype'], np.floating):
+            nodata_value = np.nan # Gunakan NaN untuk tipe data float
+
+        if grid is not None:
+            out_transform, out_width, out_height = grid["transform"], grid["width"], grid["height"]
+        else:
+            if src.crs == target_crs:
+                grid_transform, grid_width, grid_height = src.transform, src.width, src.height
+            else:
+                grid_transform, grid_width, grid_height = calculate_default_transform(
+                    src.crs, target_crs, src.width, src.height, *src.bounds
+                )
+            window = _geometry_window_on_grid(geometries, grid_transform, grid_width, grid_height)
+            out_transform = rasterio.windows.transform(window, grid_transform)
+            out_height, out_width = int(window.height), int(window.width)
+
+        if grid is None and src.crs == target_crs:
+            reader, offset = src, window
+        else:
+            logger.info(f"[*] Warping '{raster_path}' ({src.crs.to_string() if src.crs else 'unknown CRS'}) ke {target_crs.to_string()}...")
+            # VRT hanya mencakup jendela AOI sehingga hanya piksel sumber yang dibutuhkan yang dibaca
+            reader = stack.enter_context(WarpedVRT(
+                src, crs=target_crs, transform=out_transform, width=out_width, height=out_height,
+                resampling=Resampling.nearest, src_nodata=src.nodata, nodata=src.nodata
+            ))
+            offset = Window(0, 0, out_width, out_height)
+
+        boundary = get_boundary_mask(shapefile_path, target_crs, out_transform, (out_height, out_width))
+
+        out_meta = src.meta.copy()
+        out_meta.update({
+            "height": out_height,
+            "width": out_width,
+            "transform": out_transform,
+            "crs": target_crs,
+            "nodata": nodata_value # Pastikan nodata value juga diperbarui di metadata
+        })
+
+        with open_raster_for_write(output_path, out_meta) as dest:
+            for block, status in boundary.iter_blocks(block_size):
+                if status == OUTSIDE:
+                    dest.write(np.full((src.count, int(block.height), int(block.width)), nodata_value, dtype=out_meta["dtype"]), window=block)
+                    continue
+                source_window = Window(offset.col_off + block.col_off, offset.row_off + block.row_off, block.width, block.height)
+                data = reader.read(window=source_window, masked=True)
+                if status == PARTIAL:
+                    data.mask = data.mask | ~boundary.read(block)
+                dest.write(data.filled(nodata_value), window=block)
+
+    logger.info(f"[✔] Warped and cropped saved: {output_path}")
+
+# Naikkan versi ini jika algoritma reprojeksi/pemotongan berubah agar cache lama tidak dipakai lagi
+PREPROCESS_CACHE_VERSION = 3
+
+def _related_files(path):
+    """File yang membentuk satu input; untuk shapefile termasuk file pendamping (.shx, .dbf, .prj, ...)."""
+    stem, ext = os.path.splitext(path)
+    if ext.lower() != ".shp":
+        return [path]
+    directory = os.path.dirname(path) or "."
+    prefix = os.path.basename(stem) + "."
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory) if name.startswith(prefix))
+
+def file_signature(path, hash_contents=False):
+    """Tanda pengenal input untuk kunci cache: path, ukuran dan mtime; atau hash isi jika hash_contents=True."""
+    signature = []
+    for file_path in _related_files(path):
+        stat = os.stat(file_path)
+        entry = {"path": os.path.abspath(file_path), "size": stat.st_size}
+        if hash_contents:
+            digest = hashlib.sha1()
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+                    digest.update(chunk)
+            entry["sha1"] = digest.hexdigest()
+        else:
+            entry["mtime_ns"] = stat.st_mtime_ns
+        signature.append(entry)
+    return signature
+
+def preprocess_cache_key(raster_path, boundary_path, hash_contents=False, grid=None):
+    payload = json.dumps({
+        "version": PREPROCESS_CACHE_VERSION,
+        "raster": file_signature(raster_path, hash_contents),
+        "boundary": file_signature(boundary_path, hash_contents),
+        "grid": _grid_signature(grid),
+        "raster_output": get_raster_output_options(),
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def _link_or_copy(source_path, output_path):
+    if os.path.abspath(source_path) == os.path.abspath(output_path):
+        return
+    if os.path.lexists(output_path):
+        os.remove(output_path)
+    try:
+        os.link(source_path, output_path)
+    except OSError:
+        shutil.copy2(source_path, output_path)
+
+def preprocess_raster(raster_path, boundary_path, reprojected_boundary_path, output_path, cache_dir=None, hash_contents=False, block_size=1024, grid=None):
+    """Reprojeksi dan potong satu raster ke batas area (lihat warp_and_crop).
+
+    Jika cache_dir diberikan, hasil disimpan di sana dengan kunci dari tanda pengenal raster,
+    batas asli dan grid target; input yang sama (termasuk duplikat dalam satu run) langsung memakai hasil cache.
+    """
+    if cache_dir is None:
+        warp_and_crop(raster_path, reprojected_boundary_path, output_path, block_size=block_size, grid=grid)
+        return output_path
+
+    key = preprocess_cache_key(raster_path, boundary_path, hash_contents, grid)
+    cached_path = os.path.join(cache_dir, f"{key}.tif")
+    if os.path.exists(cached_path):
+        logger.info(f"[✔] Cache pra-pemrosesan dipakai untuk '{raster_path}': {cached_path}")
+    else:
+        # Ditulis ke file sementara lalu dipindahkan secara atomik
+        tmp_path = os.path.join(cache_dir, f"tmp_{key}_{os.getpid()}_{threading.get_ident()}.tif")
+        warp_and_crop(raster_path, reprojected_boundary_path, tmp_path, block_size=block_size, grid=grid)
+        os.replace(tmp_path, cached_path)
+
+    _link_or_copy(cached_path, output_path)
+    return output_path
+
+def _preprocess_job(job, gdal_options):
+    # Dijalankan di thread/process pool; setiap job membuka Env GDAL sendiri
+    with rasterio.Env(**gdal_options):
+        return preprocess_raster(**job)
+
+def preprocess_rasters(raster_paths, boundary_path, output_dir, cache_dir=None, hash_contents=False, block_size=1024, resolution=None,
+                       n_workers=1, executor="thread", gdal_options=None):
+    """Pra-pemrosesan sekumpulan raster ke satu grid target bersama.
+
+    raster_paths adalah dict {nama file output: path input}; input bernilai None dilewati.
+    Grid dihitung sekali dari batas (lihat compute_target_grid) dan setiap raster di-warp ke grid
+    tersebut tepat satu kali, sehingga semua hasil memiliki CRS, transform dan ukuran yang sama.
+    Raster yang independen diproses paralel di thread/process pool dengan n_workers worker;
+    input yang sama hanya diproses sekali. gdal_options (mis. GDAL_NUM_THREADS, GDAL_CACHEMAX)
+    dipasang lewat rasterio.Env di setiap job. Hasil tidak bergantung pada urutan selesainya job.
+    Mengembalikan ({nama file output: path hasil atau None}, path batas hasil reprojeksi).
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError("executor harus 'thread' atau 'process'.")
+    gdal_options = dict(gdal_options or {})
+
     os.makedirs(output_dir, exist_ok=True)
     reprojected_data_temp_dir = os.path.join(output_dir, "reprojected_temp")
     os.makedirs(reprojected_data_temp_dir, exist_ok=True)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
 
-    reprojected_ndvi_from_path = reproject_to_utm(ndvi_from_path, reprojected_data_temp_dir, "raster")
-    reprojected_ndvi_to_path = reproject_to_utm(ndvi_to_path, reprojected_data_temp_dir, "raster")
-    reprojected_rgb_path = reproject_to_utm(rgb_path, reprojected_data_temp_dir, "raster")
-    reprojected_boundary_path = reproject_to_utm(boundary_path, reprojected_data_temp_dir, "vector")
+    with rasterio.Env(**gdal_options):
+        reprojected_boundary_path = reproject_to_utm(boundary_path, reprojected_data_temp_dir, "vector")
+        grid = compute_target_grid(reprojected_boundary_path, [path for path in raster_paths.values() if path is not None], resolution)
 
-    ndvi_from_clipped_path = os.path.join(output_dir, "ndvi_from_clipped.tif")
-    ndvi_to_clipped_path = os.path.join(output_dir, "ndvi_to_clipped.tif")
-    rgb_clipped_path = os.path.join(output_dir, "rgb_clipped.tif")
+    # Kelompokkan output berdasarkan input agar raster yang sama tidak di-warp dua kali
+    outputs_by_input = {}
+    for clipped_name, input_path in raster_paths.items():
+        if input_path is not None:
+            outputs_by_input.setdefault(os.path.abspath(input_path), []).append(os.path.join(output_dir, clipped_name))
 
-    crop_raster_to_shapefile(
-        raster_path=reprojected_ndvi_from_path,
-        shapefile_path=reprojected_boundary_path,
-        output_path=ndvi_from_clipped_path
-    )
+    jobs = [{
+        "raster_path": input_path,
+        "boundary_path": boundary_path,
+        "reprojected_boundary_path": reprojected_boundary_path,
+        "output_path": output_paths[0],
+        "cache_dir": cache_dir,
+        "hash_contents": hash_contents,
+        "block_size": block_size,
+        "grid": grid,
+    } for input_path, output_paths in outputs_by_input.items()]
 
-    crop_raster_to_shapefile(
-        raster_path=reprojected_ndvi_to_path,
-        shapefile_path=reprojected_boundary_path,
-        output_path=ndvi_to_clipped_path
-    )
+    n_workers = max(1, min(n_workers, len(jobs)))
+    if n_workers == 1:
+        for job in jobs:
+            _preprocess_job(job, gdal_options)
+    else:
+        logger.info(f"[*] Pra-pemrosesan {len(jobs)} raster secara paralel (worker={n_workers}, executor={executor})...")
+        if executor == "process":
+            # fork agar worker mewarisi opsi raster_output dan folder cache mask batas milik proses utama
+            # (keduanya ikut menentukan isi hasil yang dicatat di cache pra-pemrosesan)
+            pool = ProcessPoolExecutor(max_workers=n_workers, mp_context=process_pool_context())
+        else:
+            pool = ThreadPoolExecutor(max_workers=n_workers)
+        with pool:
+            # list() agar error dari worker mana pun langsung muncul
+            list(pool.map(_preprocess_job, jobs, [gdal_options] * len(jobs)))
 
-    crop_raster_to_shapefile(
-        raster_path=reprojected_rgb_path,
-        shapefile_path=reprojected_boundary_path,
-        output_path=rgb_clipped_path
-    )
+    for output_paths in outputs_by_input.values():
+        for duplicate_path in output_paths[1:]:
+            _link_or_copy(output_paths[0], duplicate_path)
 
-    # Clean up temporary reprojected files (optional, can be uncommented later if needed)
-    # for f in os.listdir(reprojected_data_temp_dir):
-    #     os.remove(os.path.join(reprojected_data_temp_dir, f))
-    # os.rmdir(reprojected_data_temp_dir)
+    clipped_paths = {
+        clipped_name: None if input_path is None else os.path.join(output_dir, clipped_name)
+        for clipped_name, input_path in raster_paths.items()
+    }
+    return clipped_paths, reprojected_boundary_path
 
-    return ndvi_from_clipped_path, ndvi_to_clipped_path, rgb_clipped_path, reprojected_boundary_path
+def preprocess(ndvi_from_path, ndvi_to_path, rgb_path, boundary_path, output_dir, cache_dir=None, hash_contents=False, block_size=1024, resolution=None,
+               n_workers=1, executor="thread", gdal_options=None):
+    """Pra-pemrosesan raster input ke satu grid bersama. Input bernilai None dilewati dan jalurnya
+    dikembalikan sebagai None, sehingga setiap mode hanya memproses raster yang benar-benar dibutuhkan."""
+    clipped_paths, reprojected_boundary_path = preprocess_rasters(
+        {"ndvi_from_clipped.tif": ndvi_from_path,
+         "ndvi_to_clipped.tif": ndvi_to_path,
+         "rgb_clipped.tif": rgb_path},
+        boundary_path, output_dir, cache_dir=cache_dir, hash_contents=hash_contents,
+        block_size=block_size, resolution=resolution,
+        n_workers=n_workers, executor=executor, gdal_options=gdal_options
+    )
+    return (clipped_paths["ndvi_from_clipped.tif"], clipped_paths["ndvi_to_clipped.tif"],
+            clipped_paths["rgb_clipped.tif"], reprojected_boundary_path)
 
 if __name__ == "__main__":
     print("This script is primarily intended to be called by main.py.")
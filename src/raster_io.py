@@ -0,0 +1,126 @@
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Kompresi yang didukung; predictor hanya berlaku untuk ketiganya
+COMPRESSIONS = ("deflate", "zstd", "lzw", "none")
+
+# Opsi default; dapat diganti lewat configure (mis. dari bagian raster_output di config.yaml)
+_options = {
+    "tiled": True,
+    "blocksize": 512,
+    "compress": "deflate",
+    "predictor": True,
+    "level": None,
+    "overviews": True,
+    "overview_resampling": "nearest",
+    "cog": False,
+}
+
+def configure(options=None):
+    """Ganti opsi penulisan raster untuk seluruh proses; kunci yang tidak diberikan memakai default."""
+    options = dict(options or {})
+    unknown = set(options) - set(_options)
+    if unknown:
+        raise ValueError(f"Opsi raster_output tidak dikenal: {', '.join(sorted(unknown))}")
+    compress = str(options.get("compress", _options["compress"]) or "none").lower()
+    if compress not in COMPRESSIONS:
+        raise ValueError(f"compress harus salah satu dari {', '.join(COMPRESSIONS)}.")
+    blocksize = int(options.get("blocksize", _options["blocksize"]))
+    if blocksize % 16:
+        raise ValueError("blocksize harus kelipatan 16.")
+    options.update(compress=compress, blocksize=blocksize)
+    _options.update(options)
+
+def get_options():
+    return dict(_options)
+
+def _predictor(dtype):
+    # 2 = selisih horizontal (integer), 3 = floating point
+    return 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+
+def output_profile(profile, **updates):
+    """Profil GTiff untuk ditulis: salinan profile/meta sumber plus updates, dengan layout tile,
+    kompresi dan predictor dari opsi raster_output. Kunci layout lama (mis. striping) ditimpa."""
+    profile = dict(profile)
+    profile.update(updates)
+    for key in ("blockxsize", "blockysize", "tiled", "compress", "predictor", "zlevel", "zstd_level", "interleave"):
+        profile.pop(key, None)
+    profile["driver"] = "GTiff"
+    profile["BIGTIFF"] = "IF_SAFER"
+
+    if _options["tiled"]:
+        profile.update(tiled=True, blockxsize=_options["blocksize"], blockysize=_options["blocksize"])
+    if profile.get("count", 1) > 1:
+        profile["interleave"] = "pixel"
+
+    compress = _options["compress"]
+    if compress != "none":
+        profile["compress"] = compress
+        if _options["predictor"]:
+            profile["predictor"] = _predictor(profile["dtype"])
+        if _options["level"] is not None:
+            profile["zstd_level" if compress == "zstd" else "zlevel"] = int(_options["level"])
+    return profile
+
+def _overview_factors(width, height, blocksize):
+    factors, factor = [], 2
+    while max(width, height) / factor >= blocksize / 2 and factor <= 1024:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+def _build_overviews(path):
+    with rasterio.open(path, "r+") as dst:
+        factors = _overview_factors(dst.width, dst.height, _options["blocksize"])
+        if not factors:
+            return
+        resampling = Resampling[_options["overview_resampling"]]
+        dst.build_overviews(factors, resampling)
+        dst.update_tags(ns="rio_overview", resampling=resampling.name)
+
+def _copy_to_cog(source_path, path):
+    creation_options = {
+        "BLOCKSIZE": _options["blocksize"],
+        "BIGTIFF": "IF_SAFER",
+        "COMPRESS": _options["compress"].upper(),
+        "OVERVIEWS": "IGNORE_EXISTING" if _options["overviews"] else "NONE",
+        "OVERVIEW_RESAMPLING": _options["overview_resampling"].upper(),
+    }
+    if _options["compress"] != "none":
+        if _options["predictor"]:
+            creation_options["PREDICTOR"] = "YES"
+        if _options["level"] is not None:
+            creation_options["LEVEL"] = int(_options["level"])
+    rasterio.shutil.copy(source_path, path, driver="COG", **creation_options)
+
+@contextmanager
+def open_raster_for_write(path, profile, **updates):
+    """Pengganti rasterio.open(path, "w", **profile) untuk semua output raster.
+
+    Raster ditulis sebagai GTiff ber-tile dan terkompresi (lihat output_profile). Setelah ditutup,
+    overview internal dibangun jika diaktifkan; jika cog aktif, hasil akhir disalin ke
+    Cloud-Optimized GeoTIFF lewat driver COG. Path akhir hanya muncul setelah penulisan berhasil.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.tif"
+    try:
+        with rasterio.open(tmp_path, "w", **output_profile(profile, **updates)) as dst:
+            yield dst
+        if _options["cog"]:
+            _copy_to_cog(tmp_path, path)
+            os.remove(tmp_path)
+        else:
+            if _options["overviews"]:
+                _build_overviews(tmp_path)
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
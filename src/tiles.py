@@ -0,0 +1,231 @@
+import os
+import json
+import math
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform, transform_bounds
+import matplotlib.image as mpimg
+from src.utils import iter_block_windows
+from src.generate_static_map import colorize
+from src.model_cache import process_pool_context
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEB_MERCATOR = CRS.from_epsg(3857)
+TILE_SIZE = 256
+# Setengah keliling bumi pada Web Mercator (m)
+ORIGIN_SHIFT = 20037508.342789244
+MAX_ZOOM = 22
+MANIFEST_NAME = "tiles_manifest.json"
+# Naikkan versi ini jika cara render tile berubah agar semua tile dibuat ulang
+TILES_VERSION = 1
+
+def tile_resolution(zoom):
+    """Ukuran piksel (m) tile Web Mercator pada zoom tertentu."""
+    return 2 * ORIGIN_SHIFT / (TILE_SIZE * 2 ** zoom)
+
+def tile_transform(zoom, x, y):
+    size = TILE_SIZE * tile_resolution(zoom)
+    return from_origin(-ORIGIN_SHIFT + x * size, ORIGIN_SHIFT - y * size, tile_resolution(zoom), tile_resolution(zoom))
+
+def tiles_for_bounds(bounds, zoom):
+    """Daftar (x, y) tile pada zoom yang berpotongan dengan bounds (left, bottom, right, top) dalam EPSG:3857."""
+    left, bottom, right, top = bounds
+    size = TILE_SIZE * tile_resolution(zoom)
+    n = 2 ** zoom
+    x0 = max(0, int(math.floor((left + ORIGIN_SHIFT) / size)))
+    x1 = min(n - 1, int(math.ceil((right + ORIGIN_SHIFT) / size)) - 1)
+    y0 = max(0, int(math.floor((ORIGIN_SHIFT - top) / size)))
+    y1 = min(n - 1, int(math.ceil((ORIGIN_SHIFT - bottom) / size)) - 1)
+    return [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+
+def default_zoom_range(src):
+    """max_zoom: zoom pertama yang ukuran pikselnya tidak lebih kasar dari raster; min_zoom: zoom
+    ketika seluruh raster muat dalam satu tile."""
+    transform, _, _ = calculate_default_transform(src.crs, WEB_MERCATOR, src.width, src.height, *src.bounds)
+    max_zoom = min(MAX_ZOOM, max(0, int(math.ceil(math.log2(2 * ORIGIN_SHIFT / (TILE_SIZE * abs(transform.a)))))))
+    left, bottom, right, top = transform_bounds(src.crs, WEB_MERCATOR, *src.bounds)
+    extent = max(right - left, top - bottom, 1e-9)
+    min_zoom = min(max_zoom, max(0, int(math.floor(math.log2(2 * ORIGIN_SHIFT / extent)))))
+    return min_zoom, max_zoom
+
+def tile_path(tiles_dir, zoom, x, y):
+    return os.path.join(tiles_dir, str(zoom), str(x), f"{y}.png")
+
+def _write_tile(path, rgba):
+    """Tulis tile RGBA; tile yang seluruhnya transparan tidak ditulis (dan versi lamanya dihapus)."""
+    if not rgba[..., 3].any():
+        if os.path.exists(path):
+            os.remove(path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp.png"
+    mpimg.imsave(tmp_path, rgba, format="png")
+    os.replace(tmp_path, path)
+    return True
+
+def _read_tile(path):
+    if not os.path.exists(path):
+        return np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    return (mpimg.imread(path) * 255).round().astype(np.uint8)
+
+def _render_base_tiles(raster_path, tiles_dir, zoom, tiles, palette):
+    """Render tile zoom maksimum langsung dari raster sumber (warp nearest ke grid tile)."""
+    written = 0
+    with rasterio.open(raster_path) as src:
+        for x, y in tiles:
+            with WarpedVRT(src, crs=WEB_MERCATOR, transform=tile_transform(zoom, x, y), width=TILE_SIZE, height=TILE_SIZE,
+                           resampling=Resampling.nearest, src_nodata=src.nodata, nodata=src.nodata) as vrt:
+                codes = vrt.read(1, masked=True)
+            rgba = colorize(codes.filled(0).astype(np.int64), palette, valid=~np.ma.getmaskarray(codes))
+            written += _write_tile(tile_path(tiles_dir, zoom, x, y), rgba)
+    return written
+
+def _render_parent_tiles(tiles_dir, zoom, tiles):
+    """Bangun tile zoom z dari 4 tile anak di zoom z + 1 (decimasi nearest 2x2), tanpa membaca raster sumber."""
+    written = 0
+    for x, y in tiles:
+        mosaic = np.zeros((2 * TILE_SIZE, 2 * TILE_SIZE, 4), dtype=np.uint8)
+        for dx in (0, 1):
+            for dy in (0, 1):
+                child = _read_tile(tile_path(tiles_dir, zoom + 1, 2 * x + dx, 2 * y + dy))
+                mosaic[dy * TILE_SIZE:(dy + 1) * TILE_SIZE, dx * TILE_SIZE:(dx + 1) * TILE_SIZE] = child
+        written += _write_tile(tile_path(tiles_dir, zoom, x, y), mosaic[::2, ::2])
+    return written
+
+def _block_hashes(src, block_size):
+    """Hash isi raster per blok sumber; dipakai untuk menentukan tile mana yang perlu dibuat ulang."""
+    hashes = {}
+    for window in iter_block_windows(src.width, src.height, block_size):
+        digest = hashlib.sha1(src.read(1, window=window).tobytes()).hexdigest()
+        hashes[f"{int(window.col_off)}_{int(window.row_off)}_{int(window.width)}_{int(window.height)}"] = digest
+    return hashes
+
+def _block_bounds(src, key):
+    col_off, row_off, width, height = (int(v) for v in key.split("_"))
+    # Diperlebar satu piksel karena sampling nearest di tepi tile dapat mengambil piksel tetangga
+    window = rasterio.windows.Window(col_off - 1, row_off - 1, width + 2, height + 2)
+    return transform_bounds(src.crs, WEB_MERCATOR, *rasterio.windows.bounds(window, src.transform))
+
+def _prune_tiles(tiles_dir, pyramid):
+    """Hapus tile {z}/{x}/{y}.png yang tidak termasuk piramida baru (dict zoom -> set (x, y)), beserta folder kosong."""
+    removed = 0
+    for zoom_name in os.listdir(tiles_dir):
+        zoom_dir = os.path.join(tiles_dir, zoom_name)
+        if not zoom_name.isdigit() or not os.path.isdir(zoom_dir):
+            continue
+        keep = pyramid.get(int(zoom_name), set())
+        for x_name in os.listdir(zoom_dir):
+            x_dir = os.path.join(zoom_dir, x_name)
+            if not x_name.isdigit() or not os.path.isdir(x_dir):
+                continue
+            for file_name in os.listdir(x_dir):
+                y_name, ext = os.path.splitext(file_name)
+                if ext == ".png" and y_name.isdigit() and (int(x_name), int(y_name)) not in keep:
+                    os.remove(os.path.join(x_dir, file_name))
+                    removed += 1
+            if not os.listdir(x_dir):
+                os.rmdir(x_dir)
+        if not os.listdir(zoom_dir):
+            os.rmdir(zoom_dir)
+    return removed
+
+def _chunks(items, n_chunks):
+    n_chunks = max(1, min(n_chunks, len(items)))
+    return [items[i::n_chunks] for i in range(n_chunks)]
+
+def generate_tiles(raster_path, tiles_dir, palette, min_zoom=None, max_zoom=None, n_workers=1, executor="thread", block_size=1024):
+    """Piramida tile XYZ ({z}/{x}/{y}.png, EPSG:3857) untuk raster kelas atau perubahan.
+
+    palette adalah array RGBA (N + 1, 4) uint8 yang diindeks dengan nilai piksel; baris terakhir
+    dipakai untuk NoData (biasanya transparan). Tile zoom maksimum dirender dari raster sumber,
+    zoom di bawahnya dibangun dari tile anak. Run berikutnya hanya membuat ulang tile yang
+    bloknya (block_size) berubah, berdasarkan hash per blok di tiles_manifest.json.
+    Saat seluruh piramida dibuat ulang, tile lama yang tidak termasuk piramida baru dihapus.
+    Mengembalikan (min_zoom, max_zoom).
+    """
+    if executor not in ("thread", "process"):
+        raise ValueError("executor harus 'thread' atau 'process'.")
+    palette = np.asarray(palette, dtype=np.uint8)
+    os.makedirs(tiles_dir, exist_ok=True)
+    manifest_path = os.path.join(tiles_dir, MANIFEST_NAME)
+
+    with rasterio.open(raster_path) as src:
+        default_min, default_max = default_zoom_range(src)
+        min_zoom = default_min if min_zoom is None else min_zoom
+        max_zoom = default_max if max_zoom is None else max_zoom
+        if min_zoom > max_zoom:
+            raise ValueError("min_zoom tidak boleh lebih besar dari max_zoom.")
+        params = {
+            "version": TILES_VERSION,
+            "palette": palette.tolist(),
+            "zooms": [min_zoom, max_zoom],
+            "crs": src.crs.to_wkt(),
+            "transform": [round(v, 9) for v in tuple(src.transform)[:6]],
+            "shape": [src.height, src.width],
+            "nodata": None if src.nodata is None else str(src.nodata),
+            "block_size": block_size,
+        }
+        hashes = _block_hashes(src, block_size)
+        raster_bounds = transform_bounds(src.crs, WEB_MERCATOR, *src.bounds)
+
+        previous = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                previous = json.load(f)
+
+        all_base_tiles = tiles_for_bounds(raster_bounds, max_zoom)
+        rebuild = previous.get("params") != params
+        if rebuild:
+            dirty = set(all_base_tiles)
+        else:
+            changed = [key for key, digest in hashes.items() if previous.get("blocks", {}).get(key) != digest]
+            dirty = set()
+            for key in changed:
+                dirty.update(tiles_for_bounds(_block_bounds(src, key), max_zoom))
+            dirty &= set(all_base_tiles)
+
+    if not dirty:
+        logger.info(f"[✔] Tile XYZ tidak berubah: {tiles_dir}")
+        return min_zoom, max_zoom
+
+    logger.info(f"[*] Membuat tile XYZ zoom {min_zoom}-{max_zoom} untuk {raster_path} ({len(dirty)} tile zoom {max_zoom} berubah, worker={n_workers})...")
+    if executor == "process":
+        # Konteks yang sama dengan pool prediksi: worker hasil fork mewarisi pengaturan runtime proses utama
+        pool = ProcessPoolExecutor(max_workers=max(1, n_workers), mp_context=process_pool_context())
+    else:
+        pool = ThreadPoolExecutor(max_workers=max(1, n_workers))
+    with pool:
+        jobs = _chunks(sorted(dirty), n_workers * 4)
+        list(pool.map(_render_base_tiles, [raster_path] * len(jobs), [tiles_dir] * len(jobs), [max_zoom] * len(jobs), jobs, [palette] * len(jobs)))
+
+        # Tile induk yang anaknya berubah ikut dibuat ulang, level demi level
+        for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+            dirty = sorted({(x // 2, y // 2) for x, y in dirty})
+            jobs = _chunks(dirty, n_workers * 4)
+            list(pool.map(_render_parent_tiles, [tiles_dir] * len(jobs), [zoom] * len(jobs), jobs))
+
+    if rebuild:
+        # Tile dari piramida lama (zoom, batas, atau raster lain) yang tidak dibuat ulang
+        pyramid = {max_zoom: set(all_base_tiles)}
+        for zoom in range(max_zoom - 1, min_zoom - 1, -1):
+            pyramid[zoom] = {(x // 2, y // 2) for x, y in pyramid[zoom + 1]}
+        removed = _prune_tiles(tiles_dir, pyramid)
+        if removed:
+            logger.info(f"[*] {removed} tile lama di luar piramida baru dihapus.")
+
+    # Manifest ditulis terakhir sehingga run yang terputus akan membuat ulang tile yang sama
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "blocks": hashes}, f)
+    os.replace(tmp_path, manifest_path)
+    logger.info(f"[✔] Tile XYZ disimpan ke: {tiles_dir}")
+    return min_zoom, max_zoom
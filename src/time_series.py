@@ -0,0 +1,277 @@
+import os
+import re
+import json
+import numpy as np
+import rasterio
+from affine import Affine
+from src.config import CLASS_NAMES
+from src.ndvi_to_class import ndvi_to_class
+from src.analyze_change import count_labels, count_transitions, area_stats_from_counts
+from src.preprocessing import preprocess_rasters, file_signature
+from src.raster_io import open_raster_for_write
+from src.utils import iter_block_windows
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Naikkan versi ini jika format penyimpanan deret waktu berubah
+TIME_SERIES_VERSION = 2
+MANIFEST_NAME = "time_series.json"
+NODATA_LABEL = 255
+NO_CHANGE_DATE = np.iinfo(np.uint16).max
+NODATA_CHANGES = np.iinfo(np.uint16).max
+
+# State per piksel yang cukup untuk menambah tanggal baru tanpa membaca band lama: kelas tanggal
+# sebelumnya (untuk transisi berturutan), kelas valid terakhir, jumlah perubahan, indeks tanggal
+# perubahan terakhir, dan id trajektori
+STATE_FIELDS = {
+    "prev_class": (np.uint8, NODATA_LABEL),
+    "last_class": (np.uint8, NODATA_LABEL),
+    "n_changes": (np.uint16, 0),
+    "last_change": (np.uint16, NO_CHANGE_DATE),
+    "trajectory": (np.uint32, 0),
+}
+
+def _manifest_path(series_dir):
+    return os.path.join(series_dir, MANIFEST_NAME)
+
+def load_series(series_dir):
+    """Manifest deret waktu (tanggal, grid, statistik kumulatif, file state), atau None jika belum ada."""
+    path = _manifest_path(series_dir)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("version") != TIME_SERIES_VERSION:
+        raise ValueError(f"Versi deret waktu di {series_dir} tidak didukung; bangun ulang dari awal.")
+    return manifest
+
+def _save_manifest(series_dir, manifest):
+    path = _manifest_path(series_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def open_class_stack(series_dir, manifest=None):
+    """Band kelas per tanggal sebagai daftar (tanggal, memmap uint8 (H, W)) tanpa memuatnya ke memori."""
+    manifest = manifest or load_series(series_dir)
+    if manifest is None:
+        return []
+    return [(entry["date"], np.load(os.path.join(series_dir, entry["band"]), mmap_mode="r")) for entry in manifest["dates"]]
+
+def _grid_from_raster(path):
+    with rasterio.open(path) as src:
+        return {
+            "crs": src.crs.to_wkt(),
+            "transform": [round(v, 9) for v in tuple(src.transform)[:6]],
+            "width": src.width,
+            "height": src.height,
+            "resolution": abs(src.transform.a),
+        }
+
+def _trajectory_lookup(table):
+    # Setiap trajektori adalah simpul pohon prefiks: (id induk, kelas); kunci induk * 256 + kelas -> id
+    return {int(parent) * 256 + int(label): node for node, (parent, label) in enumerate(table.tolist()) if node > 0}
+
+def _extend_trajectories(parent_ids, labels, table_rows, lookup):
+    """Id trajektori baru = trajektori lama diperpanjang dengan kelas tanggal baru (NoData juga dicatat)."""
+    keys = parent_ids.astype(np.int64) * 256 + labels
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    node_ids = np.empty(len(unique_keys), dtype=np.uint32)
+    for i, key in enumerate(unique_keys.tolist()):
+        node = lookup.get(key)
+        if node is None:
+            node = len(table_rows)
+            table_rows.append((key // 256, key % 256))
+            lookup[key] = node
+        node_ids[i] = node
+    return node_ids[inverse].reshape(parent_ids.shape)
+
+def _trajectory_labels(table, node):
+    labels = []
+    while node > 0:
+        parent, label = table[node]
+        labels.append(int(label))
+        node = int(parent)
+    return labels[::-1]
+
+def _class_name(label):
+    return CLASS_NAMES.get(label, "NoData" if label == NODATA_LABEL else f"Kelas {label}")
+
+def add_date(series_dir, date, ndvi_path, boundary_path, block_size=1024, preprocess_kwargs=None, top_trajectories=50):
+    """Tambahkan satu tanggal ke deret waktu secara inkremental.
+
+    Hanya NDVI tanggal baru yang dipra-proses dan diklasifikasikan. Statistik (termasuk matriks
+    transisi berturutan) diperbarui dari state per piksel saja; band tanggal lama tidak dibaca. Tanggal harus lebih baru dari tanggal terakhir (urutan teks, mis. ISO
+    YYYY-MM-DD). Tanggal yang sudah ada dengan input yang sama dilewati. Mengembalikan manifest.
+    """
+    preprocess_kwargs = dict(preprocess_kwargs or {})
+    preprocess_kwargs.setdefault("block_size", block_size)
+    os.makedirs(series_dir, exist_ok=True)
+    manifest = load_series(series_dir)
+    signature = file_signature(ndvi_path, preprocess_kwargs.get("hash_contents", False))
+
+    if manifest is not None:
+        existing = {entry["date"]: entry for entry in manifest["dates"]}
+        if date in existing:
+            if existing[date]["signature"] == signature:
+                logger.info(f"[✔] Tanggal {date} sudah ada di deret waktu dan tidak berubah, dilewati.")
+                return manifest
+            raise ValueError(f"Tanggal {date} sudah ada dengan input berbeda; bangun ulang deret waktu untuk menggantinya.")
+        if date < manifest["dates"][-1]["date"]:
+            raise ValueError(f"Tanggal {date} lebih lama dari tanggal terakhir ({manifest['dates'][-1]['date']}); "
+                             "tanggal hanya dapat ditambahkan secara berurutan.")
+        # Grid tanggal pertama dipakai ulang: batas dan resolusi yang sama menghasilkan grid yang sama persis
+        preprocess_kwargs["resolution"] = manifest["grid"]["resolution"]
+
+    logger.info(f"[*] Menambahkan tanggal {date} ke deret waktu ({ndvi_path})...")
+    safe_date = re.sub(r"[^0-9A-Za-z_.-]", "_", date)
+    clipped, _ = preprocess_rasters({f"ndvi_{safe_date}.tif": ndvi_path}, boundary_path,
+                                    os.path.join(series_dir, "preprocessed"), **preprocess_kwargs)
+    clipped_path = clipped[f"ndvi_{safe_date}.tif"]
+    grid = _grid_from_raster(clipped_path)
+
+    if manifest is None:
+        manifest = {"version": TIME_SERIES_VERSION, "grid": grid, "dates": [], "transitions": [], "generation": 0, "state": None}
+    elif {k: grid[k] for k in ("crs", "transform", "width", "height")} != {k: manifest["grid"][k] for k in ("crs", "transform", "width", "height")}:
+        raise ValueError("Grid tanggal baru berbeda dengan deret waktu (batas atau CRS berubah); bangun ulang deret waktu.")
+
+    shape = (grid["height"], grid["width"])
+    date_index = len(manifest["dates"])
+    generation = manifest["generation"] + 1
+    band_rel = os.path.join("bands", f"{date_index:03d}_{safe_date}.npy")
+    state_rel = {field: os.path.join("state", f"{field}_{generation}.npy") for field in STATE_FIELDS}
+    table_rel = os.path.join("state", f"trajectories_{generation}.npy")
+    os.makedirs(os.path.join(series_dir, "bands"), exist_ok=True)
+    os.makedirs(os.path.join(series_dir, "state"), exist_ok=True)
+
+    # State lama (None pada tanggal pertama) dibaca lewat memmap
+    if manifest["state"] is None:
+        old_state, table = None, np.array([(-1, NODATA_LABEL)], dtype=np.int64)
+    else:
+        old_state = {field: np.load(os.path.join(series_dir, path), mmap_mode="r") for field, path in manifest["state"]["files"].items()}
+        table = np.load(os.path.join(series_dir, manifest["state"]["trajectories"]))
+
+    band = np.lib.format.open_memmap(os.path.join(series_dir, band_rel), mode="w+", dtype=np.uint8, shape=shape)
+    new_state = {field: np.lib.format.open_memmap(os.path.join(series_dir, path), mode="w+", dtype=STATE_FIELDS[field][0], shape=shape)
+                 for field, path in state_rel.items()}
+    table_rows = [tuple(row) for row in table.tolist()]
+    lookup = _trajectory_lookup(table)
+
+    class_counts = np.zeros(256, dtype=np.int64)
+    transition_counts = np.zeros((256, 256), dtype=np.int64)
+    change_histogram = np.zeros(int(NODATA_CHANGES) + 1, dtype=np.int64)
+    change_map_path = os.path.join(series_dir, "analysis", "jumlah_perubahan.tif")
+
+    with rasterio.open(clipped_path) as src, \
+         open_raster_for_write(change_map_path, src.profile, count=1, dtype="uint16", nodata=int(NODATA_CHANGES)) as change_dst:
+        for window in iter_block_windows(src.width, src.height, block_size):
+            rows = slice(int(window.row_off), int(window.row_off + window.height))
+            cols = slice(int(window.col_off), int(window.col_off + window.width))
+            labels = ndvi_to_class(src.read(1, window=window), nodata_value=src.nodata)
+            band[rows, cols] = labels
+            class_counts += count_labels(labels)
+
+            if old_state is None:
+                state = {field: np.full(labels.shape, fill, dtype=dtype) for field, (dtype, fill) in STATE_FIELDS.items()}
+            else:
+                state = {field: np.asarray(array[rows, cols]) for field, array in old_state.items()}
+                transition_counts += count_transitions(state["prev_class"], labels)
+            _, last_class, n_changes, last_change, trajectory = (state[field] for field in STATE_FIELDS)
+
+            # Perubahan dihitung terhadap kelas valid terakhir, sehingga tanggal NoData (mis. awan) dilompati
+            valid = labels != NODATA_LABEL
+            changed = valid & (last_class != NODATA_LABEL) & (labels != last_class)
+            n_changes = n_changes + changed.astype(np.uint16)
+            last_change = np.where(changed, np.uint16(date_index), last_change)
+            last_class = np.where(valid, labels, last_class).astype(np.uint8)
+            trajectory = _extend_trajectories(trajectory, labels, table_rows, lookup)
+
+            new_state["prev_class"][rows, cols] = labels
+            new_state["last_class"][rows, cols] = last_class
+            new_state["n_changes"][rows, cols] = n_changes
+            new_state["last_change"][rows, cols] = last_change
+            new_state["trajectory"][rows, cols] = trajectory
+
+            observed = last_class != NODATA_LABEL
+            change_histogram += np.bincount(n_changes[observed].ravel(), minlength=change_histogram.size)
+            change_dst.write(np.where(observed, n_changes, NODATA_CHANGES).astype(np.uint16), 1, window=window)
+
+    for array in (band, *new_state.values()):
+        array.flush()
+    del band, new_state, old_state
+    table = np.array(table_rows, dtype=np.int64)
+    np.save(os.path.join(series_dir, table_rel), table)
+
+    old_files = [] if manifest["state"] is None else [*manifest["state"]["files"].values(), manifest["state"]["trajectories"]]
+    manifest["dates"].append({"date": date, "source": os.path.abspath(ndvi_path), "signature": signature, "band": band_rel,
+                              "class_counts": class_counts[:max(CLASS_NAMES) + 1].tolist()})
+    if date_index > 0:
+        labels = sorted(CLASS_NAMES)
+        manifest["transitions"].append({"from": manifest["dates"][-2]["date"], "to": date,
+                                        "counts": transition_counts[np.ix_(labels, labels)].tolist()})
+    manifest["change_histogram"] = change_histogram[:int(np.flatnonzero(change_histogram).max(initial=0)) + 1].tolist()
+    manifest["generation"] = generation
+    manifest["state"] = {"files": state_rel, "trajectories": table_rel}
+    # Manifest diganti terakhir: jika run terputus, state lama tetap utuh dan tanggal dapat ditambahkan ulang
+    _save_manifest(series_dir, manifest)
+    for path in old_files:
+        os.remove(os.path.join(series_dir, path))
+
+    write_time_series_reports(series_dir, manifest, top_trajectories=top_trajectories)
+    logger.info(f"✅ Tanggal {date} ditambahkan ({date_index + 1} tanggal dalam deret waktu): {series_dir}")
+    return manifest
+
+def trajectory_counts(series_dir, manifest, block_size=1024):
+    """Jumlah piksel per id trajektori dari state terakhir (tanpa membaca band tanggal mana pun)."""
+    trajectory = np.load(os.path.join(series_dir, manifest["state"]["files"]["trajectory"]), mmap_mode="r")
+    table_size = len(np.load(os.path.join(series_dir, manifest["state"]["trajectories"]), mmap_mode="r"))
+    counts = np.zeros(table_size, dtype=np.int64)
+    for window in iter_block_windows(trajectory.shape[1], trajectory.shape[0], block_size):
+        block = trajectory[int(window.row_off):int(window.row_off + window.height), int(window.col_off):int(window.col_off + window.width)]
+        counts += np.bincount(np.asarray(block).ravel(), minlength=table_size)
+    return counts
+
+def write_time_series_reports(series_dir, manifest, top_trajectories=50):
+    """Tulis statistik kumulatif ke series_dir/analysis: luas per tanggal, transisi berturutan,
+    frekuensi perubahan, dan trajektori terbanyak."""
+    import pandas as pd
+    analysis_dir = os.path.join(series_dir, "analysis")
+    os.makedirs(analysis_dir, exist_ok=True)
+    transform = Affine(*manifest["grid"]["transform"])
+    pixel_area = abs(transform.a * transform.e)
+
+    area_rows = []
+    for entry in manifest["dates"]:
+        stats, _ = area_stats_from_counts(np.array(entry["class_counts"]), pixel_area)
+        area_rows += [{"Tanggal": entry["date"], **row} for row in stats]
+    pd.DataFrame(area_rows).to_csv(os.path.join(analysis_dir, "luas_per_tanggal.csv"), index=False)
+
+    labels = sorted(CLASS_NAMES)
+    transition_rows = [
+        {"Dari Tanggal": entry["from"], "Ke Tanggal": entry["to"], "Dari Kelas": CLASS_NAMES[labels[i]],
+         "Ke Kelas": CLASS_NAMES[labels[j]], "Piksel": count, "Luas (ha)": count * pixel_area / 10000}
+        for entry in manifest["transitions"] for i, row in enumerate(entry["counts"]) for j, count in enumerate(row)
+    ]
+    pd.DataFrame(transition_rows, columns=["Dari Tanggal", "Ke Tanggal", "Dari Kelas", "Ke Kelas", "Piksel", "Luas (ha)"]) \
+        .to_csv(os.path.join(analysis_dir, "transisi_berturut.csv"), index=False)
+
+    pd.DataFrame([{"Jumlah Perubahan": n, "Piksel": count, "Luas (ha)": count * pixel_area / 10000}
+                  for n, count in enumerate(manifest.get("change_histogram", []))]) \
+        .to_csv(os.path.join(analysis_dir, "frekuensi_perubahan.csv"), index=False)
+
+    table = np.load(os.path.join(series_dir, manifest["state"]["trajectories"]))
+    counts = trajectory_counts(series_dir, manifest)
+    trajectory_rows = []
+    for node in np.argsort(counts)[::-1]:
+        if counts[node] == 0 or len(trajectory_rows) >= top_trajectories:
+            break
+        path = _trajectory_labels(table, int(node))
+        if all(label == NODATA_LABEL for label in path):
+            continue  # Piksel di luar batas / tanpa pengamatan
+        trajectory_rows.append({"Trajektori": " → ".join(_class_name(label) for label in path),
+                                "Piksel": int(counts[node]), "Luas (ha)": counts[node] * pixel_area / 10000})
+    pd.DataFrame(trajectory_rows, columns=["Trajektori", "Piksel", "Luas (ha)"]) \
+        .to_csv(os.path.join(analysis_dir, "trajektori.csv"), index=False)
+    logger.info(f"[✔] Statistik deret waktu disimpan ke: {analysis_dir}")
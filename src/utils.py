@@ -1,5 +1,6 @@
 import rasterio
 from rasterio.mask import mask
+from rasterio.windows import Window
 import fiona
 import numpy as np
 import logging
@@ -33,3 +34,13 @@ def check_same_shape(raster1_path, raster2_path):
     """Pastikan dua raster memiliki bentuk yang sama"""
     with rasterio.open(raster1_path) as r1, rasterio.open(raster2_path) as r2:
         return r1.shape == r2.shape
+
+def iter_block_windows(width, height, block_size=None):
+    """Iterasi jendela (Window) berukuran block_size x block_size yang menutupi seluruh raster.
+    Jika block_size None, seluruh raster dikembalikan sebagai satu jendela."""
+    if not block_size:
+        yield Window(0, 0, width, height)
+        return
+    for row_off in range(0, height, block_size):
+        for col_off in range(0, width, block_size):
+            yield Window(col_off, row_off, min(block_size, width - col_off), min(block_size, height - row_off))
@@ -7,6 +7,9 @@ from rasterio.enums import Resampling
 import matplotlib.pyplot as plt
 from matplotlib import colors
 import tempfile
+from rasterio.warp import transform_bounds
+from src.tiles import generate_tiles, MAX_ZOOM
+from src.generate_static_map import change_palette
 
 def generate_color_map():
     return {
@@ -30,29 +33,59 @@ def raster_to_image(raster_path, colormap, output_image_path):
         bounds = src.bounds
         return [[bounds.bottom, bounds.left], [bounds.top, bounds.right]]  # SouthWest, NorthEast
 
-def visualize_raster_interactive(raster_path, output_html="outputs/map.html"):
-    colormap = generate_color_map()
+def class_palette(colormap=None):
+    """Palet RGBA untuk raster kelas (0, 1, 2); baris terakhir (NoData/kode lain) transparan."""
+    colormap = colormap or generate_color_map()
+    palette = np.zeros((max(colormap) + 2, 4), dtype=np.uint8)
+    for code, color in colormap.items():
+        palette[code, :3] = np.round(np.array(colors.to_rgb(color)) * 255)
+        palette[code, 3] = 255
+    return palette
 
-    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as tmp:
-        image_path = tmp.name
+def visualize_raster_interactive(raster_path, output_html="outputs/map.html", kind="class", tiles_dir=None,
+                                 min_zoom=None, max_zoom=None, n_workers=1, executor="thread", opacity=0.7):
+    """Peta interaktif dari piramida tile XYZ lokal (lihat src.tiles.generate_tiles).
 
-    bounds = raster_to_image(raster_path, colormap, image_path)
+    kind="class" untuk raster klasifikasi, kind="change" untuk peta perubahan. Tile disimpan di
+    tiles_dir (default: folder tiles/<nama raster> di samping output_html) dan dimuat folium sebagai
+    TileLayer dengan path relatif, sehingga HTML dan foldernya dapat dipindahkan bersama.
+    """
+    if kind == "class":
+        palette = class_palette()
+        layer_name = "Klasifikasi Lahan"
+    elif kind == "change":
+        palette = change_palette(nodata_alpha=0)
+        layer_name = "Perubahan Tutupan Lahan"
+    else:
+        raise ValueError("kind harus 'class' atau 'change'.")
+
+    html_dir = os.path.dirname(output_html) or "."
+    if tiles_dir is None:
+        tiles_dir = os.path.join(html_dir, "tiles", os.path.splitext(os.path.basename(raster_path))[0])
+    min_zoom, max_zoom = generate_tiles(raster_path, tiles_dir, palette, min_zoom=min_zoom, max_zoom=max_zoom,
+                                        n_workers=n_workers, executor=executor)
+
+    with rasterio.open(raster_path) as src:
+        west, south, east, north = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
 
     # Buat peta interaktif
-    m = folium.Map(location=[(bounds[0][0] + bounds[1][0]) / 2,
-                             (bounds[0][1] + bounds[1][1]) / 2],
-                   zoom_start=12, tiles='OpenStreetMap')
-
-    folium.raster_layers.ImageOverlay(
-        name="Klasifikasi Lahan",
-        image=image_path,
-        bounds=bounds,
-        opacity=0.7,
-        interactive=True,
-        cross_origin=False,
-        zindex=1,
+    m = folium.Map(location=[(south + north) / 2, (west + east) / 2],
+                   zoom_start=min_zoom, tiles='OpenStreetMap')
+
+    tiles_url = os.path.relpath(tiles_dir, html_dir).replace(os.sep, "/") + "/{z}/{x}/{y}.png"
+    folium.TileLayer(
+        tiles=tiles_url,
+        attr=layer_name,
+        name=layer_name,
+        overlay=True,
+        opacity=opacity,
+        max_zoom=MAX_ZOOM,
+        max_native_zoom=max_zoom,
+        minNativeZoom=min_zoom,
     ).add_to(m)
+    m.fit_bounds([[south, west], [north, east]])
 
     folium.LayerControl().add_to(m)
+    os.makedirs(html_dir, exist_ok=True)
     m.save(output_html)
     print(f"✅ Peta disimpan di {output_html}")
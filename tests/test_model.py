@@ -0,0 +1,30 @@
+import joblib
+import numpy as np
+from src.model import iter_training_chunks, train_incremental_forest
+
+def _blocks(n_blocks, block_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_blocks):
+        y = rng.integers(0, 3, block_rows).astype(np.uint8)
+        X = np.clip(y[:, None] * 60 + rng.normal(60, 30, (block_rows, 3)), 0, 255).astype(np.uint8)
+        yield X, y
+
+def test_iter_training_chunks_splits_blocks_larger_than_chunk_rows():
+    blocks = list(_blocks(3, 1000))
+    chunks = list(iter_training_chunks(iter(blocks), 400))
+
+    assert [len(y) for _, y in chunks] == [400] * 7 + [200]
+    assert np.array_equal(np.concatenate([X for X, _ in chunks]), np.concatenate([X for X, _ in blocks]))
+    assert np.array_equal(np.concatenate([y for _, y in chunks]), np.concatenate([y for _, y in blocks]))
+
+def test_incremental_forest_tree_count_follows_chunk_rows(tmp_path):
+    model_path = str(tmp_path / "random_forest.pkl")
+    # 2 blok x 1250 baris dalam potongan 500 baris -> 5 potongan, masing-masing menambah 2 pohon
+    make_chunks = lambda: iter_training_chunks(_blocks(2, 1250), 500)
+    train_incremental_forest(make_chunks, model_path, trees_per_chunk=2)
+
+    clf = joblib.load(model_path)
+    n_chunks = len(list(make_chunks()))
+    assert n_chunks == 5
+    assert len(clf.estimators_) == n_chunks * 2
+    assert list(clf.classes_) == [0, 1, 2]